@@ -0,0 +1,74 @@
+"""
+Measure the import time of dlpipe and accident_predictor modules, each in a fresh python process, and check which of
+them load TensorFlow. Data only tools (upload, sampling, analysis, readers) must not load it.
+Usage: python benchmark_imports.py [<nb_runs>]
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NB_RUNS = 5
+
+# (module, True if it may load TensorFlow)
+MODULES = [
+    ("keras", True),  # reference: cost of loading keras and TensorFlow
+    ("dlpipe.utils", False),
+    ("dlpipe.data_reader.mongodb", False),
+    ("dlpipe.data_reader.array_reader", False),
+    ("dlpipe.trainer", False),
+    ("dlpipe.callbacks", False),
+    ("dlpipe.numpy_engine", False),
+    ("accident_predictor.processors", False),
+    ("accident_predictor.data.upload.data_encoder", False),
+    ("accident_predictor.data.upload.mongo_uploader", False),
+    ("accident_predictor.data.upload.sampler", False),
+    ("accident_predictor.data.analysis.data_distribution", False),
+    ("accident_predictor.score_csv", False),
+    ("accident_predictor.train", True),
+]
+
+_MEASURE = """
+import sys, time
+start = time.perf_counter()
+import {0}
+print(time.perf_counter() - start, "tensorflow" in sys.modules, "keras" in sys.modules)
+"""
+
+
+def measure_import(module: str) -> (float, bool, bool):
+    """
+    :return: import time in seconds, if tensorflow and keras were loaded
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    output = subprocess.run([sys.executable, "-c", _MEASURE.format(module)], cwd=ROOT_DIR, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    seconds, tf_loaded, keras_loaded = output.stdout.strip().splitlines()[-1].split()
+    return float(seconds), tf_loaded == "True", keras_loaded == "True"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        NB_RUNS = int(sys.argv[1])
+
+    failed = []
+    print("{0:<52}{1:>12}{2:>12}{3:>8}".format("module", "median ms", "min ms", "TF"))
+    for module, may_load_tf in MODULES:
+        try:
+            runs = [measure_import(module) for _ in range(NB_RUNS)]
+        except subprocess.CalledProcessError as err:
+            print("{0:<52}{1:>12}".format(module, "error"))
+            print(err.stderr.strip().splitlines()[-1])
+            continue
+        timings = [r[0] * 1000 for r in runs]
+        tf_loaded = runs[0][1] or runs[0][2]
+        print("{0:<52}{1:>12.1f}{2:>12.1f}{3:>8}".format(module, statistics.median(timings), min(timings),
+                                                         "yes" if tf_loaded else "no"))
+        if tf_loaded and not may_load_tf:
+            failed.append(module)
+
+    if len(failed) > 0:
+        print("TensorFlow is loaded by: " + ", ".join(failed))
+        sys.exit(1)
@@ -0,0 +1,139 @@
+"""
+Compress a trained experiment (teacher) into smaller models:
+  - pruning: the weakest units of each hidden layer are pruned and removed, the smaller model is fine tuned (the
+    weights zeroed by magnitude pruning are not masked, only the units that lost all their weights are removed)
+  - distillation: a small MLP is trained on the class distributions of the teacher mixed with the true labels
+Each compressed model is saved as experiment linked to the teacher, its summary compares accuracy, latency and size
+with the teacher. The comparison uses the validation records of the teacher (config "validation_ids", saved by
+train.py), the compressed models are trained on the other records. Older experiments do not store their validation
+records, a seeded split of all records is used then and the summary is marked with "holdout": "seen_by_teacher".
+Usage: python compress.py <exp_id> [<weights_index>]
+"""
+import sys
+import numpy as np
+from keras import optimizers
+from dlpipe.checkpoint import get_checkpoint, load_checkpoint_model
+from dlpipe.compression import dense_layers, prune_units, magnitude_prune, remove_dead_units, build_dense_model, \
+    soft_labels, train_on_arrays, measure_model, compare_to_teacher
+from dlpipe.cross_validation import load_arrays
+from dlpipe.data_reader.mongodb import MongoDBConnect, MongoDBActions
+from dlpipe.callbacks import SaveExpMongoDB, EarlyStopping
+from dlpipe.utils import DLPipeLogger
+from accident_predictor.metrics import class_metrics, get_custom_objects
+from accident_predictor.processors import PreProcessData
+from accident_predictor.train import create_model
+
+
+# fraction of the hidden units that are removed
+PRUNE_FRACTIONS = [0.5, 0.75, 0.9]
+# fraction of the remaining weights that are set to zero before the dead units are removed
+PRUNE_SPARSITY = 0.5
+FINE_TUNE_EPOCHS = 5
+STUDENT_UNITS = (64, 32)
+STUDENT_DROPOUT = (0.1, 0.1)
+TEMPERATURE = 2.0
+ALPHA = 0.7  # weight of the teacher distribution in the training targets of the student
+DISTILL_EPOCHS = 30
+BATCH_SIZE = 64
+LEARNING_RATE = 0.0003
+SEED = 42
+
+
+def compile_model(model, lr: float = LEARNING_RATE):
+    opt = optimizers.RMSprop(lr=lr, decay=0.5e-6)
+    model.compile(optimizer=opt, loss='categorical_crossentropy', metrics=["accuracy"] + class_metrics(3))
+    return model
+
+
+def split_data(collection, teacher_config: dict):
+    """
+    :param teacher_config: config of the teacher experiment
+    :return: x, y, train and validation indices for the compressed models, x and y of the hold out records, name of
+             the hold out ("teacher_validation" or "seen_by_teacher")
+    """
+    processors = [PreProcessData()]
+    validation_ids = (teacher_config or {}).get("validation_ids")
+    if validation_ids:
+        x_holdout, y_holdout = load_arrays(collection, processors, {"_id": {"$in": validation_ids}})
+        # 85% training, 15% validation of the records the teacher was trained on
+        x, y = load_arrays(collection, processors, {"_id": {"$nin": validation_ids}})
+        permutation = np.random.RandomState(SEED).permutation(len(x))
+        train_idx, val_idx = np.split(permutation, [int(len(x) * 0.85)])
+        return x, y, train_idx, val_idx, x_holdout, y_holdout, "teacher_validation"
+    # 70% training, 15% validation, 15% held out from the compressed models only
+    x, y = load_arrays(collection, processors)
+    permutation = np.random.RandomState(SEED).permutation(len(x))
+    train_idx, val_idx, holdout_idx = np.split(permutation, [int(len(x) * 0.7), int(len(x) * 0.85)])
+    return x, y, train_idx, val_idx, x[holdout_idx], y[holdout_idx], "seen_by_teacher"
+
+
+def print_summary(name: str, summary: dict):
+    print("{0}:\taccuracy: {1:.4f} ({2:+.4f})\tlatency: {3:.2f}ms (x{4:.1f})\tparams: {5} ({6:.1%})".format(
+        name, summary["model"]["accuracy"], summary["accuracy_delta"], summary["model"]["latency_ms"],
+        summary["speedup"], summary["model"]["nb_params"], summary["params_ratio"]))
+
+
+if __name__ == "__main__":
+    DLPipeLogger.remove_file_logger()
+
+    EXP_ID = "5bac50ca32b9011693a63274"
+    INDEX = None
+    if len(sys.argv) > 1:
+        EXP_ID = sys.argv[1]
+    if len(sys.argv) > 2:
+        INDEX = int(sys.argv[2])
+
+    MongoDBActions.add_config('./connections.ini')
+    model_db = MongoDBConnect.get_db("localhost_mongo_db", "models")
+    collection = MongoDBConnect.get_collection("localhost_mongo_db", "accident", "train")
+
+    checkpoint = get_checkpoint(model_db, EXP_ID, INDEX)
+    teacher = load_checkpoint_model(model_db, checkpoint, custom_objects=get_custom_objects(), compile=False)
+
+    x, y, train_idx, val_idx, x_holdout, y_holdout, HOLDOUT = split_data(collection, checkpoint["config"])
+    if HOLDOUT == "seen_by_teacher":
+        print("The teacher has no validation_ids in its config, it is compared on records it was trained on")
+    teacher_stats = measure_model(teacher, x_holdout, y_holdout)
+    print("Teacher:\taccuracy: {0:.4f}\tlatency: {1:.2f}ms\tparams: {2}".format(
+        teacher_stats["accuracy"], teacher_stats["latency_ms"], teacher_stats["nb_params"]))
+
+    base_config = {"parent_weights_index": checkpoint["index"], "batch_size": BATCH_SIZE, "lr": LEARNING_RATE,
+                   "seed": SEED, "holdout": HOLDOUT, "nb_holdout_docs": len(x_holdout)}
+
+    # pruning with structured removal of dead units, then fine tuning of the smaller model
+    teacher_layers = dense_layers(teacher)
+    for fraction in PRUNE_FRACTIONS:
+        layers = remove_dead_units(magnitude_prune(prune_units(teacher_layers, fraction), PRUNE_SPARSITY))
+        units = [int(layer["kernel"].shape[1]) for layer in layers]
+        model = compile_model(build_dense_model(layers, dropout=(0.2,) * (len(layers) - 1)))
+        mongo_db_cb = SaveExpMongoDB(model_db, "accident_v1.0_pruned", model.get_config(),
+                                     parent_id=checkpoint["exp_id"], config=dict(base_config, **{
+                                         "type": "pruning",
+                                         "unit_fraction": fraction,
+                                         "sparsity": PRUNE_SPARSITY,
+                                         "units": units
+                                     }))
+        early_stopping = EarlyStopping(monitor="loss", phase="validation", min_delta=0.001, patience=2)
+        train_on_arrays(model, x, y, train_idx, val_idx, FINE_TUNE_EPOCHS, BATCH_SIZE, [early_stopping, mongo_db_cb])
+        summary = compare_to_teacher(teacher_stats, measure_model(model, x_holdout, y_holdout))
+        summary["holdout"] = HOLDOUT
+        mongo_db_cb.set_summary(summary)
+        print_summary("Pruned {0:.0%} {1}".format(fraction, units), summary)
+
+    # distillation into a small student trained on the soft labels of the teacher
+    targets = ALPHA * soft_labels(teacher, x, TEMPERATURE) + (1 - ALPHA) * y
+    student = create_model(units=STUDENT_UNITS, dropout=STUDENT_DROPOUT, lr=LEARNING_RATE)
+    mongo_db_cb = SaveExpMongoDB(model_db, "accident_v1.0_distilled", student.get_config(),
+                                 parent_id=checkpoint["exp_id"], config=dict(base_config, **{
+                                     "type": "distillation",
+                                     "units": list(STUDENT_UNITS),
+                                     "dropout": list(STUDENT_DROPOUT),
+                                     "temperature": TEMPERATURE,
+                                     "alpha": ALPHA
+                                 }))
+    early_stopping = EarlyStopping(monitor="loss", phase="validation", min_delta=0.001, patience=5)
+    train_on_arrays(student, x, targets, train_idx, val_idx, DISTILL_EPOCHS, BATCH_SIZE, [early_stopping, mongo_db_cb])
+    summary = compare_to_teacher(teacher_stats, measure_model(student, x_holdout, y_holdout))
+    summary["holdout"] = HOLDOUT
+    mongo_db_cb.set_summary(summary)
+    print_summary("Distilled {0}".format(list(STUDENT_UNITS)), summary)
@@ -0,0 +1,46 @@
+"""
+5-fold cross validation of the model on the training collection. The data is loaded and encoded only once and
+shared with the worker processes which train one fold each.
+"""
+from dlpipe.data_reader.mongodb import MongoDBConnect, MongoDBActions
+from dlpipe.cross_validation import CrossValidationRunner, load_arrays
+from dlpipe.callbacks import EarlyStopping
+from dlpipe.utils import DLPipeLogger
+from accident_predictor.processors import PreProcessData
+from accident_predictor.train import create_model
+
+
+CONFIG_FILE = "./connections.ini"
+K = 5
+
+
+def build_model():
+    return create_model()
+
+
+def build_callbacks(model):
+    return [EarlyStopping(monitor="loss", phase="validation", min_delta=0.001, patience=5)]
+
+
+if __name__ == "__main__":
+    DLPipeLogger.remove_file_logger()
+    MongoDBActions.add_config(CONFIG_FILE)
+
+    collection = MongoDBConnect.get_collection("localhost_mongo_db", "accident", "train")
+    x, y = load_arrays(collection, [PreProcessData()])
+
+    runner = CrossValidationRunner(
+        build_model,
+        x, y,
+        k=K,
+        config_file=CONFIG_FILE,
+        connection="localhost_mongo_db",
+        name="accident_v1.0_cv",
+        epochs=30,
+        callbacks_fn=build_callbacks,
+        intra_op_threads=2
+    )
+    summary = runner.run()
+
+    for name in sorted(summary["mean"].keys()):
+        print("{0}: {1:.4f} +/- {2:.4f}".format(name, summary["mean"][name], summary["std"][name]))
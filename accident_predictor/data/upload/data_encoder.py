@@ -12,6 +12,17 @@ def sin_cos_representation(data, value_range):
     return sin_value, cos_value
 
 
+def one_hot(index, nb_classes):
+    """
+    :param index: index of the class
+    :param nb_classes: number of classes
+    :return: 1-hot array (list of ints) encoding the class
+    """
+    encoded = [0] * nb_classes
+    encoded[index] = 1
+    return encoded
+
+
 def time_encoder(raw_time):
     """
     Convert the raw_time format from the csv file (0-2400) converted to minutes in a day (24h * 60m)
@@ -235,3 +246,62 @@ def road_encoder(road_type_raw):
             return class_array
     raise ValueError("ENCODING ERROR: Unknown road type " + road_type_raw)
 
+
+def encode_row(data_dict):
+    """
+    Encode one accident record as it is stored in the MongoDB (without the accident_severity)
+    :param data_dict: dict mapping the field names of the csv file to the raw (string) values, the id field is
+                      expected as "row_id" and is optional
+    :return: encoded record as dict
+    """
+    # date and time are "cycle values" thus encode them to sin and cos components
+    date_value, date_sin, date_cos = date_encoder(data_dict["Unfalldatum"])
+    time_minutes, time_sin, time_cos = time_encoder(data_dict["Zeit (24h)"])
+
+    db_dict = {}
+    if "row_id" in data_dict:
+        db_dict["row_id"] = int(data_dict["row_id"])
+    db_dict.update({
+        "date": {
+            "value": date_value,
+            "sin": date_sin,
+            "cos": date_cos
+        },
+        "age": int(data_dict["Alter"]),
+        "class": {
+            "value": data_dict["Unfallklasse"],
+            "encoded": class_encoder(data_dict["Unfallklasse"])
+        },
+        "light": {
+            "value": data_dict["Lichtverhältnisse"],
+            "encoded": light_encoder(data_dict["Lichtverhältnisse"])
+        },
+        "nr_person_hurt": min(3, int(data_dict["Verletzte Personen"])),
+        "nr_vehicles": min(4, int(data_dict["Anzahl Fahrzeuge"])),
+        "ground_condition": {
+            "value": data_dict["Bodenbeschaffenheit"],
+            "encoded": ground_encoder(data_dict["Bodenbeschaffenheit"])
+        },
+        "gender": {
+            "value": data_dict["Geschlecht"],
+            "encoded": gender_encoder(data_dict["Geschlecht"])
+        },
+        "time": {
+            "value": int(time_minutes),
+            "cos": time_cos,
+            "sin": time_sin
+        },
+        "vehicle_type": {
+            "value": data_dict["Fahrzeugtyp"],
+            "encoded": vehicle_encoder(data_dict["Fahrzeugtyp"])
+        },
+        "weather": {
+            "value": data_dict["Wetterlage"],
+            "encoded": weather_encoder(data_dict["Wetterlage"])
+        },
+        "road_type": {
+            "value": data_dict["Strassenklasse"],
+            "encoded": road_encoder(data_dict["Strassenklasse"])
+        }
+    })
+    return db_dict
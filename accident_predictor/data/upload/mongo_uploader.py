@@ -4,9 +4,7 @@ Parsing the data from the csv files, encode the data in machine friendly formats
 import configparser
 from dlpipe.data_reader.mongodb import MongoDBConnect
 import csv
-from accident_predictor.data.upload.data_encoder import \
-    date_encoder, class_encoder, light_encoder, ground_encoder, \
-    gender_encoder, vehicle_encoder, weather_encoder, road_encoder, time_encoder
+from accident_predictor.data.upload.data_encoder import encode_row
 from dlpipe.utils import DLPipeLogger
 
 
@@ -49,54 +47,7 @@ if __name__ == "__main__":
                         for i, field_name in enumerate(fields):
                             data_dict[field_name] = row_data[i]
 
-                        # date and time are "cycle values" thus encode them to sin and cos components
-                        date_value, date_sin, date_cos = date_encoder(data_dict["Unfalldatum"])
-                        time_minutes, time_sin, time_cos = time_encoder(data_dict["Zeit (24h)"])
-
-                        db_dict = {
-                            "row_id": int(data_dict["row_id"]),
-                            "date": {
-                                "value": date_value,
-                                "sin": date_sin,
-                                "cos": date_cos
-                            },
-                            "age": int(data_dict["Alter"]),
-                            "class": {
-                                "value": data_dict["Unfallklasse"],
-                                "encoded": class_encoder(data_dict["Unfallklasse"])
-                            },
-                            "light": {
-                                "value": data_dict["Lichtverhältnisse"],
-                                "encoded": light_encoder(data_dict["Lichtverhältnisse"])
-                            },
-                            "nr_person_hurt": min(3, int(data_dict["Verletzte Personen"])),
-                            "nr_vehicles": min(4, int(data_dict["Anzahl Fahrzeuge"])),
-                            "ground_condition": {
-                                "value": data_dict["Bodenbeschaffenheit"],
-                                "encoded": ground_encoder(data_dict["Bodenbeschaffenheit"])
-                            },
-                            "gender": {
-                                "value": data_dict["Geschlecht"],
-                                "encoded": gender_encoder(data_dict["Geschlecht"])
-                            },
-                            "time": {
-                                "value": int(time_minutes),
-                                "cos": time_cos,
-                                "sin": time_sin
-                            },
-                            "vehicle_type": {
-                                "value": data_dict["Fahrzeugtyp"],
-                                "encoded": vehicle_encoder(data_dict["Fahrzeugtyp"])
-                            },
-                            "weather": {
-                                "value": data_dict["Wetterlage"],
-                                "encoded": weather_encoder(data_dict["Wetterlage"])
-                            },
-                            "road_type": {
-                                "value": data_dict["Strassenklasse"],
-                                "encoded": road_encoder(data_dict["Strassenklasse"])
-                            }
-                        }
+                        db_dict = encode_row(data_dict)
                         if mode == "train":
                             # subtract 1 as the severities are originally [1,2,3] to map it to [0,1,2]
                             db_dict["accident_severity"] = int(data_dict["Unfallschwere"]) - 1
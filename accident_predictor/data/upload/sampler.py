@@ -5,9 +5,8 @@ The sampler module uses the distance data calculated in "calc_class_distance.py"
 import configparser
 from dlpipe.data_reader.mongodb import MongoDBConnect
 from dlpipe.utils import DLPipeLogger
-from accident_predictor.data.upload.data_encoder import sin_cos_representation
+from accident_predictor.data.upload.data_encoder import sin_cos_representation, one_hot
 from accident_predictor.data.upload.calc_class_distances import upload_distances
-from keras.utils.np_utils import to_categorical
 import numpy as np
 import copy
 
@@ -75,7 +74,7 @@ def generate_synth_data(col, ids, insert=True):
         for new_index in range(0, len(org_class["encoded"])):
             row["class"] = {
                 "value": "generated",
-                "encoded": to_categorical(new_index, num_classes=len(org_class["encoded"])).astype(int).tolist()
+                "encoded": one_hot(new_index, len(org_class["encoded"]))
             }
             if insert:
                 del row["_id"]
@@ -87,7 +86,7 @@ def generate_synth_data(col, ids, insert=True):
         for new_index in range(0, len(org_class["encoded"])):
             row["weather"] = {
                 "value": "generated",
-                "encoded": to_categorical(new_index, num_classes=len(org_class["encoded"])).astype(int).tolist()
+                "encoded": one_hot(new_index, len(org_class["encoded"]))
             }
             if insert:
                 del row["_id"]
@@ -99,7 +98,7 @@ def generate_synth_data(col, ids, insert=True):
         for new_index in range(0, len(org_class["encoded"])):
             row["gender"] = {
                 "value": "generated",
-                "encoded": to_categorical(new_index, num_classes=len(org_class["encoded"])).astype(int).tolist()
+                "encoded": one_hot(new_index, len(org_class["encoded"]))
             }
             if insert:
                 del row["_id"]
@@ -111,7 +110,7 @@ def generate_synth_data(col, ids, insert=True):
         for new_index in range(0, len(org_class["encoded"]) - 1):
             row["vehicle_type"] = {
                 "value": "generated",
-                "encoded": to_categorical(new_index, num_classes=len(org_class["encoded"])).astype(int).tolist()
+                "encoded": one_hot(new_index, len(org_class["encoded"]))
             }
             if insert:
                 del row["_id"]
@@ -123,7 +122,7 @@ def generate_synth_data(col, ids, insert=True):
         for new_index in range(0, len(org_class["encoded"]) - 1):
             row["road_type"] = {
                 "value": "generated",
-                "encoded": to_categorical(new_index, num_classes=len(org_class["encoded"])).astype(int).tolist()
+                "encoded": one_hot(new_index, len(org_class["encoded"]))
             }
             if insert:
                 del row["_id"]
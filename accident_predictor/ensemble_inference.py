@@ -0,0 +1,74 @@
+"""
+Predict the test data with an ensemble of checkpoints of one or several experiments. Each chunk of documents is
+encoded once and predicted by all members in one stacked forward pass.
+Usage: python ensemble_inference.py <exp_id>[,<exp_id>...] [<last|best|index,index,...>] [<k>] [<mean|vote>]
+"""
+import configparser
+import csv
+import sys
+from dlpipe.data_reader.mongodb import MongoDBConnect
+from dlpipe.ensemble import Ensemble, select_checkpoints
+from dlpipe.prediction_cache import PredictionCache
+from dlpipe.utils import DLPipeLogger
+from accident_predictor.inference import predict_chunks
+from accident_predictor.processors import PreProcessData
+
+
+if __name__ == "__main__":
+    DLPipeLogger.remove_file_logger()
+
+    EXP_IDS = ["5bac50ca32b9011693a63274"]
+    # "last": the k latest weights, "best": the weights of the k epochs with the lowest validation loss, or a comma
+    # separated list of weight indices
+    STRATEGY = "last"
+    K = 3
+    METHOD = "mean"
+
+    if len(sys.argv) > 1:
+        EXP_IDS = sys.argv[1].split(",")
+    if len(sys.argv) > 2:
+        STRATEGY = sys.argv[2]
+    if len(sys.argv) > 3:
+        K = int(sys.argv[3])
+    if len(sys.argv) > 4:
+        METHOD = sys.argv[4]
+
+    cp = configparser.ConfigParser()
+    if len(cp.read('./connections.ini')) == 0:
+        raise ValueError("Config File could not be loaded, please check the correct path!")
+    MongoDBConnect.add_connections_from_config(cp)
+    db = MongoDBConnect.get_db("localhost_mongo_db", "models")
+    col_test = MongoDBConnect.get_collection("localhost_mongo_db", "accident", "test")
+
+    checkpoints = []
+    for exp_id in EXP_IDS:
+        if STRATEGY in ["last", "best"]:
+            checkpoints += select_checkpoints(db, exp_id, strategy=STRATEGY, k=K)
+        else:
+            indices = [int(i) for i in STRATEGY.split(",")]
+            checkpoints += select_checkpoints(db, exp_id, strategy="indices", indices=indices)
+    print("Ensemble members: " + ", ".join("{0}:{1}".format(exp_id, index) for exp_id, index in checkpoints))
+
+    ensemble = Ensemble.from_checkpoints(db, checkpoints, method=METHOD)
+    if not ensemble.is_stacked:
+        print("Members have different architectures, they are predicted one after another")
+
+    model_key = METHOD + "|" + ",".join("{0}:{1}".format(exp_id, index) for exp_id, index in checkpoints)
+    cache = PredictionCache(model_key, path="prediction_cache_ensemble.npz")
+
+    csv_data = []
+    class_counter = [0, 0, 0]
+    for docs, class_predictions, _, _ in predict_chunks(ensemble, col_test.find(), [PreProcessData()], cache=cache):
+        for doc, class_prediction in zip(docs, class_predictions):
+            csv_data.append([doc["row_id"], int(class_prediction)+1])
+            class_counter[int(class_prediction)] += 1
+    cache.save()
+
+    print("Predicted classes counter:")
+    print(class_counter)
+
+    with open("result_ensemble_" + EXP_IDS[0] + ".csv", "w") as csv_file:
+        writer = csv.writer(csv_file, delimiter=",")
+        writer.writerow(['Unfall_ID', 'Unfallschwere'])
+        for csv_row_data in csv_data:
+            writer.writerow(csv_row_data)
@@ -0,0 +1,70 @@
+"""
+Evaluate a stored checkpoint on labelled records: confusion matrix, precision/recall/F1 per class, calibration and
+the most confident wrong predictions. Reports are cached, evaluating the same checkpoint on the same data again
+returns instantly. The records of the training collection are selected by <data>:
+  - validation (default): the validation records of the experiment (config "validation_ids", saved by train.py)
+  - new: the records inserted after the experiment's watermark (see dlpipe.incremental)
+  - all: all records, including the ones the model was trained on
+Usage: python evaluate.py <exp_id> [<weights_index|best>] [<validation|new|all>]
+"""
+import sys
+from dlpipe.checkpoint import get_checkpoint
+from dlpipe.data_reader.mongodb import MongoDBConnect, MongoDBActions
+from dlpipe.evaluation import Evaluator
+from dlpipe.incremental import get_watermark, new_data_query
+from dlpipe.utils import DLPipeLogger
+from accident_predictor.metrics import get_custom_objects
+from accident_predictor.processors import PreProcessData
+
+
+def create_query(model_db, exp_id, index: int = None, data: str = "validation"):
+    """
+    :return: filter for the records of the training collection that are evaluated (None for all)
+    """
+    if data == "all":
+        return None
+    if data == "new":
+        return new_data_query(get_watermark(model_db, exp_id))
+    if data != "validation":
+        raise ValueError("data must be any of ['validation', 'new', 'all']")
+    validation_ids = (get_checkpoint(model_db, exp_id, index)["config"] or {}).get("validation_ids")
+    if not validation_ids:
+        raise ValueError("Experiment {0} has no validation_ids in its config, use 'new' or 'all'".format(exp_id))
+    return {"_id": {"$in": validation_ids}}
+
+
+if __name__ == "__main__":
+    DLPipeLogger.remove_file_logger()
+
+    EXP_ID = "5bac50ca32b9011693a63274"
+    INDEX = None
+    DATA = "validation"
+    if len(sys.argv) > 1:
+        EXP_ID = sys.argv[1]
+    if len(sys.argv) > 2 and sys.argv[2] != "best":
+        INDEX = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        DATA = sys.argv[3]
+
+    MongoDBActions.add_config('./connections.ini')
+    model_db = MongoDBConnect.get_db("localhost_mongo_db", "models")
+    collection = MongoDBConnect.get_collection("localhost_mongo_db", "accident", "train")
+
+    evaluator = Evaluator(model_db, custom_objects=get_custom_objects())
+    report = evaluator.evaluate(EXP_ID, collection, [PreProcessData()], index=INDEX,
+                                query=create_query(model_db, EXP_ID, INDEX, DATA))
+
+    print("Samples: {0}\tAccuracy: {1:.4f}\tECE: {2:.4f}".format(
+        report["nb_samples"], report["accuracy"], report["calibration"]["ece"]))
+    print("Confusion matrix (rows: true class, columns: predicted class):")
+    for row in report["confusion_matrix"]:
+        print("\t".join(str(count) for count in row))
+    classes = report["classes"]
+    for class_id in range(len(classes["precision"])):
+        print("Class {0}\tprecision: {1:.4f}\trecall: {2:.4f}\tf1: {3:.4f}\tsupport: {4}".format(
+            class_id, classes["precision"][class_id], classes["recall"][class_id], classes["f1"][class_id],
+            classes["support"][class_id]))
+    print("Most confident wrong predictions:")
+    for confusion in report["top_confusions"]:
+        print("{0}\ttrue: {1}\tpredicted: {2}\tconfidence: {3:.4f}".format(
+            confusion["id"], confusion["true"], confusion["predicted"], confusion["confidence"]))
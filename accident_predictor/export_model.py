@@ -0,0 +1,54 @@
+"""
+Export a stored checkpoint to a .npz file for the NumPy inference engine and check that its predictions match the
+keras model on the test data.
+Usage: python export_model.py <exp_id> [<weights_index>] [<dtype: float32|float16|int8>]
+"""
+import configparser
+import sys
+import time
+from dlpipe.data_reader.mongodb import MongoDBConnect
+from dlpipe.evaluation import encode_documents
+from dlpipe.export import export_checkpoint, parity_check
+from dlpipe.model_registry import ModelRegistry
+from dlpipe.numpy_engine import NumpyModel
+from dlpipe.utils import DLPipeLogger
+from accident_predictor.metrics import get_custom_objects
+from accident_predictor.processors import PreProcessData
+
+
+NB_PARITY_SAMPLES = 2000
+
+
+if __name__ == "__main__":
+    DLPipeLogger.remove_file_logger()
+
+    EXP_ID = "5bac50ca32b9011693a63274"
+    INDEX = None
+    DTYPE = "float32"
+    if len(sys.argv) > 1:
+        EXP_ID = sys.argv[1]
+    if len(sys.argv) > 2:
+        INDEX = None if sys.argv[2] == "best" else int(sys.argv[2])
+    if len(sys.argv) > 3:
+        DTYPE = sys.argv[3]
+
+    cp = configparser.ConfigParser()
+    if len(cp.read('./connections.ini')) == 0:
+        raise ValueError("Config File could not be loaded, please check the correct path!")
+    MongoDBConnect.add_connections_from_config(cp)
+    db = MongoDBConnect.get_db("localhost_mongo_db", "models")
+    col_test = MongoDBConnect.get_collection("localhost_mongo_db", "accident", "test")
+
+    file_name = "model_{0}_{1}.npz".format(EXP_ID, DTYPE)
+    spec = export_checkpoint(db, EXP_ID, file_name, index=INDEX, dtype=DTYPE)
+    print("Exported to " + file_name + ": " + str(spec["meta"]))
+
+    start = time.perf_counter()
+    numpy_model = NumpyModel.load(file_name)
+    print("NumPy model loaded in {0:.1f}ms".format((time.perf_counter() - start) * 1000))
+
+    keras_model = ModelRegistry(db, custom_objects=get_custom_objects()).get(EXP_ID, spec["meta"]["weights_index"])
+    x, _ = encode_documents(list(col_test.find().limit(NB_PARITY_SAMPLES)), [PreProcessData()])
+    parity = parity_check(keras_model, numpy_model, x)
+    print("Parity on {0} samples => max abs diff: {1:.2e}\tmean abs diff: {2:.2e}\tclass agreement: {3:.4f}".format(
+        parity["nb_samples"], parity["max_abs_diff"], parity["mean_abs_diff"], parity["class_agreement"]))
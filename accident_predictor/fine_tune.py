@@ -0,0 +1,69 @@
+"""
+Fine tune a trained experiment on the accident records that were uploaded after it was trained instead of training
+from scratch. A sample of the old records is replayed to not forget them. The new experiment is linked to the one
+it is fine tuned from and saves the data watermark, so it can be fine tuned again later.
+Usage: python fine_tune.py <exp_id> [<weights_index>]
+"""
+import sys
+from functools import partial
+from dlpipe.autotune import apply_learning_rate
+from dlpipe.checkpoint import get_checkpoint, load_checkpoint_model
+from dlpipe.incremental import get_watermark, create_incremental_reader
+from dlpipe.data_reader.mongodb import MongoDBConnect, MongoDBActions
+from dlpipe.trainer import Trainer
+from dlpipe.callbacks import SaveExpMongoDB, EarlyStopping
+from dlpipe.utils import DLPipeLogger
+from accident_predictor.metrics import get_custom_objects
+from accident_predictor.train import create_data_reader
+
+
+EPOCHS = 5
+BATCH_SIZE = 32
+LEARNING_RATE = 0.00003
+REPLAY_SIZE = 2000
+REPLAY_WEIGHT = 0.3
+
+
+if __name__ == "__main__":
+    DLPipeLogger.remove_file_logger()
+
+    # ID of the experiment to fine tune and the index of its weights, if None the best or latest weights are used
+    EXP_ID = "5bac50ca32b9011693a63274"
+    INDEX = None
+    if len(sys.argv) > 1:
+        EXP_ID = sys.argv[1]
+    if len(sys.argv) > 2:
+        INDEX = int(sys.argv[2])
+
+    MongoDBActions.add_config('./connections.ini')
+    model_db = MongoDBConnect.get_db("localhost_mongo_db", "models")
+    collection = MongoDBConnect.get_collection("localhost_mongo_db", "accident", "train")
+
+    # warm start from the stored weights (and optimizer state)
+    checkpoint = get_checkpoint(model_db, EXP_ID, INDEX)
+    model = load_checkpoint_model(model_db, checkpoint, custom_objects=get_custom_objects())
+    apply_learning_rate(model, LEARNING_RATE)
+
+    # only the records uploaded after the parent experiment, mixed with a replay sample of the old records
+    watermark = get_watermark(model_db, EXP_ID)
+    reader, data_info = create_incremental_reader(partial(create_data_reader, collection, BATCH_SIZE), collection,
+                                                  watermark, replay_size=REPLAY_SIZE, replay_weight=REPLAY_WEIGHT)
+
+    mongo_db_cb = SaveExpMongoDB(model_db, "accident_v1.0_fine_tuned", model.get_config(),
+                                 parent_id=checkpoint["exp_id"], config={
+                                     "type": "fine_tune",
+                                     "parent_weights_index": checkpoint["index"],
+                                     "batch_size": BATCH_SIZE,
+                                     "lr": LEARNING_RATE,
+                                     "replay_weight": REPLAY_WEIGHT,
+                                     **data_info
+                                 })
+    early_stopping = EarlyStopping(monitor="loss", phase="validation", min_delta=0.001, patience=2)
+    trainer = Trainer(model=model, data_reader=reader, callbacks=[early_stopping, mongo_db_cb])
+    trainer.train(epochs=EPOCHS)
+    if hasattr(reader, "close"):
+        # stop the prefetch threads of the interleaved reader (only created if there is replay data)
+        reader.close()
+
+    print("Experiment ID: " + str(mongo_db_cb.get_exp_id()))
+    print("")
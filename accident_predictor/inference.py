@@ -1,12 +1,12 @@
 import configparser
 from dlpipe.data_reader.mongodb import MongoDBConnect
-from accident_predictor.metrics import single_class_precision, single_class_recall
+from dlpipe.evaluation import encode_documents
+from dlpipe.checkpoint import get_checkpoint
+from dlpipe.model_registry import ModelRegistry
+from dlpipe.prediction_cache import PredictionCache
+from accident_predictor.metrics import get_custom_objects
 from accident_predictor.processors import PreProcessData
 from dlpipe.utils import DLPipeLogger
-from bson import ObjectId
-from keras.models import load_model
-import gridfs
-import os
 import numpy as np
 import csv
 import sys
@@ -34,6 +34,52 @@ def get_class_distribution(result):
     return max_class, normalized, min_diff
 
 
+def get_class_distributions(results: np.ndarray):
+    """
+    Vectorised get_class_distribution() for a batch of prediction results
+    :param results: prediction results [n, nb_classes]
+    :return: predicted classes [n], normalized class histograms [n, nb_classes], differences to next best class [n]
+    """
+    normalized = results / results.sum(axis=-1, keepdims=True)
+    max_classes = np.argmax(results, axis=-1)
+    max_conf = normalized[np.arange(len(normalized)), max_classes]
+    diffs = max_conf[:, None] - normalized
+    # same as for a single result: zero differences (the max class itself or ties) are ignored, capped at 1.0
+    diffs[diffs == 0] = np.inf
+    min_diffs = np.minimum(diffs.min(axis=-1), 1.0)
+    return max_classes, normalized, min_diffs
+
+
+def predict_chunks(model, cursor, processors, chunk_size: int=2048, cache: PredictionCache=None):
+    """
+    Predict the documents of a cursor in chunks with one predict() call per chunk
+    :param model: keras model or any model with a predict(x, batch_size) method (e.g. NumpyModel, Ensemble)
+    :param cursor: pymongo cursor (or any iterable) of documents
+    :param processors: list of processors to encode the documents
+    :param chunk_size: number of documents that are encoded and predicted at once
+    :param cache: optional PredictionCache of the model, only documents with new feature vectors are predicted
+    :return: generator of (documents, predicted classes, normalized class histograms, differences to next best class)
+             for each chunk, see get_class_distributions()
+    """
+    def predict(features):
+        if cache is None:
+            return model.predict(features, batch_size=chunk_size)
+        return cache.predict(lambda rows: model.predict(rows, batch_size=chunk_size), features)
+
+    x = None
+    y = None
+    chunk = []
+    for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) == chunk_size:
+            x, y = encode_documents(chunk, processors, x, y)
+            yield (chunk,) + get_class_distributions(predict(x))
+            chunk = []
+    if len(chunk) > 0:
+        x, y = encode_documents(chunk, processors, x, y)
+        yield (chunk,) + get_class_distributions(predict(x[:len(chunk)]))
+
+
 def print_train_data_info(row, class_prediction, distribution):
     """
     Debug function to print predicted training data for analysis
@@ -57,7 +103,8 @@ if __name__ == "__main__":
 
     # ID of the experiment that should be loaded
     EXP_ID = "5bac50ca32b9011693a63274"
-    # Index (usually equals the epoch number + 1) of the weights that should be loaded, takes latest if None
+    # Index (usually equals the epoch number + 1) of the weights that should be loaded, if None the best weights
+    # (tracked by the EarlyStopping callback) are taken or the latest in case the experiment has no best weights
     INDEX = None
 
     if len(sys.argv) > 1:
@@ -70,45 +117,28 @@ if __name__ == "__main__":
         raise ValueError("Config File could not be loaded, please check the correct path!")
     MongoDBConnect.add_connections_from_config(cp)
     db = MongoDBConnect.get_db("localhost_mongo_db", "models")
-    col = MongoDBConnect.get_collection("localhost_mongo_db", "models", "experiment")
     col_test = MongoDBConnect.get_collection("localhost_mongo_db", "accident", "test")
     col_train = MongoDBConnect.get_collection("localhost_mongo_db", "accident", "train")
 
-    exp_obj = col.find_one({"_id": ObjectId(EXP_ID)})
-
-    # load model weight data as h5 file from mongoDB
-    fs = gridfs.GridFS(db)
-    idx = -1 if INDEX is None else INDEX
-    h5_file = fs.get(exp_obj["weights"][idx]["model_gridfs"])
-    h5_bytes = h5_file.read()
-
-    tmp_filename = "tmp_model_weights_read.h5"
-    with open(tmp_filename, 'wb') as f:
-        f.write(h5_bytes)
-
-    # create model with custom metric objects as used while training
-    model = load_model(tmp_filename, custom_objects={
-        "p": single_class_precision(0),
-        "r": single_class_recall(0),
-        "p_1": single_class_precision(1),
-        "r_1": single_class_recall(1),
-        "p_2": single_class_precision(2),
-        "r_2": single_class_recall(2),
-    })
-    os.remove(tmp_filename)
+    # the model is loaded in memory from GridFS for predictions only (not compiled)
+    checkpoint = get_checkpoint(db, EXP_ID, INDEX)
+    registry = ModelRegistry(db, custom_objects=get_custom_objects())
+    model = registry.get(EXP_ID, checkpoint["index"])
 
-    data_set = col_test.find()
+    # records with the same feature vector are only predicted once, also over multiple runs with the same weights
+    cache = PredictionCache("{0}:{1}".format(EXP_ID, checkpoint["index"]), path="prediction_cache.npz")
 
     csv_data = []
     class_counter = [0, 0, 0]
-    processor = PreProcessData()
-    for row in data_set:
-        _, feat, _, _ = processor.process(row, None, None)
-        feat = np.asarray([feat])
-        prediction = model.predict(feat)
-        class_prediction, distribution, minimum_diff = get_class_distribution(prediction[0])
-        csv_data.append([row["row_id"], int(class_prediction)+1])
-        class_counter[int(class_prediction)] += 1
+    for docs, class_predictions, _, _ in predict_chunks(model, col_test.find(), [PreProcessData()], cache=cache):
+        for doc, class_prediction in zip(docs, class_predictions):
+            csv_data.append([doc["row_id"], int(class_prediction)+1])
+            class_counter[int(class_prediction)] += 1
+
+    cache.save()
+    cache_stats = cache.stats()
+    print("Prediction cache: {0} hits, {1} misses ({2:.1%} hit rate)".format(
+        cache_stats["hits"], cache_stats["misses"], cache_stats["hit_rate"]))
 
     print("Predicted classes counter:")
     print(class_counter)
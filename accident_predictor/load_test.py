@@ -0,0 +1,64 @@
+"""
+Load test for the scoring server: several client threads send the records of the test csv file (one record per
+request) for a fixed duration. Prints the client side latencies and the statistics of the server.
+Usage: python load_test.py [<nb_clients>] [<duration_sec>]
+"""
+import csv
+import json
+import sys
+import threading
+import time
+import urllib.request
+import numpy as np
+
+
+URL = "http://127.0.0.1:8080"
+CSV_FILE = "./data/upload/verkehrsunfaelle_test.csv"
+
+
+def load_records(file_name: str) -> list:
+    with open(file_name, encoding="utf-8") as file:
+        data = csv.reader(file, delimiter=",")
+        fields = next(data)
+        fields[0] = "row_id"
+        return [dict(zip(fields, row)) for row in data]
+
+
+def run_client(records: list, offset: int, end_time: float, latencies: list, errors: list):
+    i = offset
+    while time.perf_counter() < end_time:
+        body = json.dumps(records[i % len(records)]).encode("utf-8")
+        request = urllib.request.Request(URL + "/predict", data=body, headers={"Content-Type": "application/json"})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+            latencies.append(time.perf_counter() - start)
+        except Exception as err:
+            errors.append(str(err))
+        i += 1
+
+
+if __name__ == "__main__":
+    nb_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+
+    test_records = load_records(CSV_FILE)
+    client_latencies = []
+    client_errors = []
+    stop_time = time.perf_counter() + duration
+    threads = [threading.Thread(target=run_client, args=(test_records, c * 100, stop_time, client_latencies,
+                                                         client_errors)) for c in range(nb_clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies_ms = np.asarray(client_latencies) * 1000
+    print("Clients: {0}\tRequests: {1}\tErrors: {2}\t{3:.1f} requests/sec".format(
+        nb_clients, len(latencies_ms), len(client_errors), len(latencies_ms) / duration))
+    if len(latencies_ms) > 0:
+        print("Client latency p50: {0:.2f}ms\tp99: {1:.2f}ms".format(
+            np.percentile(latencies_ms, 50), np.percentile(latencies_ms, 99)))
+    with urllib.request.urlopen(URL + "/stats") as stats_response:
+        print("Server stats: " + stats_response.read().decode("utf-8"))
@@ -1,4 +1,5 @@
 from keras import backend as K
+from keras.layers import Layer
 
 
 def single_class_precision(interesting_class_id):
@@ -43,3 +44,112 @@ def single_labels(interesting_class_id):
         accuracy_mask = K.cast(K.equal(class_id_true, interesting_class_id), 'int32')
         return K.cast(K.maximum(K.sum(accuracy_mask), 1), 'int32')
     return s_l
+
+
+class BatchConfusionMatrix:
+    """
+    Confusion matrix of a batch, rows are the true classes and columns the predicted classes. The tensor is built
+    only once per (y_true, y_pred) pair and shared by all metrics that use the same instance.
+    """
+    def __init__(self):
+        self._last = None  # (y_true, y_pred, confusion matrix) of the last call
+
+    def __call__(self, y_true, y_pred):
+        """
+        :return: float tensor [nb_classes, nb_classes] with the number of samples
+        """
+        if self._last is not None and self._last[0] is y_true and self._last[1] is y_pred:
+            return self._last[2]
+        nb_classes = K.int_shape(y_pred)[-1]
+        one_hot_true = K.one_hot(K.argmax(y_true, axis=-1), nb_classes)
+        one_hot_pred = K.one_hot(K.argmax(y_pred, axis=-1), nb_classes)
+        confusion_matrix = K.dot(K.transpose(one_hot_true), one_hot_pred)
+        self._last = (y_true, y_pred, confusion_matrix)
+        return confusion_matrix
+
+
+class ClassPrecisionRecall(Layer):
+    """
+    Stateful precision or recall of one class derived from the batch confusion matrix. The counts are accumulated
+    until reset_states() is called (the Trainer resets them at the start of each epoch and before validation), thus the
+    value is the exact precision/recall of all batches so far and not an average of batch ratios.
+    Keras 2.2.4 saves metric layers as {"class_name", "config"} which its load_model() can not compile again. Models
+    with these metrics are loaded compiled by dlpipe.checkpoint.load_model_from_bytes() (with get_custom_objects()),
+    which creates the metrics from their configs and links them to one confusion matrix again (see link()).
+    """
+    def __init__(self, class_id: int, kind: str = "precision", name: str = None,
+                 confusion_matrix: BatchConfusionMatrix = None, **kwargs):
+        """
+        :param class_id: integer in range [0,2] to specify class
+        :param kind: "precision" -> TP / (TP + FP) or "recall" -> TP / (TP + FN)
+        :param name: metric name, defaults to the names of the single class metrics (p, r, p_1, r_1, ...)
+        :param confusion_matrix: shared with the other metrics of the model, see class_metrics() and link()
+        """
+        if kind not in ["precision", "recall"]:
+            raise ValueError("kind must be any of ['precision', 'recall']")
+        if name is None:
+            name = ("p" if kind == "precision" else "r") + ("" if class_id == 0 else "_" + str(class_id))
+        super().__init__(name=name, **kwargs)
+        self.stateful = True
+        self.class_id = class_id
+        self.kind = kind
+        self.confusion_matrix = confusion_matrix if confusion_matrix is not None else BatchConfusionMatrix()
+        self.true_positives = K.variable(value=0.0, dtype="float32", name=name + "_true_positives")
+        self.total = K.variable(value=0.0, dtype="float32", name=name + "_total")
+
+    @staticmethod
+    def link(metrics: list):
+        """ share one batch confusion matrix between metrics that were created one by one (e.g. from their configs) """
+        confusion_matrix = BatchConfusionMatrix()
+        for metric in metrics:
+            metric.confusion_matrix = confusion_matrix
+
+    def reset_states(self):
+        K.batch_set_value([(self.true_positives, 0.0), (self.total, 0.0)])
+
+    def __call__(self, y_true, y_pred):
+        confusion_matrix = self.confusion_matrix(y_true, y_pred)
+        true_positives = confusion_matrix[self.class_id, self.class_id]
+        if self.kind == "precision":
+            total = K.sum(confusion_matrix[:, self.class_id])
+        else:
+            total = K.sum(confusion_matrix[self.class_id, :])
+        # read the state before the update is applied
+        prev_true_positives = self.true_positives * 1
+        prev_total = self.total * 1
+        self.add_update([K.update_add(self.true_positives, true_positives),
+                         K.update_add(self.total, total)], inputs=[y_true, y_pred])
+        return (prev_true_positives + true_positives) / K.maximum(prev_total + total, 1)
+
+    def get_config(self):
+        return {"class_id": self.class_id, "kind": self.kind, "name": self.name}
+
+
+def class_metrics(nb_classes: int = 3) -> list:
+    """
+    :return: precision and recall metrics of all classes sharing one batch confusion matrix
+             named and ordered as the single class metrics [p, r, p_1, r_1, p_2, r_2]
+    """
+    confusion_matrix = BatchConfusionMatrix()
+    metrics = []
+    for class_id in range(nb_classes):
+        metrics.append(ClassPrecisionRecall(class_id, "precision", confusion_matrix=confusion_matrix))
+        metrics.append(ClassPrecisionRecall(class_id, "recall", confusion_matrix=confusion_matrix))
+    return metrics
+
+
+def get_custom_objects() -> dict:
+    """
+    :return: custom objects to load saved models, for models trained with the fused metrics as well as for older
+             models trained with the single class metric functions
+    """
+    return {
+        "ClassPrecisionRecall": ClassPrecisionRecall,
+        "p": single_class_precision(0),
+        "r": single_class_recall(0),
+        "p_1": single_class_precision(1),
+        "r_1": single_class_recall(1),
+        "p_2": single_class_precision(2),
+        "r_2": single_class_recall(2),
+    }
+
@@ -1,5 +1,6 @@
 import configparser
 from dlpipe.data_reader.mongodb import MongoDBConnect
+from dlpipe.schemas import MetricSeriesSchema
 from dlpipe.utils import DLPipeLogger
 from bson import ObjectId
 
@@ -36,17 +37,37 @@ def create_plot_data(convert_data: list, batch_size: int, smooth_window: int=1):
     return x_values, y_values
 
 
+def load_training_metric(exp_obj, series, metric_name: str, max_points: int=500):
+    """
+    Load the downsampled per batch training values of a metric, falls back to the metrics embedded in the experiment
+    document for experiments which were saved before the metric series collection existed
+    :param exp_obj: experiment document
+    :param series: MetricSeriesSchema of the experiment metrics
+    :param metric_name: name of the metric e.g. "loss"
+    :param max_points: maximum number of points that are loaded
+    :return: (metric_data, smooth_window) => list of metric objects and the window they still need to be smoothed with
+    """
+    metric_data = series.query(exp_obj["_id"], "training", metric_name, max_points=max_points)
+    if len(metric_data) > 0:
+        # values are already averaged on the server
+        return metric_data, 1
+    return exp_obj["metrics"]["training"][metric_name], 50
+
+
 def plot_acc_loss_graph(exp_id, col):
     """
     Create a scatter plot of loss and accuracy for validation and training data
     :param exp_id: Experiment Id
     """
-    exp_obj = col.find_one({"_id": ObjectId(exp_id)})
+    exp_obj = col.find_one({"_id": ObjectId(exp_id)}, {"weights": 0})
+    series = MetricSeriesSchema(col.database["experiment_metrics"])
 
     batch_size = int(exp_obj["max_batches_per_epoch"])
-    x_train_loss, y_train_loss = create_plot_data(exp_obj["metrics"]["training"]["loss"], batch_size, 50)
+    train_loss, loss_window = load_training_metric(exp_obj, series, "loss")
+    train_acc, acc_window = load_training_metric(exp_obj, series, "acc")
+    x_train_loss, y_train_loss = create_plot_data(train_loss, batch_size, loss_window)
     x_val_loss, y_val_loss = create_plot_data(exp_obj["metrics"]["validation"]["loss"], batch_size, 1)
-    x_train_acc, y_train_acc = create_plot_data(exp_obj["metrics"]["training"]["acc"], batch_size, 50)
+    x_train_acc, y_train_acc = create_plot_data(train_acc, batch_size, acc_window)
     x_val_acc, y_val_acc = create_plot_data(exp_obj["metrics"]["validation"]["acc"], batch_size, 1)
 
     trace_train_loss = go.Scatter(x=x_train_loss, y=y_train_loss, mode="lines", name="training loss")
@@ -0,0 +1,131 @@
+"""
+Score a raw csv export (same format as verkehrsunfaelle_test.csv) without uploading it to the MongoDB. The file is
+streamed in chunks: each chunk is encoded, predicted and written to the result csv before the next one is read, thus
+memory stays bounded for any file size. Rows that can not be encoded are written to a reject file with the error.
+Usage: python score_csv.py <exp_id|model.npz> [<input.csv>] [<result.csv>] [<rejects.csv>]
+"""
+import configparser
+import csv
+import sys
+import time
+import numpy as np
+from dlpipe.utils import DLPipeLogger
+from accident_predictor.data.upload.data_encoder import encode_row
+from accident_predictor.processors import PreProcessData
+
+
+CHUNK_SIZE = 4096
+NB_FEATURES = 37
+
+
+def read_chunks(csv_file, chunk_size: int):
+    """
+    :param csv_file: opened csv file, the first row has the field names and the first field is the row id
+    :return: generator of (header, list of rows) with at most chunk_size rows
+    """
+    reader = csv.reader(csv_file, delimiter=",")
+    header = next(reader)
+    fields = ["row_id"] + header[1:]
+    chunk = []
+    for row in reader:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield fields, chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield fields, chunk
+
+
+def encode_chunk(fields: list, rows: list, processor: PreProcessData, x: np.ndarray):
+    """
+    :param x: preallocated feature matrix [>= len(rows), 37] that is filled
+    :return: row ids of the encoded rows (the first len(row ids) rows of x), list of (row, error) of the rejected rows
+    """
+    row_ids = []
+    rejects = []
+    for row in rows:
+        try:
+            if len(row) != len(fields):
+                raise ValueError("Expected {0} fields, got {1}".format(len(fields), len(row)))
+            raw_data = encode_row(dict(zip(fields, row)))
+            _, input_data, _, _ = processor.process(raw_data, None, None)
+        except (ValueError, KeyError, TypeError) as err:
+            rejects.append((row, str(err)))
+            continue
+        x[len(row_ids)] = input_data
+        row_ids.append(raw_data["row_id"])
+    return row_ids, rejects
+
+
+def score_csv(model, input_file: str, result_file: str, reject_file: str, chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    :param model: model with a predict(x, batch_size) method (keras model or NumpyModel)
+    :return: dict with the number of scored and rejected rows and the predicted classes counter
+    """
+    processor = PreProcessData()
+    x = np.empty((chunk_size, NB_FEATURES), dtype=np.float32)
+    stats = {"scored": 0, "rejected": 0, "class_counter": [0, 0, 0]}
+    with open(input_file, encoding="utf-8", newline="") as in_file, \
+            open(result_file, "w", newline="") as out_file, \
+            open(reject_file, "w", encoding="utf-8", newline="") as reject_out:
+        writer = csv.writer(out_file, delimiter=",")
+        writer.writerow(['Unfall_ID', 'Unfallschwere'])
+        reject_writer = None
+        for fields, rows in read_chunks(in_file, chunk_size):
+            row_ids, rejects = encode_chunk(fields, rows, processor, x)
+            if len(rejects) > 0:
+                if reject_writer is None:
+                    reject_writer = csv.writer(reject_out, delimiter=",")
+                    reject_writer.writerow(fields + ["error"])
+                reject_writer.writerows(row + [error] for row, error in rejects)
+                stats["rejected"] += len(rejects)
+            if len(row_ids) == 0:
+                continue
+            class_predictions = model.predict(x[:len(row_ids)], batch_size=chunk_size).argmax(axis=-1)
+            writer.writerows([row_id, int(c) + 1] for row_id, c in zip(row_ids, class_predictions))
+            for c, count in enumerate(np.bincount(class_predictions, minlength=3)):
+                stats["class_counter"][c] += int(count)
+            stats["scored"] += len(row_ids)
+    return stats
+
+
+def load_model(model_name: str):
+    """
+    :param model_name: exported .npz model (loaded without TensorFlow) or experiment id (best weights from GridFS)
+    """
+    if model_name.endswith(".npz"):
+        from dlpipe.numpy_engine import NumpyModel
+        return NumpyModel.load(model_name)
+    from dlpipe.data_reader.mongodb import MongoDBConnect
+    from dlpipe.checkpoint import get_checkpoint
+    from dlpipe.model_registry import ModelRegistry
+    from accident_predictor.metrics import get_custom_objects
+    cp = configparser.ConfigParser()
+    if len(cp.read('./connections.ini')) == 0:
+        raise ValueError("Config File could not be loaded, please check the correct path!")
+    MongoDBConnect.add_connections_from_config(cp)
+    db = MongoDBConnect.get_db("localhost_mongo_db", "models")
+    checkpoint = get_checkpoint(db, model_name)
+    return ModelRegistry(db, custom_objects=get_custom_objects()).get(model_name, checkpoint["index"])
+
+
+if __name__ == "__main__":
+    DLPipeLogger.remove_file_logger()
+
+    MODEL = "5bac50ca32b9011693a63274"
+    INPUT_FILE = "./data/upload/verkehrsunfaelle_test.csv"
+    if len(sys.argv) > 1:
+        MODEL = sys.argv[1]
+    if len(sys.argv) > 2:
+        INPUT_FILE = sys.argv[2]
+    name = MODEL[:-len(".npz")] if MODEL.endswith(".npz") else MODEL
+    RESULT_FILE = sys.argv[3] if len(sys.argv) > 3 else "result_" + name + ".csv"
+    REJECT_FILE = sys.argv[4] if len(sys.argv) > 4 else "rejects_" + name + ".csv"
+
+    start = time.perf_counter()
+    score_stats = score_csv(load_model(MODEL), INPUT_FILE, RESULT_FILE, REJECT_FILE)
+    seconds = time.perf_counter() - start
+    print("Scored {0} rows in {1:.1f}s, {2} rejected (see {3})".format(
+        score_stats["scored"], seconds, score_stats["rejected"], REJECT_FILE))
+    print("Predicted classes counter:")
+    print(score_stats["class_counter"])
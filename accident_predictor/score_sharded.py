@@ -0,0 +1,69 @@
+"""
+Score the test collection with several worker processes, each scoring _id ranges of the collection. The results are
+merged by row_id into the result csv or written back to the documents ("prediction" field).
+Usage: python score_sharded.py <exp_id|model.npz> [<nb_workers>] [<csv|mongo>]
+"""
+import csv
+import sys
+from functools import partial
+from dlpipe.data_reader.mongodb import MongoDBActions
+from dlpipe.sharded_scoring import ShardedScorer
+from dlpipe.utils import DLPipeLogger
+from accident_predictor.processors import PreProcessData
+
+
+CONFIG_FILE = "./connections.ini"
+CONNECTION = "localhost_mongo_db"
+
+
+def load_model(exp_id: str = None, model_file: str = None):
+    """
+    Called once in each worker process (on its first shard). An exported .npz model (see export_model.py) is loaded
+    without TensorFlow, otherwise the best weights of the experiment are loaded from GridFS.
+    """
+    if model_file is not None:
+        from dlpipe.numpy_engine import NumpyModel
+        return NumpyModel.load(model_file)
+    from dlpipe.data_reader.mongodb import MongoDBConnect
+    from dlpipe.checkpoint import get_checkpoint
+    from dlpipe.model_registry import ModelRegistry
+    from accident_predictor.metrics import get_custom_objects
+    db = MongoDBConnect.get_db(CONNECTION, "models")
+    checkpoint = get_checkpoint(db, exp_id)
+    return ModelRegistry(db, custom_objects=get_custom_objects()).get(exp_id, checkpoint["index"])
+
+
+if __name__ == "__main__":
+    DLPipeLogger.remove_file_logger()
+
+    MODEL = "5bac50ca32b9011693a63274"
+    NB_WORKERS = None
+    OUTPUT = "csv"
+    if len(sys.argv) > 1:
+        MODEL = sys.argv[1]
+    if len(sys.argv) > 2:
+        NB_WORKERS = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        OUTPUT = sys.argv[3]
+
+    if MODEL.endswith(".npz"):
+        model_fn = partial(load_model, model_file=MODEL)
+    else:
+        model_fn = partial(load_model, exp_id=MODEL)
+
+    MongoDBActions.add_config(CONFIG_FILE)
+    scorer = ShardedScorer(model_fn, [PreProcessData()], CONFIG_FILE, CONNECTION, "accident", "test",
+                           key_field="row_id", output_field="prediction" if OUTPUT == "mongo" else None,
+                           nb_workers=NB_WORKERS, uses_tensorflow=not MODEL.endswith(".npz"))
+    row_ids, predictions = scorer.run()
+
+    if OUTPUT == "csv":
+        class_predictions = predictions.argmax(axis=-1)
+        print("Predicted classes counter:")
+        print([int((class_predictions == c).sum()) for c in range(3)])
+        name = MODEL[:-len(".npz")] if MODEL.endswith(".npz") else MODEL
+        with open("result_" + name + ".csv", "w") as csv_file:
+            writer = csv.writer(csv_file, delimiter=",")
+            writer.writerow(['Unfall_ID', 'Unfallschwere'])
+            for row_id, class_prediction in zip(row_ids, class_predictions):
+                writer.writerow([row_id, int(class_prediction)+1])
@@ -0,0 +1,169 @@
+"""
+Local HTTP scoring server for accident records. Concurrent requests are coalesced into micro batches which are
+predicted with one call of the model.
+Usage: python server.py <exp_id> [<weights_index>]
+
+POST /predict   body: one record or a list of records (json) with the same fields as the csv file, the id field
+                ("row_id") is optional. Returns the predicted severity [1, 3], the class distribution and the margin
+                to the next best class for each record.
+GET  /stats     latency percentiles (p50, p99), throughput counters and the hit rate of the prediction cache
+"""
+import configparser
+import json
+import sys
+import time
+import numpy as np
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from dlpipe.data_reader.mongodb import MongoDBConnect
+from dlpipe.checkpoint import get_checkpoint
+from dlpipe.model_registry import ModelRegistry
+from dlpipe.prediction_cache import PredictionCache
+from dlpipe.serving import MicroBatcher, ServingStats
+from dlpipe.utils import DLPipeLogger
+from accident_predictor.data.upload.data_encoder import encode_row
+from accident_predictor.inference import get_class_distributions
+from accident_predictor.metrics import get_custom_objects
+from accident_predictor.processors import PreProcessData
+
+
+HOST = "127.0.0.1"
+PORT = 8080
+MAX_BATCH_SIZE = 256
+MAX_LATENCY_MS = 5.0
+CACHE_SIZE = 100000
+
+
+def encode_records(records: list, processor: PreProcessData):
+    """
+    :param records: list of raw records (dicts with the csv field names)
+    :return: feature matrix [n, 37]
+    """
+    features = np.empty((len(records), 37), dtype=np.float32)
+    for i, record in enumerate(records):
+        _, input_data, _, _ = processor.process(encode_row(record), None, None)
+        features[i] = input_data
+    return features
+
+
+def create_predict_fn(model, cache: PredictionCache = None):
+    """
+    The model is called from the batcher thread, it needs the graph and session it was loaded in. Only the batcher
+    thread uses the cache, thus it needs no lock.
+    """
+    from keras import backend as K
+    session = K.get_session()
+    graph = session.graph
+    model._make_predict_function()
+
+    def model_predict(features):
+        with graph.as_default(), session.as_default():
+            return model.predict(features, batch_size=len(features))
+
+    def predict_fn(features):
+        if cache is None:
+            return model_predict(features)
+        return cache.predict(model_predict, features)
+    return predict_fn
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def create_handler(batcher: MicroBatcher, stats: ServingStats, cache: PredictionCache = None):
+    processor = PreProcessData()
+
+    class ScoringHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, data):
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                summary = stats.summary()
+                if cache is not None:
+                    summary["cache"] = cache.stats()
+                self._send_json(200, summary)
+            else:
+                self._send_json(404, {"error": "unknown path " + self.path})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self._send_json(404, {"error": "unknown path " + self.path})
+                return
+            start = time.perf_counter()
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                records = json.loads(self.rfile.read(length).decode("utf-8"))
+                if isinstance(records, dict):
+                    records = [records]
+                if len(records) == 0:
+                    raise ValueError("No records to predict")
+                features = encode_records(records, processor)
+            except (ValueError, KeyError, TypeError) as err:
+                stats.add_error()
+                self._send_json(400, {"error": str(err)})
+                return
+
+            try:
+                classes, distributions, margins = get_class_distributions(batcher.predict(features))
+            except Exception as err:
+                DLPipeLogger.logger.exception("Prediction failed")
+                stats.add_error()
+                self._send_json(500, {"error": "prediction failed: " + str(err)})
+                return
+            predictions = []
+            for record, class_prediction, distribution, margin in zip(records, classes, distributions, margins):
+                predictions.append({
+                    "row_id": record.get("row_id"),
+                    "severity": int(class_prediction) + 1,
+                    "distribution": [float(v) for v in distribution],
+                    "margin": float(margin)
+                })
+            self._send_json(200, {"predictions": predictions})
+            stats.add_request(len(records), time.perf_counter() - start)
+
+        def log_message(self, format, *args):
+            # no console output per request
+            pass
+
+    return ScoringHandler
+
+
+if __name__ == "__main__":
+    DLPipeLogger.remove_file_logger()
+
+    EXP_ID = "5bac50ca32b9011693a63274"
+    INDEX = None
+    if len(sys.argv) > 1:
+        EXP_ID = sys.argv[1]
+    if len(sys.argv) > 2:
+        INDEX = int(sys.argv[2])
+
+    cp = configparser.ConfigParser()
+    if len(cp.read('./connections.ini')) == 0:
+        raise ValueError("Config File could not be loaded, please check the correct path!")
+    MongoDBConnect.add_connections_from_config(cp)
+    db = MongoDBConnect.get_db("localhost_mongo_db", "models")
+
+    checkpoint = get_checkpoint(db, EXP_ID, INDEX)
+    model = ModelRegistry(db, custom_objects=get_custom_objects()).get(EXP_ID, checkpoint["index"])
+    prediction_cache = PredictionCache("{0}:{1}".format(EXP_ID, checkpoint["index"]), max_entries=CACHE_SIZE)
+    serving_stats = ServingStats()
+    micro_batcher = MicroBatcher(create_predict_fn(model, prediction_cache), MAX_BATCH_SIZE, MAX_LATENCY_MS,
+                                 serving_stats)
+
+    server = ThreadingHTTPServer((HOST, PORT), create_handler(micro_batcher, serving_stats, prediction_cache))
+    print("Serving on http://{0}:{1}".format(HOST, PORT))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        micro_batcher.close()
@@ -0,0 +1,54 @@
+"""
+Hyperparameter sweep over layer sizes and learning rates, trials are trained in parallel processes and the ones
+performing badly are stopped early (successive halving). All trials are saved as experiments linked to one sweep
+experiment.
+"""
+import itertools
+from dlpipe.data_reader.mongodb import MongoDBConnect
+from dlpipe.sweep import SweepRunner
+from dlpipe.utils import DLPipeLogger
+from accident_predictor.train import create_data_reader, create_model
+
+
+SEARCH_SPACE = {
+    "units": [(1024, 512, 64), (512, 256, 32), (256, 64), (128, 32)],
+    "lr": [0.001, 0.0003, 0.0001],
+    "batch_size": [32, 128]
+}
+
+
+def build_trial(config):
+    """
+    Create the model and data reader for one trial (called inside the worker processes)
+    :param config: dict with keys [units, lr, batch_size]
+    :return: compiled keras model, data reader
+    """
+    collection = MongoDBConnect.get_collection("localhost_mongo_db", "accident", "train")
+    reader = create_data_reader(collection, batch_size=config["batch_size"])
+    dropout = [0.4] * (len(config["units"]) - 1) + [0.2]
+    model = create_model(units=config["units"], dropout=dropout, lr=config["lr"])
+    return model, reader
+
+
+if __name__ == "__main__":
+    DLPipeLogger.remove_file_logger()
+
+    keys = sorted(SEARCH_SPACE.keys())
+    configs = [dict(zip(keys, values)) for values in itertools.product(*[SEARCH_SPACE[k] for k in keys])]
+
+    runner = SweepRunner(
+        build_trial,
+        configs,
+        config_file="./connections.ini",
+        connection="localhost_mongo_db",
+        name="accident_sweep",
+        max_epochs=27,
+        min_epochs=1,
+        eta=3,
+        nb_workers=4,
+        intra_op_threads=2
+    )
+    summary = runner.run()
+
+    print("Best experiment ID: " + str(summary["best_exp_id"]))
+    print("Best config: " + str(summary["best_config"]))
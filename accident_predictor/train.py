@@ -4,57 +4,90 @@ from keras.models import Model
 from keras import optimizers, regularizers
 from dlpipe.data_reader.mongodb import MongoDBReader, MongoDBConnect, MongoDBActions
 from dlpipe.trainer import Trainer
+from dlpipe.autotune import Autotuner
+from dlpipe.utils.tf_config import limit_threads
 from dlpipe.utils import DLPipeLogger
-from dlpipe.callbacks import SaveExpMongoDB
-from accident_predictor.metrics import single_class_precision, single_class_recall
+from dlpipe.callbacks import SaveExpMongoDB, EarlyStopping
+from accident_predictor.metrics import class_metrics
 from accident_predictor.plot_results import plot_acc_loss_graph
 from accident_predictor.processors import PreProcessData
 
 
-def create_data_reader(col):
+def create_data_reader(col, batch_size: int=32, doc_ids: dict=None, query: dict=None):
     reader = MongoDBReader(
         col,
-        batch_size=32,
+        batch_size=batch_size,
         data_split=[80, 20, 0],  # test data is separate
-        shuffle_data=True
+        shuffle_data=True,
+        doc_ids=doc_ids,
+        query=query,
+        processors=[PreProcessData()]
     )
-    processors = [PreProcessData()]
-    reader.add_processors(processors)
     return reader
 
 
+def create_train_reader(batch_size: int=32):
+    """ create the reader for the training collection, the connections must be added already """
+    collection = MongoDBConnect.get_collection("localhost_mongo_db", "accident", "train")
+    return create_data_reader(collection, batch_size=batch_size)
+
+
+def create_model(units: tuple=(1024, 512, 64), dropout: tuple=(0.4, 0.4, 0.2), lr: float=0.0001):
+    """
+    Create the compiled model
+    :param units: number of units of each hidden dense layer
+    :param dropout: dropout rate after each hidden dense layer
+    :param lr: learning rate of the RMSprop optimizer
+    :return: compiled keras model
+    """
+    inputs = Input(shape=(37,))
+    x = inputs
+    for nb_units, rate in zip(units, dropout):
+        x = Dense(nb_units, activation='relu')(x)
+        x = Dropout(rate)(x)
+    predictions = Dense(3, activation='softmax')(x)
+    model = Model(inputs=[inputs], outputs=[predictions])
+
+    opt = optimizers.RMSprop(lr=lr, decay=0.5e-6)
+    # precision and recall of all classes from one shared confusion matrix per batch
+    model.compile(optimizer=opt, loss='categorical_crossentropy', metrics=["accuracy"] + class_metrics(3))
+    return model
+
+
 if __name__ == "__main__":
     # Prevent creation of a file to log console output
     DLPipeLogger.remove_file_logger()
 
-    # Configure Data Reader
+    # Set to True to benchmark batch sizes and thread settings before training and train with the fastest one
+    AUTOTUNE = False
+    LEARNING_RATE = 0.0001
+    BATCH_SIZE = 32
+
     MongoDBActions.add_config('./connections.ini')
-    collection = MongoDBConnect.get_collection("localhost_mongo_db", "accident", "train")
-    mr = create_data_reader(collection)
 
-    # Configure Model
-    inputs = Input(shape=(37,))
-    x1 = Dense(1024, activation='relu')(inputs)
-    x1 = Dropout(0.4)(x1)
-    x2 = Dense(512, activation='relu')(x1)
-    x2 = Dropout(0.4)(x2)
-    x3 = Dense(64, activation='relu')(x2)
-    x3 = Dropout(0.2)(x3)
-    predictions = Dense(3, activation='softmax')(x3)
-    model = Model(inputs=[inputs], outputs=[predictions])
+    tuning = None
+    if AUTOTUNE:
+        tuning = Autotuner(create_model, create_train_reader, config_file='./connections.ini',
+                           memory_budget_mb=4096, base_batch_size=BATCH_SIZE, base_lr=LEARNING_RATE,
+                           lr_scaling="sqrt").run()
+        limit_threads(tuning["intra_op_threads"], tuning["inter_op_threads"])
+        BATCH_SIZE = tuning["batch_size"]
+        LEARNING_RATE = tuning["learning_rate"]
+
+    # Configure Data Reader
+    mr = create_train_reader(BATCH_SIZE)
 
-    opt = optimizers.RMSprop(lr=0.0001, decay=0.5e-6)
-    model.compile(optimizer=opt, loss='categorical_crossentropy', metrics=[
-        "accuracy",
-        single_class_precision(0), single_class_recall(0),
-        single_class_precision(1), single_class_recall(1),
-        single_class_precision(2), single_class_recall(2)
-    ])
+    # Configure Model
+    model = create_model(lr=LEARNING_RATE)
 
     # Train the model
     model_db = MongoDBConnect.get_db("localhost_mongo_db", "models")
-    mongo_db_cb = SaveExpMongoDB(model_db, "accident_v1.0", model.get_config())
-    trainer = Trainer(model=model, data_reader=mr, callbacks=[mongo_db_cb])
+    mongo_db_cb = SaveExpMongoDB(model_db, "accident_v1.0", model.get_config(),
+                                 config={"batch_size": BATCH_SIZE, "lr": LEARNING_RATE, "autotune": tuning,
+                                         # records the model never trained on, e.g. to compare compressed models
+                                         "validation_ids": mr.doc_ids["validation"]})
+    early_stopping = EarlyStopping(monitor="loss", phase="validation", min_delta=0.001, patience=5)
+    trainer = Trainer(model=model, data_reader=mr, callbacks=[early_stopping, mongo_db_cb])
     trainer.train(epochs=30)
 
     # plot results
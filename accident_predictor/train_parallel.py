@@ -0,0 +1,50 @@
+"""
+Train the model with several processes in parallel (data parallel), each process trains on its own shard of the
+training data and the weights are averaged between the processes.
+Call with "scaling" as argument to measure the scaling efficiency from 1 to NB_WORKERS workers instead.
+"""
+import sys
+from dlpipe.data_reader.mongodb import MongoDBConnect, MongoDBActions
+from dlpipe.data_parallel import DataParallelTrainer, measure_scaling
+from dlpipe.callbacks import SaveExpMongoDB, EarlyStopping
+from dlpipe.utils import DLPipeLogger
+from accident_predictor.train import create_data_reader, create_model
+
+
+CONFIG_FILE = "./connections.ini"
+NB_WORKERS = 4
+SYNC_EVERY = 4
+
+
+def build_model():
+    return create_model()
+
+
+def build_reader(doc_ids):
+    collection = MongoDBConnect.get_collection("localhost_mongo_db", "accident", "train")
+    return create_data_reader(collection, doc_ids=doc_ids)
+
+
+def build_callbacks(model):
+    model_db = MongoDBConnect.get_db("localhost_mongo_db", "models")
+    mongo_db_cb = SaveExpMongoDB(model_db, "accident_v1.0_parallel", model.get_config(),
+                                 config={"nb_workers": NB_WORKERS, "sync_every": SYNC_EVERY})
+    early_stopping = EarlyStopping(monitor="loss", phase="validation", min_delta=0.001, patience=5)
+    return [early_stopping, mongo_db_cb]
+
+
+if __name__ == "__main__":
+    DLPipeLogger.remove_file_logger()
+    MongoDBActions.add_config(CONFIG_FILE)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "scaling":
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= NB_WORKERS:
+            worker_counts.append(worker_counts[-1] * 2)
+        measure_scaling(build_model, build_reader, worker_counts, epochs=1, sync_every=SYNC_EVERY,
+                        config_file=CONFIG_FILE)
+    else:
+        trainer = DataParallelTrainer(build_model, build_reader, build_callbacks, nb_workers=NB_WORKERS,
+                                      sync_every=SYNC_EVERY, config_file=CONFIG_FILE)
+        stats = trainer.train(epochs=30)
+        print("Trained {0} samples with {1:.1f} samples/sec".format(stats["nb_samples"], stats["samples_per_sec"]))
@@ -0,0 +1,147 @@
+"""
+Benchmark short training runs with different batch sizes and TensorFlow thread settings to find the configuration
+with the highest throughput (samples/sec) within a memory budget
+"""
+import itertools
+import math
+import multiprocessing
+import time
+from typing import Callable, List, Tuple
+from dlpipe.data_reader.mongodb import MongoDBActions
+from dlpipe.utils import DLPipeLogger
+from dlpipe.utils.memory import get_peak_rss_bytes
+from dlpipe.utils.tf_config import limit_threads
+
+
+def _benchmark(build_fn: Callable, reader_fn: Callable, batch_size: int, intra_op: int, inter_op: int,
+               nb_steps: int, nb_warmup_steps: int, config_file: str) -> dict:
+    """ run inside a fresh process, thread settings can only be applied before TensorFlow is initialized """
+    limit_threads(intra_op, inter_op)
+    if config_file is not None:
+        MongoDBActions.add_config(config_file)
+    model = build_fn()
+    reader = reader_fn(batch_size)
+
+    nb_samples = 0
+    start = None
+    for step in range(nb_warmup_steps + nb_steps):
+        if step == nb_warmup_steps:
+            start = time.perf_counter()
+            nb_samples = 0
+        x, y, finished = reader.get_next(mode="train")
+        model.train_on_batch(x, y)
+        nb_samples += len(x)
+        if finished:
+            reader.reset_epoch()
+    duration = time.perf_counter() - start
+    return {
+        "batch_size": batch_size,
+        "intra_op_threads": intra_op,
+        "inter_op_threads": inter_op,
+        "samples_per_sec": nb_samples / duration if duration > 0 else 0.0,
+        "peak_rss_mb": get_peak_rss_bytes() / 1024 / 1024
+    }
+
+
+def scale_learning_rate(base_lr: float, base_batch_size: int, batch_size: int, scaling: str = "linear") -> float:
+    """
+    :param base_lr: learning rate that works well with base_batch_size
+    :param base_batch_size: batch size the base_lr was tuned for
+    :param batch_size: new batch size
+    :param scaling: "linear" (lr grows with the batch size) or "sqrt" (lr grows with the square root)
+    :return: learning rate for the new batch size
+    """
+    ratio = batch_size / float(base_batch_size)
+    if scaling == "linear":
+        return base_lr * ratio
+    if scaling == "sqrt":
+        return base_lr * math.sqrt(ratio)
+    raise ValueError("scaling must be any of ['linear', 'sqrt']")
+
+
+def apply_learning_rate(model, lr: float):
+    """ set the learning rate of a compiled keras model """
+    from keras import backend as K
+    K.set_value(model.optimizer.lr, lr)
+
+
+class Autotuner:
+    """
+    Each configuration is benchmarked in its own spawned process, one after the other to not disturb the
+    measurements. build_fn() returns a compiled model and reader_fn(batch_size) a data reader, both must be defined
+    on module level. The result dict can be saved with the experiment e.g.:
+
+    >> tuning = Autotuner(build_model, create_reader, config_file="./connections.ini", base_lr=0.0001).run()
+    >> mongo_db_cb = SaveExpMongoDB(model_db, "my_model_name", model.get_config(), config={"autotune": tuning})
+
+    """
+    def __init__(self,
+                 build_fn: Callable,
+                 reader_fn: Callable,
+                 batch_sizes: List[int] = (32, 64, 128, 256, 512),
+                 thread_settings: List[Tuple[int, int]] = ((1, 1), (2, 1), (4, 1), (4, 2)),
+                 nb_steps: int = 50,
+                 nb_warmup_steps: int = 5,
+                 memory_budget_mb: float = None,
+                 config_file: str = None,
+                 base_batch_size: int = 32,
+                 base_lr: float = None,
+                 lr_scaling: str = "linear"):
+        """
+        :param build_fn: function returning the compiled keras model
+        :param reader_fn: function taking the batch size and returning a data reader
+        :param batch_sizes: batch sizes that are benchmarked
+        :param thread_settings: list of (intra_op_threads, inter_op_threads) that are benchmarked
+        :param nb_steps: number of measured training steps per configuration
+        :param nb_warmup_steps: number of steps before the measurement starts
+        :param memory_budget_mb: configurations with a higher peak RSS are not selected, None for no limit
+        :param config_file: path to the connections .ini file, loaded in each benchmark process
+        :param base_batch_size: batch size base_lr was tuned for
+        :param base_lr: learning rate at base_batch_size, if set the learning rate for the chosen batch size is added
+        :param lr_scaling: "linear" or "sqrt", see scale_learning_rate()
+        """
+        self._build_fn = build_fn
+        self._reader_fn = reader_fn
+        self._batch_sizes = batch_sizes
+        self._thread_settings = thread_settings
+        self._nb_steps = nb_steps
+        self._nb_warmup_steps = nb_warmup_steps
+        self._memory_budget_mb = memory_budget_mb
+        self._config_file = config_file
+        self._base_batch_size = base_batch_size
+        self._base_lr = base_lr
+        self._lr_scaling = lr_scaling
+
+    def run(self) -> dict:
+        """
+        :return: dict with the chosen batch_size, intra_op_threads, inter_op_threads, samples_per_sec, peak_rss_mb,
+                 learning_rate (None if no base_lr is set) and the list of all benchmarked trials
+        """
+        context = multiprocessing.get_context("spawn")
+        trials = []
+        for batch_size, (intra_op, inter_op) in itertools.product(self._batch_sizes, self._thread_settings):
+            with context.Pool(1) as pool:
+                trial = pool.apply(_benchmark, (self._build_fn, self._reader_fn, batch_size, intra_op, inter_op,
+                                                self._nb_steps, self._nb_warmup_steps, self._config_file))
+            DLPipeLogger.logger.info("Autotune => \tbatch_size: {0}\tthreads: {1}/{2}\t{3:.1f} samples/sec\t"
+                                     "peak RSS: {4:.1f}MB".format(batch_size, intra_op, inter_op,
+                                                                  trial["samples_per_sec"], trial["peak_rss_mb"]))
+            trials.append(trial)
+
+        candidates = trials
+        if self._memory_budget_mb is not None:
+            candidates = [t for t in trials if t["peak_rss_mb"] <= self._memory_budget_mb]
+            if len(candidates) == 0:
+                raise ValueError("No configuration fits into the memory budget of {0}MB".format(
+                    self._memory_budget_mb))
+        best = dict(max(candidates, key=lambda t: t["samples_per_sec"]))
+
+        best["learning_rate"] = None
+        if self._base_lr is not None:
+            best["learning_rate"] = scale_learning_rate(self._base_lr, self._base_batch_size, best["batch_size"],
+                                                        self._lr_scaling)
+        best["memory_budget_mb"] = self._memory_budget_mb
+        best["trials"] = trials
+        DLPipeLogger.logger.info("Autotune => \tselected batch_size: {0}\tthreads: {1}/{2}\t{3:.1f} samples/sec".format(
+            best["batch_size"], best["intra_op_threads"], best["inter_op_threads"], best["samples_per_sec"]))
+        return best
@@ -0,0 +1,71 @@
+"""
+Run the validation of an epoch on a copy of the model in a background thread while training continues
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from dlpipe.utils.metrics import copy_metrics
+
+
+class BackgroundValidator:
+    """
+    Holds a clone of the model which receives the weights of the validated epoch. The validation runs on a single
+    background thread, thus at most one validation is in flight. The clone is only used for the validation, the
+    weights (and optimizer state) of the validated epoch are kept to be saved with the trained model.
+    """
+    def __init__(self, model, validation_fn: Callable):
+        """
+        :param model: compiled keras model that is trained
+        :param validation_fn: function taking a model and returning the validation results
+        """
+        from keras.models import clone_model
+        self.model = clone_model(model)
+        # stateful metrics hold their own counts, the clone needs separate instances to not mix them with training
+        metrics = copy_metrics(getattr(model, "metrics", None) or [])
+        optimizer = model.optimizer.__class__.from_config(model.optimizer.get_config())
+        self.model.compile(optimizer=optimizer, loss=model.loss, metrics=metrics)
+        if hasattr(self.model, "_make_test_function"):
+            # keras builds its test function lazily, building it in the background thread breaks the tf graph
+            self.model._make_test_function()
+        self._validation_fn = validation_fn
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._future = None
+        self.epoch = None
+        self.batch = None
+        self.weights = None
+        self.optimizer_weights = None
+
+    @property
+    def pending(self) -> bool:
+        return self._future is not None
+
+    def done(self) -> bool:
+        return self._future is not None and self._future.done()
+
+    def submit(self, epoch: int, batch: int, weights: list, optimizer_weights: list = None):
+        """
+        Start the validation for an epoch, the previous validation must be collected first
+        :param epoch: epoch of the weights
+        :param batch: last batch of the epoch
+        :param weights: weights of the model at the end of the epoch (model.get_weights())
+        :param optimizer_weights: optimizer state at the end of the epoch (model.optimizer.get_weights())
+        """
+        assert self._future is None, "collect the previous validation first"
+        self.model.set_weights(weights)
+        self.epoch = epoch
+        self.batch = batch
+        self.weights = weights
+        self.optimizer_weights = optimizer_weights
+        self._future = self._executor.submit(self._validation_fn, self.model)
+
+    def collect(self):
+        """
+        Wait for the running validation
+        :return: epoch, last batch of the epoch, validation results (the weights of the epoch stay in self.weights and
+                 self.optimizer_weights)
+        """
+        results = self._future.result()
+        self._future = None
+        return self.epoch, self.batch, results
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -1,2 +1,5 @@
 from .callback import Callback
+from .dispatcher import CallbackDispatcher
 from .save_exp_mongodb import SaveExpMongoDB
+from .memory_profiler import MemoryProfiler
+from .early_stopping import EarlyStopping
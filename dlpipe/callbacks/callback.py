@@ -2,6 +2,12 @@ from dlpipe.result import Result
 
 
 class Callback:
+    # if True, the CallbackDispatcher runs the hooks of this callback on a background thread and passes an immutable
+    # ResultSnapshot instead of the live Result
+    run_async: bool = False
+    # False for callbacks that change the result (e.g. stop_training), they can not run on a snapshot
+    supports_async: bool = True
+
     def training_start(self, result: Result) -> None:
         """ function is called once the training is starting"""
 
@@ -0,0 +1,133 @@
+"""
+Dispatcher to call the hooks of all callbacks, either inline (sync) or on a background thread per callback (async)
+"""
+import threading
+import queue
+from typing import List
+from dlpipe.result import Result
+from dlpipe.utils import DLPipeLogger
+
+
+class _AsyncWorker:
+    """ Background thread with a bounded queue that calls the hooks of exactly one callback in order """
+    def __init__(self, callback, queue_size: int, on_full: str):
+        self.callback = callback
+        self.on_full = on_full
+        self.nb_dropped = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="dlpipe-callback-" + type(callback).__name__)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            hook_name, result = self._queue.get()
+            try:
+                if hook_name is not None:
+                    getattr(self.callback, hook_name)(result)
+            except Exception as err:
+                DLPipeLogger.logger.error("Callback {0}.{1} failed: {2}".format(
+                    type(self.callback).__name__, hook_name, str(err)))
+                if self.error is None:
+                    self.error = err
+            finally:
+                self._queue.task_done()
+            if hook_name is None:
+                break
+
+    def put(self, hook_name: str, result):
+        # only batch events are dropped, epoch and training events are needed to e.g. save checkpoints
+        if self.on_full == "drop" and hook_name == "batch_end":
+            try:
+                self._queue.put_nowait((hook_name, result))
+            except queue.Full:
+                self.nb_dropped += 1
+        else:
+            self._queue.put((hook_name, result))
+
+    def drain(self):
+        self._queue.join()
+
+    def stop(self):
+        self._queue.put((None, None))
+        self._thread.join()
+
+
+class CallbackDispatcher:
+    """
+    Calls the hooks of all callbacks in the order they are passed. Callbacks with run_async = True are executed on
+    their own background thread (hooks of one callback are always called in order) and receive a ResultSnapshot,
+    callbacks that change the result (supports_async = False) are rejected.
+    For training_start and epoch_end the snapshot holds a copy of the weights, thus checkpoints saved in the background
+    match the epoch of the snapshot even though training continues.
+    """
+    HOOKS = ["training_start", "training_end", "epoch_end", "batch_end", "test_start", "test_end"]
+    # hooks after which callbacks usually save the weights, their snapshots hold a copy of the weights
+    WEIGHT_HOOKS = ["training_start", "epoch_end"]
+
+    def __init__(self, callbacks: List[any] = None, queue_size: int = 100, on_full: str = "block"):
+        """
+        :param callbacks: list of Callback instances
+        :param queue_size: maximum number of pending events per async callback
+        :param on_full: what to do with a batch_end event if the queue of an async callback is full,
+                        "block" waits for the callback to catch up, "drop" skips the event
+        """
+        if on_full not in ["block", "drop"]:
+            raise ValueError("on_full must be any of ['block', 'drop']")
+        for cb in callbacks or []:
+            if getattr(cb, "run_async", False) and not getattr(cb, "supports_async", True):
+                raise ValueError("{0} changes the result and can not run async".format(type(cb).__name__))
+        self.callbacks = callbacks if callbacks is not None else []
+        self._queue_size = queue_size
+        self._on_full = on_full
+        self._workers = {}
+
+    def _get_worker(self, cb) -> _AsyncWorker:
+        worker = self._workers.get(id(cb))
+        if worker is None:
+            worker = _AsyncWorker(cb, self._queue_size, self._on_full)
+            self._workers[id(cb)] = worker
+        return worker
+
+    def dispatch(self, hook_name: str, result: Result):
+        """
+        Call hook_name on every callback
+        :param hook_name: one of CallbackDispatcher.HOOKS
+        :param result: the live Result instance of the Trainer
+        """
+        assert hook_name in CallbackDispatcher.HOOKS
+        snapshot = None
+        for cb in self.callbacks:
+            if getattr(cb, "run_async", False):
+                if snapshot is None:
+                    snapshot = result.snapshot(with_weights=hook_name in CallbackDispatcher.WEIGHT_HOOKS)
+                self._get_worker(cb).put(hook_name, snapshot)
+            else:
+                getattr(cb, hook_name)(result)
+
+        if hook_name in ["training_end", "test_end"]:
+            self.drain()
+
+    def drain(self):
+        """ Wait until all async callbacks processed their pending events, raises the first error that occurred """
+        for worker in self._workers.values():
+            worker.drain()
+            if worker.nb_dropped > 0:
+                DLPipeLogger.logger.warning("Dropped {0} batch_end events of callback {1}".format(
+                    worker.nb_dropped, type(worker.callback).__name__))
+                worker.nb_dropped = 0
+        for worker in self._workers.values():
+            if worker.error is not None:
+                err = worker.error
+                worker.error = None
+                raise err
+
+    def close(self):
+        """ Drain and stop all background threads """
+        try:
+            self.drain()
+        finally:
+            for worker in self._workers.values():
+                worker.stop()
+            self._workers = {}
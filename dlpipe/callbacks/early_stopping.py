@@ -0,0 +1,77 @@
+from dlpipe.callbacks import Callback
+from dlpipe.utils import DLPipeLogger
+
+
+class EarlyStopping(Callback):
+    """
+    Callback class to stop training once a monitored metric stopped improving. The best epoch is tracked in
+    result.best_epoch, which SaveExpMongoDB stores as "best_weights_index" in the experiment e.g.:
+
+    >> early_stopping = EarlyStopping(monitor="loss", patience=3)
+    >> trainer = Trainer(model=model, data_reader=data_reader, callbacks=[early_stopping, mongo_db_cb])
+
+    """
+    # sets result.stop_training and result.best_epoch, which the Trainer and SaveExpMongoDB need right away
+    supports_async = False
+
+    def __init__(
+            self,
+            monitor: str="loss",
+            phase: str="validation",
+            min_delta: float=0.0,
+            patience: int=5,
+            mode: str="min"):
+        """
+        :param monitor: name of the metric that is monitored
+        :param phase: phase of the monitored metric, usually "validation"
+        :param min_delta: minimum change of the metric to count as improvement
+        :param patience: number of epochs without improvement after which training is stopped
+        :param mode: "min" if lower values are better (e.g. loss), "max" if higher values are better (e.g. acc)
+        """
+        if mode not in ["min", "max"]:
+            raise ValueError("mode must be any of ['min', 'max']")
+        self._monitor = monitor
+        self._phase = phase
+        self._min_delta = abs(min_delta)
+        self._patience = patience
+        self._mode = mode
+        self._wait = 0
+
+    def _is_improvement(self, value: float, best_value: float) -> bool:
+        if best_value is None:
+            return True
+        if self._mode == "min":
+            return value < best_value - self._min_delta
+        return value > best_value + self._min_delta
+
+    def _get_epoch_value(self, result):
+        """ :return: latest value of the monitored metric for the current epoch, None if there is none """
+        values = result.metrics[self._phase].get(self._monitor, [])
+        for entry in reversed(values):
+            if entry["epoch"] == result.curr_epoch:
+                return entry["value"]
+        return None
+
+    def training_start(self, result):
+        self._wait = 0
+        result.best_epoch = None
+        result.best_value = None
+        result.stop_training = False
+
+    def epoch_end(self, result):
+        value = self._get_epoch_value(result)
+        if value is None:
+            DLPipeLogger.logger.warning("EarlyStopping: no {0} {1} value for epoch {2}".format(
+                self._phase, self._monitor, result.curr_epoch))
+            return
+
+        if self._is_improvement(value, result.best_value):
+            result.best_value = value
+            result.best_epoch = result.curr_epoch
+            self._wait = 0
+        else:
+            self._wait += 1
+            if self._wait >= self._patience:
+                result.stop_training = True
+                DLPipeLogger.logger.info("EarlyStopping: {0} {1} did not improve for {2} epochs, best epoch: {3}"
+                                         .format(self._phase, self._monitor, self._wait, result.best_epoch))
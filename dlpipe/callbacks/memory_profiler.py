@@ -0,0 +1,107 @@
+import tracemalloc
+from dlpipe.callbacks import Callback
+from dlpipe.utils import DLPipeLogger
+from dlpipe.utils.memory import get_rss_bytes
+
+
+class MemoryProfiler(Callback):
+    """
+    Callback class to sample the process RSS and tracemalloc snapshots during training. Consecutive snapshots are
+    compared to find the code locations with the largest allocation growth. A compact summary of each sample is
+    appended to result.memory_profile, put this callback before SaveExpMongoDB to save it with the experiment e.g.:
+
+    >> trainer = Trainer(model=model, data_reader=data_reader, callbacks=[MemoryProfiler(), mongo_db_cb])
+
+    """
+    # adds the samples to result.memory_profile
+    supports_async = False
+
+    def __init__(
+            self,
+            epoch_interval: int=1,
+            batch_interval: int=None,
+            top_n: int=10,
+            nb_frames: int=1,
+            trace_allocations: bool=True):
+        """
+        :param epoch_interval: sample every n epochs, None to disable epoch samples
+        :param batch_interval: sample every n batches, None to disable batch samples
+        :param top_n: number of allocation sites reported per sample
+        :param nb_frames: number of stack frames tracemalloc stores per allocation
+        :param trace_allocations: if False only the RSS is sampled (tracemalloc slows down allocations)
+        """
+        self._epoch_interval = epoch_interval
+        self._batch_interval = batch_interval
+        self._top_n = top_n
+        self._nb_frames = nb_frames
+        self._trace_allocations = trace_allocations
+        self._started_tracing = False
+        self._last_snapshot = None
+        self._batch_counter = 0
+
+    def _take_snapshot(self):
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    def _sample(self, result, trigger: str):
+        entry = {
+            "trigger": trigger,
+            "epoch": result.curr_epoch,
+            "batch": result.curr_batch,
+            "rss_mb": get_rss_bytes() / 1024 / 1024
+        }
+        display = "Memory => \tEpoch: {0}\tRSS: {1:.1f}MB\t".format(result.curr_epoch, entry["rss_mb"])
+
+        if self._trace_allocations and tracemalloc.is_tracing():
+            traced, traced_peak = tracemalloc.get_traced_memory()
+            entry["traced_mb"] = traced / 1024 / 1024
+            entry["traced_peak_mb"] = traced_peak / 1024 / 1024
+            display += "traced: {0:.1f}MB (peak {1:.1f}MB)".format(entry["traced_mb"], entry["traced_peak_mb"])
+
+            snapshot = self._take_snapshot()
+            top_growth = []
+            if self._last_snapshot is not None:
+                for stat in snapshot.compare_to(self._last_snapshot, "lineno")[:self._top_n]:
+                    frame = stat.traceback[0]
+                    top_growth.append({
+                        "location": "{0}:{1}".format(frame.filename, frame.lineno),
+                        "size_diff_kb": stat.size_diff / 1024,
+                        "size_kb": stat.size / 1024,
+                        "count_diff": stat.count_diff
+                    })
+            entry["top_growth"] = top_growth
+            # only the last snapshot is kept, it is needed for the next diff
+            self._last_snapshot = snapshot
+
+            for growth in top_growth[:3]:
+                display += "\n\t{0:+.1f}KB\t{1}".format(growth["size_diff_kb"], growth["location"])
+
+        result.add_memory_sample(entry)
+        DLPipeLogger.logger.info(display)
+
+    def training_start(self, result):
+        if self._trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start(self._nb_frames)
+            self._started_tracing = True
+        self._batch_counter = 0
+        self._sample(result, "training_start")
+
+    def batch_end(self, result):
+        self._batch_counter += 1
+        if self._batch_interval is not None and self._batch_counter % self._batch_interval == 0:
+            self._sample(result, "batch_end")
+
+    def epoch_end(self, result):
+        if self._epoch_interval is not None and (result.curr_epoch + 1) % self._epoch_interval == 0:
+            self._sample(result, "epoch_end")
+
+    def training_end(self, result):
+        self._sample(result, "training_end")
+        self._last_snapshot = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
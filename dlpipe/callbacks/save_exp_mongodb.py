@@ -11,6 +11,8 @@ class SaveExpMongoDB(Callback):
     >> callback = SaveExpMongoDB(model_db, "my_model_name", model.get_config())
     >> trainer = Trainer(model=model, data_reader=data_reader, callbacks=[callback])
 
+    With run_async=True the database updates do not block training. The weights of each epoch are copied when the
+    epoch ends (ResultSnapshot.weights) and saved from that copy, thus the checkpoint matches its epoch.
     """
     def __init__(
             self,
@@ -18,7 +20,21 @@ class SaveExpMongoDB(Callback):
             name,
             keras_model,
             save_initial_weights: bool=True,
-            epoch_save_condition=None):
+            epoch_save_condition=None,
+            run_async: bool=False,
+            parent_id=None,
+            config: dict=None):
+        """
+        :param mongo_db: pymongo database the experiment is saved to
+        :param name: name of the experiment
+        :param keras_model: keras model config (model.get_config())
+        :param save_initial_weights: save the weights before training as first entry of the weights list
+        :param epoch_save_condition: function taking the result, weights are only saved after an epoch if it is True
+        :param run_async: run the database updates on a background thread
+        :param parent_id: id of a linked parent experiment (e.g. the sweep or the experiment it is fine tuned from)
+        :param config: dict of hyperparameters or settings that are saved with the experiment
+        """
+        self.run_async = run_async
         self._epoch_save_condition = epoch_save_condition
         self._save_initial_weights = save_initial_weights
         self._db = mongo_db
@@ -26,11 +42,21 @@ class SaveExpMongoDB(Callback):
         self._keras_model = keras_model
         self._exp = ExperimentSchema(self._collection, name, keras_model)
         self._exp.log_file_path = DLPipeLogger.get_log_file_path()
+        self._exp.parent_id = parent_id
+        self._exp.config = config
         self._exp.save()
 
     def get_exp_id(self):
         return self._exp.id
 
+    def set_summary(self, summary: dict):
+        """
+        Save aggregated results with the experiment, e.g. evaluations that are done after training
+        :param summary: dict that is saved as "summary" of the experiment
+        """
+        self._exp.summary = summary
+        self._exp.update(update_result=False)
+
     def training_start(self, result):
         self._exp.result = result
         self._exp.status = 100
@@ -0,0 +1,139 @@
+"""
+Access to the model checkpoints (weights) of experiments saved with the SaveExpMongoDB callback
+"""
+import io
+import json
+import gridfs
+from bson import ObjectId
+from pymongo.database import Database
+from dlpipe.utils.metrics import link_metrics
+
+
+def get_checkpoint(mongo_db: Database, exp_id, index: int = None) -> dict:
+    """
+    :param mongo_db: pymongo database the experiments are saved in
+    :param exp_id: id of the experiment
+    :param index: index in the "weights" list of the experiment, if None the best weights (tracked by EarlyStopping)
+                  or the latest weights in case the experiment has no best weights
+    :return: dict with keys [exp_id, index, model_gridfs, epoch, batch, config]
+    """
+    exp_obj = mongo_db["experiment"].find_one({"_id": ObjectId(exp_id)},
+                                              {"weights": 1, "best_weights_index": 1, "config": 1})
+    if exp_obj is None:
+        raise ValueError("Experiment {0} does not exist".format(exp_id))
+    if len(exp_obj["weights"]) == 0:
+        raise ValueError("Experiment {0} has no saved weights".format(exp_id))
+    if index is None:
+        index = exp_obj.get("best_weights_index")
+        index = len(exp_obj["weights"]) - 1 if index is None else index
+    entry = exp_obj["weights"][index]
+    return {
+        "exp_id": exp_obj["_id"],
+        "index": index if index >= 0 else len(exp_obj["weights"]) + index,
+        "model_gridfs": entry["model_gridfs"],
+        "epoch": entry["epoch"],
+        "batch": entry["batch"],
+        "config": exp_obj.get("config")
+    }
+
+
+def read_checkpoint_bytes(mongo_db: Database, checkpoint: dict) -> bytes:
+    """
+    :return: the saved keras model as h5 file content
+    """
+    fs = gridfs.GridFS(mongo_db)
+    return fs.get(checkpoint["model_gridfs"]).read()
+
+
+def _metric_placeholder(name: str):
+    """ stands in for a custom metric function which is not known, the model is only compiled to be loaded """
+    def placeholder(y_true, y_pred):
+        from keras import backend as K
+        return K.constant(0.0)
+    placeholder.__name__ = name
+    return placeholder
+
+
+def resolve_custom_objects(h5_file, custom_objects: dict = None) -> (dict, bool):
+    """
+    Find the custom metrics of the training config of a saved model that are not in custom_objects and not known
+    to keras. Unknown metric functions get placeholders. Keras can not compile the serialized config of a metric layer
+    (stateful metrics are saved as {"class_name", "config"}), each one is replaced in the training config by a unique
+    name that maps to a new instance of the metric, thus the h5 file must be writable if the model has metric layers.
+    The new instances are linked again (see dlpipe.utils.metrics.link_metrics()).
+    :param h5_file: opened h5py file of the saved model
+    :param custom_objects: known custom objects
+    :return: custom objects including placeholders and metric instances, False if the model can not be compiled
+             (unknown metric classes)
+    """
+    from keras import metrics as keras_metrics
+    custom_objects = dict(custom_objects or {})
+    training_config = h5_file.attrs.get("training_config")
+    if training_config is None:
+        return custom_objects, False
+    if hasattr(training_config, "decode"):
+        training_config = training_config.decode("utf-8")
+    training_config = json.loads(training_config)
+    can_compile = True
+    metric_layers = []
+
+    def resolve(metric):
+        nonlocal can_compile
+        if isinstance(metric, dict):
+            # serialized metric layer
+            metric_class = custom_objects.get(metric.get("class_name"))
+            if metric_class is None:
+                can_compile = False
+                return metric
+            # the metric names (e.g. "p") may be the names of custom metric functions, the key must not collide
+            key = "{0}:{1}".format(metric["class_name"], metric["config"].get("name"))
+            custom_objects[key] = metric_class.from_config(metric["config"])
+            metric_layers.append(custom_objects[key])
+            return key
+        if metric not in custom_objects and metric not in ["accuracy", "acc", "crossentropy", "ce"]:
+            try:
+                keras_metrics.get(metric)
+            except ValueError:
+                custom_objects[metric] = _metric_placeholder(metric)
+        return metric
+
+    metrics = training_config.get("metrics") or []
+    if isinstance(metrics, dict):
+        resolved = {output: [resolve(m) for m in output_metrics] for output, output_metrics in metrics.items()}
+    else:
+        resolved = [resolve(m) for m in metrics]
+    link_metrics(metric_layers)
+    if can_compile and resolved != metrics:
+        training_config["metrics"] = resolved
+        h5_file.attrs["training_config"] = json.dumps(training_config).encode("utf-8")
+    return custom_objects, can_compile
+
+
+def load_model_from_bytes(h5_bytes: bytes, custom_objects: dict = None, compile: bool = True):
+    """
+    Load a keras model from the content of a h5 file without writing it to disk
+    :param h5_bytes: content of the h5 file saved by model.save()
+    :param custom_objects: custom metrics or layers used by the model, unknown metric functions are replaced by
+                           placeholders (see resolve_custom_objects())
+    :param compile: compile the model (restores the optimizer state), not needed for predictions only
+    :return: keras model
+    """
+    import h5py
+    from keras.models import load_model
+    # the in memory copy is opened writable, resolve_custom_objects() may rewrite the training config
+    with h5py.File(io.BytesIO(h5_bytes), "r+" if compile else "r") as h5_file:
+        if compile:
+            custom_objects, compile = resolve_custom_objects(h5_file, custom_objects)
+        return load_model(h5_file, custom_objects=custom_objects, compile=compile)
+
+
+def load_checkpoint_model(mongo_db: Database, checkpoint: dict, custom_objects: dict = None, compile: bool = True):
+    """
+    Load the keras model (architecture, weights and optimizer state) of a checkpoint
+    :param mongo_db: pymongo database the experiments are saved in
+    :param checkpoint: checkpoint dict (see get_checkpoint())
+    :param custom_objects: custom metrics or layers used by the model
+    :param compile: compile the model, not needed for predictions only
+    :return: keras model
+    """
+    return load_model_from_bytes(read_checkpoint_bytes(mongo_db, checkpoint), custom_objects, compile)
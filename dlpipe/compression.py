@@ -0,0 +1,194 @@
+"""
+Compression of dense keras models: magnitude pruning with structured removal of dead units and distillation of a
+teacher into a smaller student. The dense layers are handled as numpy weights and rebuilt as a smaller keras model,
+the results are compared with the teacher by accuracy, latency and size.
+"""
+import os
+import tempfile
+import time
+import numpy as np
+from typing import List
+from dlpipe.data_reader.array_reader import ArrayReader
+from dlpipe.numpy_engine import ACTIVATIONS
+
+# layers without weights that do nothing at inference time (see dlpipe.export)
+_SKIPPED_LAYERS = ["InputLayer", "Dropout", "GaussianNoise", "GaussianDropout", "AlphaDropout"]
+
+
+def dense_layers(model) -> List[dict]:
+    """
+    :param model: keras model that is a linear chain of dense layers (dropout layers are ignored)
+    :return: list of {"kernel", "bias", "activation"} of the dense layers, copies of the weights
+    """
+    layers = []
+    for layer in model.layers:
+        class_name = layer.__class__.__name__
+        if class_name in _SKIPPED_LAYERS:
+            continue
+        if class_name != "Dense":
+            raise ValueError("Layer type {0} is not supported".format(class_name))
+        weights = layer.get_weights()
+        kernel = np.array(weights[0], dtype=np.float32)
+        bias = np.array(weights[1], dtype=np.float32) if len(weights) > 1 else np.zeros(kernel.shape[1], np.float32)
+        layers.append({"kernel": kernel, "bias": bias, "activation": layer.get_config()["activation"]})
+    return layers
+
+
+def build_dense_model(layers: List[dict], dropout: tuple = None):
+    """
+    :param layers: list of {"kernel", "bias", "activation"}, see dense_layers()
+    :param dropout: optional dropout rate after each hidden layer (for fine tuning)
+    :return: keras model (not compiled) with the given weights
+    """
+    from keras.layers import Dense, Dropout, Input
+    from keras.models import Model
+    inputs = Input(shape=(layers[0]["kernel"].shape[0],))
+    x = inputs
+    dense = []
+    for i, layer in enumerate(layers):
+        dense.append(Dense(layer["kernel"].shape[1], activation=layer["activation"]))
+        x = dense[-1](x)
+        if dropout is not None and i < len(layers) - 1 and dropout[i] > 0:
+            x = Dropout(dropout[i])(x)
+    model = Model(inputs=[inputs], outputs=[x])
+    for keras_layer, layer in zip(dense, layers):
+        keras_layer.set_weights([layer["kernel"], layer["bias"]])
+    return model
+
+
+def magnitude_prune(layers: List[dict], sparsity: float) -> List[dict]:
+    """
+    Set the fraction sparsity of the remaining (non zero) weights with the smallest magnitude of each kernel to zero.
+    There is no mask while fine tuning, the zeroed weights are trained again. Only the structured part survives:
+    units that lost all incoming or outgoing weights are removed by remove_dead_units().
+    :return: pruned copies of the layers
+    """
+    pruned = []
+    for layer in layers:
+        kernel = layer["kernel"].copy()
+        remaining = np.abs(kernel[kernel != 0])
+        if len(remaining) > 0:
+            threshold = np.quantile(remaining, sparsity)
+            kernel[np.abs(kernel) <= threshold] = 0.0
+        pruned.append(dict(layer, kernel=kernel))
+    return pruned
+
+
+def prune_units(layers: List[dict], fraction: float) -> List[dict]:
+    """
+    Structured magnitude pruning: the fraction of the units of each hidden layer with the smallest product of the
+    norms of their incoming and outgoing weights lose all incoming weights, remove_dead_units() then removes them
+    :return: pruned copies of the layers
+    """
+    pruned = [dict(layer, kernel=layer["kernel"].copy()) for layer in layers]
+    for layer, next_layer in zip(pruned[:-1], pruned[1:]):
+        scores = np.linalg.norm(layer["kernel"], axis=0) * np.linalg.norm(next_layer["kernel"], axis=1)
+        nb_pruned = int(len(scores) * fraction)
+        layer["kernel"][:, np.argsort(scores)[:nb_pruned]] = 0.0
+    return pruned
+
+
+def remove_dead_units(layers: List[dict]) -> List[dict]:
+    """
+    Remove the hidden units without incoming weights (constant output) or without outgoing weights. The constant
+    output of a removed unit is folded into the bias of the next layer, thus the predictions do not change.
+    :return: layers with smaller kernels
+    """
+    layers = [dict(layer) for layer in layers]
+    for i in range(len(layers) - 1):
+        layer = layers[i]
+        next_layer = layers[i + 1]
+        if layer["activation"] not in ACTIVATIONS or layer["activation"] == "softmax":
+            raise ValueError("Hidden activation {0} is not supported".format(layer["activation"]))
+        dead_in = ~layer["kernel"].any(axis=0)
+        dead_out = ~next_layer["kernel"].any(axis=1)
+        keep = ~(dead_in | dead_out)
+        if not keep.any():
+            keep[0] = True
+        fold = ~keep & dead_in
+        constant = ACTIVATIONS[layer["activation"]](layer["bias"][fold])
+        next_layer["bias"] = next_layer["bias"] + constant @ next_layer["kernel"][fold]
+        layer["kernel"] = layer["kernel"][:, keep]
+        layer["bias"] = layer["bias"][keep]
+        next_layer["kernel"] = next_layer["kernel"][keep]
+    return layers
+
+
+def soft_labels(teacher, x: np.ndarray, temperature: float = 1.0, batch_size: int = 1024) -> np.ndarray:
+    """
+    :param teacher: keras model with a softmax output
+    :param temperature: > 1 flattens the class distributions (same as dividing the logits by the temperature)
+    :return: class distributions of the teacher [n, nb_classes]
+    """
+    probabilities = teacher.predict(x, batch_size=batch_size).astype(np.float64)
+    if temperature != 1.0:
+        probabilities = np.power(np.maximum(probabilities, 1e-12), 1.0 / temperature)
+        probabilities /= probabilities.sum(axis=-1, keepdims=True)
+    return probabilities.astype(np.float32)
+
+
+def train_on_arrays(model, x: np.ndarray, y: np.ndarray, train_idx: np.ndarray, val_idx: np.ndarray,
+                    epochs: int, batch_size: int = 32, callbacks: list = None):
+    """
+    Train a compiled model with the Trainer on encoded arrays, e.g. fine tuning of a pruned model or training of a
+    student on soft labels (y = teacher distributions)
+    :return: the Trainer
+    """
+    from dlpipe.trainer import Trainer
+    reader = ArrayReader(x, y, train_idx, val_idx, batch_size=batch_size)
+    trainer = Trainer(model=model, data_reader=reader, callbacks=callbacks)
+    trainer.train(epochs=epochs)
+    return trainer
+
+
+def _saved_size(model) -> int:
+    """ :return: bytes of the model saved as h5 file without optimizer state """
+    file_descriptor, path = tempfile.mkstemp(suffix=".h5")
+    os.close(file_descriptor)
+    try:
+        model.save(path, include_optimizer=False)
+        return os.path.getsize(path)
+    finally:
+        os.remove(path)
+
+
+def measure_model(model, x: np.ndarray, y: np.ndarray, batch_size: int = 1024, nb_runs: int = 5) -> dict:
+    """
+    :param model: keras model
+    :param x: input data of the held out samples
+    :param y: one hot ground truth of the held out samples
+    :param batch_size: batch size of the latency measurement
+    :param nb_runs: the median latency of this many predictions of one batch is taken
+    :return: dict with accuracy, latency of a batch in ms, number of parameters and saved size in bytes
+    """
+    predictions = model.predict(x, batch_size=batch_size)
+    batch = x[:batch_size]
+    model.predict(batch, batch_size=batch_size)  # warm up
+    timings = []
+    for _ in range(nb_runs):
+        start = time.perf_counter()
+        model.predict(batch, batch_size=batch_size)
+        timings.append(time.perf_counter() - start)
+    return {
+        "accuracy": float(np.mean(predictions.argmax(axis=-1) == y.argmax(axis=-1))),
+        "latency_ms": float(np.median(timings) * 1000),
+        "latency_batch_size": int(len(batch)),
+        "nb_params": int(model.count_params()),
+        "size_bytes": _saved_size(model)
+    }
+
+
+def compare_to_teacher(teacher_stats: dict, stats: dict) -> dict:
+    """
+    :param teacher_stats: measure_model() of the teacher
+    :param stats: measure_model() of the compressed model
+    :return: summary with both measurements, the speedup, size ratio and accuracy difference
+    """
+    return {
+        "teacher": teacher_stats,
+        "model": stats,
+        "speedup": teacher_stats["latency_ms"] / stats["latency_ms"] if stats["latency_ms"] > 0 else None,
+        "size_ratio": stats["size_bytes"] / teacher_stats["size_bytes"],
+        "params_ratio": stats["nb_params"] / teacher_stats["nb_params"],
+        "accuracy_delta": stats["accuracy"] - teacher_stats["accuracy"]
+    }
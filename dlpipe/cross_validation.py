@@ -0,0 +1,205 @@
+"""
+k-fold cross validation: the data is read and encoded once, stored in shared memory and the folds are trained in
+parallel worker processes which read the arrays without copying them
+"""
+import multiprocessing
+import numpy as np
+from typing import Callable, List
+from pymongo.collection import Collection
+from dlpipe.callbacks import SaveExpMongoDB
+from dlpipe.data_reader.array_reader import ArrayReader
+from dlpipe.data_reader.mongodb import MongoDBConnect, MongoDBActions
+from dlpipe.schemas import ExperimentSchema
+from dlpipe.utils import DLPipeLogger
+from dlpipe.utils.tf_config import limit_threads
+
+
+def load_arrays(collection: Collection, processors: List[any], query: dict = None) -> (np.ndarray, np.ndarray):
+    """
+    Read all documents of a collection and encode them with the processors
+    :param collection: pymongo collection
+    :param processors: list of processors (same as for the data readers)
+    :param query: optional filter for the documents
+    :return: input data as float32 array [n_samples, n_features], ground truth as float32 array [n_samples, ...]
+    """
+    batch_x = []
+    batch_y = []
+    for raw_data in collection.find({} if query is None else query):
+        input_data = None
+        ground_truth = None
+        piped_params = {}
+        for processor in processors:
+            raw_data, input_data, ground_truth, piped_params = processor.process(raw_data, input_data, ground_truth,
+                                                                                 piped_params=piped_params)
+        batch_x.append(input_data)
+        batch_y.append(ground_truth)
+    return np.asarray(batch_x, dtype=np.float32), np.asarray(batch_y, dtype=np.float32)
+
+
+def create_folds(nb_samples: int, k: int, seed: int = None) -> List[np.ndarray]:
+    """
+    :return: list of k disjoint index arrays covering all samples
+    """
+    permutation = np.random.RandomState(seed).permutation(nb_samples)
+    return [np.sort(fold) for fold in np.array_split(permutation, k)]
+
+
+def _to_shared(array: np.ndarray, context):
+    shared = context.RawArray("f", int(array.size))
+    np.frombuffer(shared, dtype=np.float32)[:] = array.ravel()
+    return shared
+
+
+_shared_data = {}
+
+
+def _init_worker(x_shared, x_shape, y_shared, y_shape, config_file, intra_op_threads, inter_op_threads):
+    limit_threads(intra_op_threads, inter_op_threads)
+    if config_file is not None:
+        MongoDBActions.add_config(config_file)
+    # views on the shared memory, the arrays are never copied into the worker
+    _shared_data["x"] = np.frombuffer(x_shared, dtype=np.float32).reshape(x_shape)
+    _shared_data["y"] = np.frombuffer(y_shared, dtype=np.float32).reshape(y_shape)
+
+
+def _train_fold(fold: int, train_idx: np.ndarray, val_idx: np.ndarray, settings: dict) -> dict:
+    model = settings["build_fn"]()
+    reader = ArrayReader(_shared_data["x"], _shared_data["y"], train_idx, val_idx, batch_size=settings["batch_size"])
+
+    model_db = MongoDBConnect.get_db(settings["connection"], settings["db_name"])
+    mongo_db_cb = SaveExpMongoDB(model_db, settings["name"] + "_fold_" + str(fold), model.get_config(),
+                                 parent_id=settings["parent_id"], config={"fold": fold, "k": settings["k"]})
+    callbacks = []
+    if settings["callbacks_fn"] is not None:
+        callbacks = settings["callbacks_fn"](model)
+    from dlpipe.trainer import Trainer
+    trainer = Trainer(model=model, data_reader=reader, callbacks=callbacks + [mongo_db_cb])
+    trainer.train(epochs=settings["epochs"])
+
+    # metrics of the best epoch if it is tracked (EarlyStopping) otherwise of the last epoch
+    result = trainer.result
+    epoch = result.best_epoch if result.best_epoch is not None else result.curr_epoch
+    metrics = {}
+    for name, values in result.metrics["validation"].items():
+        for entry in values:
+            if entry["epoch"] == epoch:
+                metrics[name] = entry["value"]
+    return {"fold": fold, "exp_id": mongo_db_cb.get_exp_id(), "epoch": epoch, "metrics": metrics}
+
+
+class CrossValidationRunner:
+    """
+    Train k models on k folds in parallel and aggregate their validation metrics into one parent experiment e.g.:
+
+    >> runner = CrossValidationRunner(build_model, x, y, k=5, config_file="./connections.ini",
+    >>                                connection="localhost_mongo_db")
+    >> summary = runner.run()
+
+    build_fn() returns a compiled model and callbacks_fn(model) additional callbacks (e.g. EarlyStopping), both must be
+    defined on module level. Each fold is saved as experiment linked to the parent experiment by parent_id.
+    """
+    def __init__(self,
+                 build_fn: Callable,
+                 x: np.ndarray,
+                 y: np.ndarray,
+                 k: int = 5,
+                 config_file: str = None,
+                 connection: str = None,
+                 db_name: str = "models",
+                 name: str = "cross_validation",
+                 epochs: int = 30,
+                 batch_size: int = 32,
+                 callbacks_fn: Callable = None,
+                 nb_workers: int = None,
+                 intra_op_threads: int = 1,
+                 inter_op_threads: int = 1,
+                 seed: int = None):
+        """
+        :param build_fn: function returning the compiled keras model
+        :param x: encoded input data of all samples (see load_arrays())
+        :param y: encoded ground truth of all samples
+        :param k: number of folds
+        :param config_file: path to the connections .ini file, loaded in each worker process
+        :param connection: name of the MongoDB connection the experiments are saved to
+        :param db_name: name of the database experiments are saved to
+        :param name: name of the parent experiment, folds are named <name>_fold_<index>
+        :param epochs: maximum number of epochs per fold
+        :param batch_size: training batch size
+        :param callbacks_fn: function taking the model and returning a list of additional callbacks
+        :param nb_workers: number of parallel worker processes, defaults to k
+        :param intra_op_threads: TensorFlow intra op threads per worker
+        :param inter_op_threads: TensorFlow inter op threads per worker
+        :param seed: random seed for the fold assignment
+        """
+        self._build_fn = build_fn
+        self._x = x
+        self._y = y
+        self._k = k
+        self._config_file = config_file
+        self._connection = connection
+        self._db_name = db_name
+        self._name = name
+        self._epochs = epochs
+        self._batch_size = batch_size
+        self._callbacks_fn = callbacks_fn
+        self._nb_workers = k if nb_workers is None else nb_workers
+        self._intra_op_threads = intra_op_threads
+        self._inter_op_threads = inter_op_threads
+        self._seed = seed
+
+    def run(self) -> dict:
+        """
+        :return: summary dict with the results of each fold and mean and std of each validation metric
+        """
+        folds = create_folds(len(self._x), self._k, self._seed)
+
+        collection = MongoDBConnect.get_collection(self._connection, self._db_name, "experiment")
+        parent_exp = ExperimentSchema(collection, self._name, None)
+        parent_exp.config = {"type": "cross_validation", "k": self._k, "nb_samples": len(self._x),
+                             "epochs": self._epochs, "batch_size": self._batch_size, "seed": self._seed}
+        parent_exp.status = 100
+        parent_exp.save()
+
+        settings = {
+            "build_fn": self._build_fn,
+            "callbacks_fn": self._callbacks_fn,
+            "connection": self._connection,
+            "db_name": self._db_name,
+            "name": self._name,
+            "parent_id": parent_exp.id,
+            "k": self._k,
+            "epochs": self._epochs,
+            "batch_size": self._batch_size
+        }
+
+        context = multiprocessing.get_context("spawn")
+        x_shared = _to_shared(self._x, context)
+        y_shared = _to_shared(self._y, context)
+        DLPipeLogger.logger.info("Start {0}-fold cross validation on {1} workers".format(self._k, self._nb_workers))
+        pool = context.Pool(self._nb_workers, initializer=_init_worker, maxtasksperchild=1,
+                            initargs=(x_shared, self._x.shape, y_shared, self._y.shape, self._config_file,
+                                      self._intra_op_threads, self._inter_op_threads))
+        try:
+            pending = []
+            for fold, val_idx in enumerate(folds):
+                train_idx = np.concatenate([f for i, f in enumerate(folds) if i != fold])
+                pending.append(pool.apply_async(_train_fold, (fold, train_idx, val_idx, settings)))
+            fold_results = [p.get() for p in pending]
+        finally:
+            pool.close()
+            pool.join()
+
+        metric_names = sorted(set(name for r in fold_results for name in r["metrics"]))
+        mean = {}
+        std = {}
+        for name in metric_names:
+            values = np.asarray([r["metrics"][name] for r in fold_results if name in r["metrics"]])
+            mean[name] = float(np.mean(values))
+            std[name] = float(np.std(values))
+            DLPipeLogger.logger.info("Cross validation => \t{0}: {1:.4f} +/- {2:.4f}".format(name, mean[name],
+                                                                                          std[name]))
+
+        parent_exp.summary = {"folds": fold_results, "mean": mean, "std": std}
+        parent_exp.status = 2
+        parent_exp.update(update_result=False)
+        return parent_exp.summary
@@ -0,0 +1,302 @@
+"""
+Data parallel training on one machine: N worker processes train on disjoint shards of the training data and average
+their weights through shared memory every few batches. Rank 0 runs validation and owns the callbacks.
+"""
+import math
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+import numpy as np
+from typing import Callable, List
+from dlpipe.callbacks import Callback
+from dlpipe.data_reader.mongodb import MongoDBActions
+from dlpipe.utils import DLPipeLogger
+from dlpipe.utils.tf_config import limit_threads
+
+
+def _wait(barrier, timeout: float):
+    """ wait for all workers, fails instead of blocking forever if a worker died (barrier aborted) or hangs """
+    try:
+        barrier.wait(timeout)
+    except threading.BrokenBarrierError:
+        raise RuntimeError("Synchronisation with the other workers failed, a worker stopped or timed out")
+
+
+class _WeightSync:
+    """ allreduce (average) of the model weights over a shared memory buffer with one row per worker """
+    def __init__(self, rank: int, nb_workers: int, shared_buffer, barrier, timeout: float):
+        self.rank = rank
+        self.nb_workers = nb_workers
+        self._barrier = barrier
+        self._timeout = timeout
+        self._buffer = np.frombuffer(shared_buffer, dtype=np.float32).reshape(nb_workers, -1)
+
+    @staticmethod
+    def _flatten(weights: list) -> np.ndarray:
+        return np.concatenate([w.ravel() for w in weights])
+
+    @staticmethod
+    def _unflatten(flat: np.ndarray, like: list) -> list:
+        weights = []
+        offset = 0
+        for w in like:
+            weights.append(flat[offset:offset + w.size].reshape(w.shape).astype(w.dtype))
+            offset += w.size
+        return weights
+
+    def average(self, model):
+        weights = model.get_weights()
+        self._buffer[self.rank] = self._flatten(weights)
+        _wait(self._barrier, self._timeout)
+        mean = self._buffer.mean(axis=0)
+        # nobody may write the next weights before all workers read the current ones
+        _wait(self._barrier, self._timeout)
+        model.set_weights(self._unflatten(mean, weights))
+
+    def broadcast(self, model):
+        """ copy the weights of rank 0 to all other workers """
+        weights = model.get_weights()
+        if self.rank == 0:
+            self._buffer[0] = self._flatten(weights)
+        _wait(self._barrier, self._timeout)
+        if self.rank != 0:
+            model.set_weights(self._unflatten(self._buffer[0].copy(), weights))
+        _wait(self._barrier, self._timeout)
+
+
+class _StopSync(Callback):
+    """ shares the stop_training flag of rank 0 (e.g. set by EarlyStopping) with all workers after each epoch """
+    def __init__(self, rank: int, stop_flag, barrier, timeout: float):
+        self._rank = rank
+        self._stop_flag = stop_flag
+        self._barrier = barrier
+        self._timeout = timeout
+
+    def epoch_end(self, result):
+        if self._rank == 0:
+            self._stop_flag.value = int(result.stop_training)
+        _wait(self._barrier, self._timeout)
+        result.stop_training = bool(self._stop_flag.value)
+
+
+def _worker(rank: int, settings: dict, doc_ids: dict, shared_buffer, barrier, stop_flag, result_queue):
+    try:
+        _train_worker(rank, settings, doc_ids, shared_buffer, barrier, stop_flag, result_queue)
+    except Exception:
+        # release the workers waiting for this one, they fail instead of blocking forever
+        barrier.abort()
+        result_queue.put({"rank": rank, "error": traceback.format_exc()})
+
+
+def _train_worker(rank: int, settings: dict, doc_ids: dict, shared_buffer, barrier, stop_flag, result_queue):
+    limit_threads(settings["intra_op_threads"], settings["inter_op_threads"])
+    if settings["config_file"] is not None:
+        MongoDBActions.add_config(settings["config_file"])
+    from dlpipe.trainer import Trainer
+
+    class _WorkerTrainer(Trainer):
+        def __init__(self, sync: _WeightSync, sync_every: int, **kwargs):
+            super().__init__(**kwargs)
+            self._sync = sync
+            self._sync_every = sync_every
+            self.nb_steps = 0
+            self.nb_samples = 0
+
+        def _on_batch_trained(self, nb_samples, epoch_finished):
+            self.nb_steps += 1
+            self.nb_samples += nb_samples
+            # all shards have the same size, thus all workers reach the epoch end at the same step
+            if epoch_finished or self.nb_steps % self._sync_every == 0:
+                self._sync.average(self.model)
+
+    model = settings["build_fn"]()
+    reader = settings["reader_fn"](doc_ids)
+    sync = _WeightSync(rank, settings["nb_workers"], shared_buffer, barrier, settings["sync_timeout"])
+    sync.broadcast(model)
+
+    callbacks = []
+    if rank == 0 and settings["callbacks_fn"] is not None:
+        callbacks = settings["callbacks_fn"](model)
+    callbacks.append(_StopSync(rank, stop_flag, barrier, settings["sync_timeout"]))
+
+    trainer = _WorkerTrainer(sync, settings["sync_every"], model=model, data_reader=reader, callbacks=callbacks)
+    start = time.perf_counter()
+    trainer.train(epochs=settings["epochs"], validate=(rank == 0))
+    result_queue.put({
+        "rank": rank,
+        "nb_samples": trainer.nb_samples,
+        "train_time": time.perf_counter() - start
+    })
+
+
+class DataParallelTrainer:
+    """
+    Train one model with several processes on disjoint shards of the training data, e.g.:
+
+    >> trainer = DataParallelTrainer(build_model, create_reader, callbacks_fn, nb_workers=4, config_file=ini_path)
+    >> stats = trainer.train(epochs=30)
+
+    build_fn() returns a compiled model, reader_fn(doc_ids) returns a MongoDBReader (doc_ids=None loads the ids from
+    the database), callbacks_fn(model) returns the callbacks of rank 0. All functions must be defined on module level.
+    Each worker trains locally and the weights are averaged every sync_every batches and at the end of each epoch.
+    If a worker fails or dies, the others are released from the synchronisation and train() raises a RuntimeError.
+    """
+    def __init__(self,
+                 build_fn: Callable,
+                 reader_fn: Callable,
+                 callbacks_fn: Callable = None,
+                 nb_workers: int = 2,
+                 sync_every: int = 1,
+                 config_file: str = None,
+                 intra_op_threads: int = 1,
+                 inter_op_threads: int = 1,
+                 sync_timeout: float = 600.0):
+        """
+        :param build_fn: function returning the compiled keras model
+        :param reader_fn: function taking doc_ids (dict or None) and returning a data reader
+        :param callbacks_fn: function taking the model and returning the list of callbacks of rank 0
+        :param nb_workers: number of worker processes
+        :param sync_every: number of local batches between two weight averages
+        :param config_file: path to the connections .ini file, loaded in each worker process
+        :param intra_op_threads: TensorFlow intra op threads per worker
+        :param inter_op_threads: TensorFlow inter op threads per worker
+        :param sync_timeout: seconds a worker waits for the others (e.g. while rank 0 validates and saves) before it
+                             gives up, failures of other workers are detected without waiting for the timeout
+        """
+        self._build_fn = build_fn
+        self._reader_fn = reader_fn
+        self._callbacks_fn = callbacks_fn
+        self._nb_workers = nb_workers
+        self._sync_every = sync_every
+        self._config_file = config_file
+        self._intra_op_threads = intra_op_threads
+        self._inter_op_threads = inter_op_threads
+        self._sync_timeout = sync_timeout
+
+    def _create_shards(self) -> List[dict]:
+        """
+        load the split once and divide the train ids into equally sized shards, all workers must take the same number
+        of steps per epoch. The ids that do not divide evenly are spread over the first shards, the other shards
+        repeat their first id to get the same size.
+        """
+        doc_ids = self._reader_fn(None).doc_ids
+        train_ids = list(doc_ids["train"])
+        shard_size = int(math.ceil(len(train_ids) / self._nb_workers))
+        shards = []
+        for rank, indices in enumerate(np.array_split(np.arange(len(train_ids)), self._nb_workers)):
+            shard_ids = [train_ids[i] for i in indices]
+            shard_ids += shard_ids[:shard_size - len(shard_ids)]
+            shards.append({
+                "train": shard_ids,
+                # only rank 0 validates and tests
+                "validation": doc_ids["validation"] if rank == 0 else [],
+                "test": doc_ids["test"] if rank == 0 else []
+            })
+        return shards
+
+    def _count_params(self) -> int:
+        model = self._build_fn()
+        return int(sum(w.size for w in model.get_weights()))
+
+    @staticmethod
+    def _collect(processes: list, result_queue, barrier) -> List[dict]:
+        """
+        Wait for the stats of all workers while watching the processes, a worker that raised or died (e.g. killed
+        because it ran out of memory) aborts the barrier so the others stop instead of waiting for it forever
+        :return: list of the stats of each worker
+        """
+        worker_stats = {}
+        while len(worker_stats) < len(processes):
+            try:
+                stats = result_queue.get(timeout=1.0)
+            except queue.Empty:
+                for rank, process in enumerate(processes):
+                    if rank not in worker_stats and not process.is_alive() and process.exitcode != 0:
+                        barrier.abort()
+                        raise RuntimeError("Worker {0} died with exit code {1}".format(rank, process.exitcode))
+                continue
+            if "error" in stats:
+                barrier.abort()
+                raise RuntimeError("Worker {0} failed:\n{1}".format(stats["rank"], stats["error"]))
+            worker_stats[stats["rank"]] = stats
+        return list(worker_stats.values())
+
+    def train(self, epochs: int = 5) -> dict:
+        """
+        :param epochs: maximum number of epochs
+        :return: dict with the number of workers, trained samples, wall time and samples per second
+        """
+        shards = self._create_shards()
+        nb_params = self._count_params()
+
+        context = multiprocessing.get_context("spawn")
+        shared_buffer = context.RawArray("f", self._nb_workers * nb_params)
+        barrier = context.Barrier(self._nb_workers)
+        stop_flag = context.RawValue("i", 0)
+        result_queue = context.Queue()
+        settings = {
+            "build_fn": self._build_fn,
+            "reader_fn": self._reader_fn,
+            "callbacks_fn": self._callbacks_fn,
+            "nb_workers": self._nb_workers,
+            "sync_every": self._sync_every,
+            "config_file": self._config_file,
+            "epochs": epochs,
+            "intra_op_threads": self._intra_op_threads,
+            "inter_op_threads": self._inter_op_threads,
+            "sync_timeout": self._sync_timeout
+        }
+
+        start = time.perf_counter()
+        processes = []
+        for rank in range(self._nb_workers):
+            process = context.Process(target=_worker, args=(rank, settings, shards[rank], shared_buffer, barrier,
+                                                            stop_flag, result_queue))
+            process.start()
+            processes.append(process)
+        try:
+            worker_stats = self._collect(processes, result_queue, barrier)
+        finally:
+            for process in processes:
+                process.join(timeout=10.0)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+        wall_time = time.perf_counter() - start
+
+        train_time = max(stats["train_time"] for stats in worker_stats)
+        nb_samples = sum(stats["nb_samples"] for stats in worker_stats)
+        return {
+            "nb_workers": self._nb_workers,
+            "nb_samples": nb_samples,
+            "wall_time": wall_time,
+            "train_time": train_time,
+            "samples_per_sec": nb_samples / train_time if train_time > 0 else 0.0
+        }
+
+
+def measure_scaling(build_fn: Callable, reader_fn: Callable, worker_counts: List[int] = (1, 2, 4),
+                    epochs: int = 1, **kwargs) -> List[dict]:
+    """
+    Train with different numbers of workers and report the scaling efficiency,
+    efficiency = samples_per_sec(N) / (N * samples_per_sec(1))
+    :param build_fn: see DataParallelTrainer
+    :param reader_fn: see DataParallelTrainer
+    :param worker_counts: list of worker counts, the first one is used as reference
+    :param epochs: epochs per run
+    :param kwargs: further arguments of DataParallelTrainer (e.g. sync_every, config_file)
+    :return: list of stats dicts (see DataParallelTrainer.train()) with the additional key "efficiency"
+    """
+    all_stats = []
+    reference = None
+    for nb_workers in worker_counts:
+        stats = DataParallelTrainer(build_fn, reader_fn, nb_workers=nb_workers, **kwargs).train(epochs=epochs)
+        if reference is None:
+            reference = stats["samples_per_sec"] / nb_workers
+        stats["efficiency"] = stats["samples_per_sec"] / (nb_workers * reference) if reference > 0 else math.nan
+        DLPipeLogger.logger.info("Scaling => \tWorkers: {0}\t{1:.1f} samples/sec\tefficiency: {2:.2f}".format(
+            nb_workers, stats["samples_per_sec"], stats["efficiency"]))
+        all_stats.append(stats)
+    return all_stats
@@ -0,0 +1,72 @@
+"""
+Data Reader for data that is already encoded and held in memory as numpy arrays
+"""
+import numpy as np
+from dlpipe.data_reader.data_reader_base import BaseDataReader
+
+
+class ArrayReader(BaseDataReader):
+    def __init__(self,
+                 x: np.ndarray,
+                 y: np.ndarray,
+                 train_idx: np.ndarray,
+                 val_idx: np.ndarray = None,
+                 test_idx: np.ndarray = None,
+                 batch_size: int = 32,
+                 val_batch_size: int = None,
+                 shuffle_data: bool = True):
+        """
+        :param x: input data of all samples, shape [n_samples, ...]
+        :param y: ground truth of all samples, shape [n_samples, ...]
+        :param train_idx: indices of the training samples
+        :param val_idx: indices of the validation samples
+        :param test_idx: indices of the test samples
+        :param batch_size: number of samples per training batch
+        :param val_batch_size: number of samples per validation/test batch, None to use all at once
+        :param shuffle_data: shuffle the training samples each epoch
+        """
+        # the split is given by the index arrays, the data_split is not used
+        super().__init__(batch_size, val_batch_size, [100, 0, 0], [])
+        self.x = x
+        self.y = y
+        self.shuffle_data = shuffle_data
+        empty = np.zeros(0, dtype=np.int64)
+        self.indices = {
+            "train": np.array(train_idx, dtype=np.int64),
+            "validation": empty if val_idx is None else np.array(val_idx, dtype=np.int64),
+            "test": empty if test_idx is None else np.array(test_idx, dtype=np.int64)
+        }
+        self.last_index = {"train": 0, "validation": 0, "test": 0}
+        if self.shuffle_data:
+            np.random.shuffle(self.indices["train"])
+
+    def reset_epoch(self):
+        """
+        Reset epoch by shuffling the training data and setting its index counter back to zero. Validation and test
+        always run to their end and start over by themselves, their index is not touched as a background validation
+        might still be reading.
+        """
+        if self.shuffle_data:
+            np.random.shuffle(self.indices["train"])
+        self.last_index["train"] = 0
+
+    def get_nb_batches(self) -> float:
+        return len(self.indices["train"]) / self.batch_size
+
+    def get_next(self, mode: str="train"):
+        """
+        :param mode: default="train", can be one of these ["train", "validation", "test"]
+        :returns: array of 3 values with: [batch data input, batch data ground truth, finished flag]
+        """
+        assert mode in ["train", "validation", "test"]
+        if mode != "train" and self.val_batch_size is None:
+            idx = self.indices[mode]
+            return self.x[idx], self.y[idx], True
+
+        batch_size = self.batch_size if mode == "train" else self.val_batch_size
+        end_index = self.last_index[mode] + batch_size
+        idx = self.indices[mode][self.last_index[mode]:end_index]
+        # same as the MongoDBReader: finished if the next batch would not be a full batch anymore
+        finished = (end_index + batch_size) >= len(self.indices[mode])
+        self.last_index[mode] = 0 if finished else end_index
+        return self.x[idx], self.y[idx], finished
@@ -3,6 +3,7 @@ Base class for any DataReader
 """
 from typing import List
 from dlpipe.data_reader.data_reader_interface import IDataReader
+from dlpipe.utils.profiler import disabled_profiler
 
 
 class BaseDataReader(IDataReader):
@@ -13,7 +14,10 @@ class BaseDataReader(IDataReader):
                  processors: List[any] = list()):
         self.batch_size = batch_size
         self.val_batch_size = val_batch_size
-        self.processors = processors
+        # copy, the default list would otherwise be shared by all readers and add_processors() extends it
+        self.processors = list(processors)
+        # the Trainer sets its StepProfiler here to also record the time spent in the reader
+        self.profiler = disabled_profiler()
 
         assert(len(data_split) == 3 and sum(data_split) == 100)
         self.data_split = data_split
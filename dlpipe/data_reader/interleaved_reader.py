@@ -0,0 +1,77 @@
+"""
+Data Reader that mixes the training batches of several data readers
+"""
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from dlpipe.data_reader.data_reader_interface import IDataReader
+from dlpipe.utils.profiler import disabled_profiler
+
+
+class InterleavedReader(IDataReader):
+    """
+    Each training batch is taken from one of the readers, chosen randomly by the given weights. The first reader is
+    the primary reader: its epoch defines the epoch of the training and it provides the validation and test data.
+    All other readers start over on their own once they reach the end of their data (own epoch accounting).
+    The next batch of every reader is fetched concurrently in the background.
+    """
+    def __init__(self, readers: List[IDataReader], weights: List[float] = None):
+        """
+        :param readers: list of data readers, the first one is the primary reader
+        :param weights: relative frequency a batch is taken from each reader, defaults to equal weights
+        """
+        if weights is None:
+            weights = [1.0] * len(readers)
+        if len(weights) != len(readers):
+            raise ValueError("need exactly one weight per reader")
+        self.readers = readers
+        self.weights = np.asarray(weights, dtype=np.float64) / float(np.sum(weights))
+        self.epochs = [0] * len(readers)  # number of finished epochs per reader
+        self._profiler = disabled_profiler()
+        self._executor = ThreadPoolExecutor(max_workers=len(readers))
+        self._pending = [None] * len(readers)
+        for i in range(len(readers)):
+            self._prefetch(i)
+
+    @property
+    def profiler(self):
+        return self._profiler
+
+    @profiler.setter
+    def profiler(self, profiler):
+        self._profiler = profiler
+        for reader in self.readers:
+            reader.profiler = profiler
+
+    def _prefetch(self, index: int):
+        self._pending[index] = self._executor.submit(self.readers[index].get_next, "train")
+
+    def get_nb_batches(self) -> float:
+        # batches of the primary reader are only a fraction (its weight) of all batches
+        return self.readers[0].get_nb_batches() / self.weights[0]
+
+    def reset_epoch(self) -> None:
+        self.readers[0].reset_epoch()
+        # after the last batch of its epoch, no batch is prefetched for the primary reader until it is reset
+        if self._pending[0] is None:
+            self._prefetch(0)
+
+    def get_next(self, mode="train") -> [list, list, bool]:
+        if mode != "train":
+            return self.readers[0].get_next(mode)
+
+        index = int(np.random.choice(len(self.readers), p=self.weights))
+        x, y, finished = self._pending[index].result()
+        self._pending[index] = None
+        if finished:
+            self.epochs[index] += 1
+            if index == 0:
+                # the epoch of the primary reader ends, its next batch is fetched after reset_epoch()
+                return x, y, True
+            self.readers[index].reset_epoch()
+        self._prefetch(index)
+        return x, y, False
+
+    def close(self):
+        """ stop the prefetch threads, call this once training is done (the Trainer does for readers it created) """
+        self._executor.shutdown(wait=True)
@@ -19,7 +19,24 @@ class MongoDBReader(BaseDataReader):
                  shuffle_steps: int = 1,
                  fields: List[str] = list(),
                  sort_by: Tuple = None,
-                 limit: int= None):
+                 limit: int= None,
+                 doc_ids: dict = None,
+                 query: dict = None):
+        """
+        :param collection: pymongo collection the data is read from
+        :param batch_size: number of documents per training batch
+        :param val_batch_size: number of documents per validation/test batch, None to use all at once
+        :param data_split: percentages of the [train, validation, test] split, must sum up to 100
+        :param processors: list of processors applied to each document
+        :param shuffle_data: shuffle the documents
+        :param shuffle_steps: shuffle blocks of this many consecutive documents
+        :param fields: fields of the documents that are loaded
+        :param sort_by: sort the documents before splitting
+        :param limit: maximum number of documents
+        :param doc_ids: already split _ids as dict with keys ["train", "validation", "test"], skips loading the ids
+                        from the database (e.g. to use the same split in multiple processes)
+        :param query: filter for the documents that are loaded, e.g. only documents inserted after a certain time
+        """
         super().__init__(batch_size, val_batch_size, data_split, processors)
         self.collection = collection
         self.shuffle_data = shuffle_data
@@ -27,17 +44,22 @@ class MongoDBReader(BaseDataReader):
         self.fields = fields
         self.sort_by = sort_by
         self.limit = limit
+        self.query = {} if query is None else query
 
         self.last_index = {"train": 0, "validation": 0, "test": 0}
         self.doc_ids = {"train": [], "validation": [], "test": []}
         self.nb_docs = 0
 
-        self._load_doc_ids()
+        if doc_ids is None:
+            self._load_doc_ids()
+        else:
+            self.doc_ids = {mode: list(doc_ids.get(mode, [])) for mode in ["train", "validation", "test"]}
+            self.nb_docs = sum(len(ids) for ids in self.doc_ids.values())
 
     def _load_doc_ids(self):
         """ loading of all docIDs for the given connection and splitting them up in a train, validation and test set """
         DLPipeLogger.logger.info("Loading Document IDs from MongoDB")
-        db_cursor = self.collection.find({}, {"_id": 1})
+        db_cursor = self.collection.find(self.query, {"_id": 1})
         if self.sort_by is not None:
             db_cursor.sort(self.sort_by)
         if self.limit:
@@ -63,11 +85,15 @@ class MongoDBReader(BaseDataReader):
             len(self.doc_ids["train"]), len(self.doc_ids["validation"]), len(self.doc_ids["test"])))
 
     def reset_epoch(self):
-        """ Reset epoch by shuffling data and setting the index counters back to zero """
+        """
+        Reset epoch by shuffling the training data and setting its index counter back to zero. Validation and test
+        always run to their end and start over by themselves, their index is not touched as a background validation
+        might still be reading.
+        """
         if self.shuffle_data:
             shuffle(self.doc_ids["train"])
 
-        self.last_index = {"train": 0, "validation": 0, "test": 0}
+        self.last_index["train"] = 0
 
     def get_nb_batches(self) -> float:
         return len(self.doc_ids["train"]) / self.batch_size
@@ -119,8 +145,12 @@ class MongoDBReader(BaseDataReader):
         assert mode in ["train", "validation", "test"]
 
         next_doc_ids, end_index, finished = self._next_doc_ids(mode)
-        doc_list = list(self._fetch_data(next_doc_ids))
-        batch_x, batch_y = self._process_batch(doc_list)
+        # validation and test batches are timed separately from the training batches (e.g. "validation_fetch")
+        prefix = "" if mode == "train" else mode + "_"
+        with self.profiler.phase(prefix + "fetch"):
+            doc_list = list(self._fetch_data(next_doc_ids))
+        with self.profiler.phase(prefix + "process"):
+            batch_x, batch_y = self._process_batch(doc_list)
 
         if finished:
             self.last_index[mode] = 0
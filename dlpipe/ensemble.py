@@ -0,0 +1,158 @@
+"""
+Ensembles of model checkpoints (several weights of one experiment or of several experiments). The input is encoded
+once and all members predict the same batch, members with the same dense architecture are evaluated as one stacked
+NumPy computation.
+"""
+import numpy as np
+from bson import ObjectId
+from pymongo.database import Database
+from dlpipe.export import load_numpy_checkpoint
+from dlpipe.numpy_engine import ACTIVATIONS, NumpyModel
+
+
+def select_checkpoints(mongo_db: Database,
+                       exp_id,
+                       strategy: str = "last",
+                       k: int = 3,
+                       indices: list = None,
+                       monitor: str = "loss",
+                       phase: str = "validation",
+                       mode: str = "min") -> list:
+    """
+    :param mongo_db: pymongo database the experiments are saved in
+    :param exp_id: id of the experiment
+    :param strategy: "last" (k latest weights), "best" (weights of the k best epochs) or "indices"
+    :param k: number of checkpoints for "last" and "best"
+    :param indices: explicit indices in the "weights" list of the experiment for "indices"
+    :param monitor: per epoch metric that ranks the weights for "best"
+    :param phase: phase of the monitored metric
+    :param mode: "min" or "max", if lower or higher values of the monitored metric are better
+    :return: list of (exp_id, weights index)
+    """
+    if strategy not in ["last", "best", "indices"]:
+        raise ValueError("strategy must be any of ['last', 'best', 'indices']")
+    exp_obj = mongo_db["experiment"].find_one({"_id": ObjectId(exp_id)}, {"weights": 1, "metrics": 1})
+    if exp_obj is None:
+        raise ValueError("Experiment {0} does not exist".format(exp_id))
+    nb_weights = len(exp_obj["weights"])
+    if nb_weights == 0:
+        raise ValueError("Experiment {0} has no saved weights".format(exp_id))
+
+    if strategy == "indices":
+        selected = [i if i >= 0 else nb_weights + i for i in indices]
+    elif strategy == "last":
+        selected = list(range(max(0, nb_weights - k), nb_weights))
+    else:
+        values = ((exp_obj.get("metrics") or {}).get(phase) or {}).get(monitor)
+        if not values:
+            raise ValueError("Experiment {0} has no {1} metric {2}".format(exp_id, phase, monitor))
+        # latest saved weights of each epoch, see ExperimentSchema.get_weights_index()
+        epoch_index = {}
+        for i, entry in enumerate(exp_obj["weights"]):
+            epoch_index[entry["epoch"]] = i
+        ranked = sorted((v for v in values if v["epoch"] in epoch_index), key=lambda v: v["value"],
+                        reverse=mode == "max")
+        selected = [epoch_index[v["epoch"]] for v in ranked[:k]]
+    return [(str(exp_obj["_id"]), i) for i in selected]
+
+
+class Ensemble:
+    """
+    Average or majority vote of the predictions of several models e.g.:
+
+    >> members = select_checkpoints(db, exp_id, strategy="best", k=5)
+    >> ensemble = Ensemble.from_checkpoints(db, members, method="mean")
+    >> predictions = ensemble.predict(x)
+
+    If all members are NumpyModels with the same layer shapes their weights are stacked to [nb_members, ...] and the
+    forward pass of all members is one batched matmul per layer. Other members (e.g. keras models) are called one
+    after another on the same input.
+    """
+    def __init__(self, members: list, method: str = "mean"):
+        """
+        :param members: list of models with a predict(x, batch_size) method (NumpyModel or keras models)
+        :param method: "mean" to average the probabilities, "vote" for a majority vote of the predicted classes
+        """
+        if len(members) == 0:
+            raise ValueError("An ensemble needs at least one member")
+        if method not in ["mean", "vote"]:
+            raise ValueError("method must be any of ['mean', 'vote']")
+        self.members = members
+        self.method = method
+        self._stacked_layers = None
+        if all(isinstance(m, NumpyModel) for m in members) and all(m.same_structure(members[0]) for m in members):
+            self._stacked_layers = self._stack(members)
+
+    @classmethod
+    def from_checkpoints(cls, mongo_db: Database, checkpoints: list, method: str = "mean") -> "Ensemble":
+        """
+        :param checkpoints: list of (exp_id, weights index), e.g. from select_checkpoints(), each checkpoint is read
+                            once from GridFS and converted to a NumpyModel
+        """
+        return cls([load_numpy_checkpoint(mongo_db, exp_id, index) for exp_id, index in checkpoints], method)
+
+    @staticmethod
+    def _stack(members: list) -> list:
+        layers = []
+        for i, layer in enumerate(members[0].layers):
+            if layer[0] == "activation":
+                layers.append(layer)
+                continue
+            kernels = np.stack([m.layers[i][1] for m in members])
+            biases = None
+            if layer[2] is not None:
+                # [nb_members, 1, units] to broadcast over the rows
+                biases = np.stack([m.layers[i][2] for m in members])[:, None, :]
+            layers.append(("dense", kernels, biases))
+        return layers
+
+    @property
+    def is_stacked(self) -> bool:
+        return self._stacked_layers is not None
+
+    def predict_members(self, x: np.ndarray, batch_size: int = None) -> np.ndarray:
+        """
+        :param x: input data [n, nb_features]
+        :param batch_size: passed to the predict() of members that are not stacked
+        :return: predictions of every member [nb_members, n, nb_outputs]
+        """
+        if not self.is_stacked:
+            return np.stack([np.asarray(m.predict(x, batch_size=batch_size)) for m in self.members])
+        # [n, features] @ [nb_members, features, units] -> [nb_members, n, units]
+        x = np.asarray(x, dtype=np.float32)
+        for layer in self._stacked_layers:
+            if layer[0] == "dense":
+                y = np.matmul(x, layer[1])
+                if layer[2] is not None:
+                    y += layer[2]
+                x = y
+            else:
+                x = ACTIVATIONS[layer[1]](x)
+        return x
+
+    def combine(self, member_predictions: np.ndarray) -> np.ndarray:
+        """
+        :param member_predictions: predictions of every member [nb_members, n, nb_classes]
+        :return: combined class distribution [n, nb_classes]
+        """
+        mean = member_predictions.mean(axis=0)
+        if self.method == "mean":
+            return mean
+        nb_members = len(member_predictions)
+        votes = np.zeros_like(mean)
+        classes = member_predictions.argmax(axis=-1)
+        for member_classes in classes:
+            votes[np.arange(len(votes)), member_classes] += 1
+        # half of the mean probability breaks ties without changing a majority (votes differ by at least 1),
+        # the result still sums to 1 per row
+        return (votes + 0.5 * mean) / (nb_members + 0.5)
+
+    def predict(self, x: np.ndarray, batch_size: int = None) -> np.ndarray:
+        """
+        :param x: input data [n, nb_features]
+        :param batch_size: optional number of rows per forward pass to limit the memory of the activations
+        :return: combined class distribution [n, nb_classes]
+        """
+        if batch_size is not None and len(x) > batch_size:
+            return np.concatenate([self.predict(x[i:i + batch_size]) for i in range(0, len(x), batch_size)])
+        return self.combine(self.predict_members(x, batch_size))
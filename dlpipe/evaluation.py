@@ -0,0 +1,232 @@
+"""
+Offline evaluation of stored model checkpoints on a labelled collection. Predictions are made in batches and all
+statistics are computed with NumPy on the full prediction matrix.
+"""
+import hashlib
+import numpy as np
+from typing import List
+from pymongo.collection import Collection
+from pymongo.database import Database
+from dlpipe.checkpoint import get_checkpoint, load_checkpoint_model
+from dlpipe.schemas import EvaluationSchema
+from dlpipe.utils import DLPipeLogger
+
+
+def encode_documents(docs: List[dict], processors: List[any], x: np.ndarray = None, y: np.ndarray = None):
+    """
+    Encode documents with the processors into (preallocated) matrices
+    :param docs: list of documents
+    :param processors: list of processors (same as for the data readers)
+    :param x: matrix [>= len(docs), nb_features] that is filled, allocated if None
+    :param y: matrix [>= len(docs), nb_classes] that is filled, allocated if None
+    :return: x, y with the first len(docs) rows filled
+    """
+    for i, raw_data in enumerate(docs):
+        input_data = None
+        ground_truth = None
+        piped_params = {}
+        for processor in processors:
+            raw_data, input_data, ground_truth, piped_params = processor.process(raw_data, input_data, ground_truth,
+                                                                                 piped_params=piped_params)
+        if x is None:
+            x = np.empty((len(docs), len(input_data)), dtype=np.float32)
+            y = np.empty((len(docs), len(ground_truth)), dtype=np.float32)
+        x[i] = input_data
+        y[i] = ground_truth
+    return x, y
+
+
+def predict_collection(model, collection: Collection, processors: List[any], query: dict = None,
+                       batch_size: int = 1024) -> (np.ndarray, np.ndarray, list):
+    """
+    :param model: keras model
+    :param collection: pymongo collection with the labelled documents
+    :param processors: list of processors to encode the documents
+    :param query: optional filter for the documents
+    :param batch_size: number of documents encoded and predicted at once
+    :return: predictions [n, nb_classes], true class ids [n], document _ids
+    """
+    predictions = []
+    labels = []
+    ids = []
+    x = None
+    y = None
+    docs = []
+    cursor = collection.find({} if query is None else query).sort("_id", 1).batch_size(batch_size)
+    for doc in cursor:
+        docs.append(doc)
+        if len(docs) == batch_size:
+            x, y = encode_documents(docs, processors, x, y)
+            predictions.append(model.predict(x, batch_size=batch_size))
+            labels.append(np.argmax(y, axis=-1))
+            ids += [d["_id"] for d in docs]
+            docs = []
+    if len(docs) > 0:
+        x, y = encode_documents(docs, processors, x, y)
+        n = len(docs)
+        predictions.append(model.predict(x[:n], batch_size=batch_size))
+        labels.append(np.argmax(y[:n], axis=-1))
+        ids += [d["_id"] for d in docs]
+    if len(predictions) == 0:
+        raise ValueError("No documents to evaluate")
+    return np.concatenate(predictions), np.concatenate(labels), ids
+
+
+def confusion_matrix(y_true: np.ndarray, y_pred: np.ndarray, nb_classes: int) -> np.ndarray:
+    """
+    :return: int matrix [nb_classes, nb_classes], rows are the true classes and columns the predicted classes
+    """
+    counts = np.bincount(y_true * nb_classes + y_pred, minlength=nb_classes * nb_classes)
+    return counts.reshape(nb_classes, nb_classes)
+
+
+def class_scores(cm: np.ndarray) -> dict:
+    """
+    :param cm: confusion matrix (see confusion_matrix())
+    :return: dict with per class lists of precision, recall, f1 and support
+    """
+    true_positives = np.diag(cm).astype(np.float64)
+    predicted = cm.sum(axis=0)
+    support = cm.sum(axis=1)
+    precision = true_positives / np.maximum(predicted, 1)
+    recall = true_positives / np.maximum(support, 1)
+    f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-12)
+    return {
+        "precision": precision.tolist(),
+        "recall": recall.tolist(),
+        "f1": f1.tolist(),
+        "support": support.tolist()
+    }
+
+
+def calibration(predictions: np.ndarray, y_true: np.ndarray, nb_bins: int = 10) -> dict:
+    """
+    Reliability of the confidence (highest predicted probability) of the predictions
+    :return: dict with per bin lists of mean confidence, accuracy and count and the expected calibration error (ece)
+    """
+    confidence = predictions.max(axis=-1)
+    correct = (predictions.argmax(axis=-1) == y_true).astype(np.float64)
+    bins = np.minimum((confidence * nb_bins).astype(np.int64), nb_bins - 1)
+    counts = np.bincount(bins, minlength=nb_bins)
+    conf_sums = np.bincount(bins, weights=confidence, minlength=nb_bins)
+    correct_sums = np.bincount(bins, weights=correct, minlength=nb_bins)
+    nonzero = np.maximum(counts, 1)
+    mean_confidence = conf_sums / nonzero
+    accuracy = correct_sums / nonzero
+    ece = float(np.sum(counts * np.abs(accuracy - mean_confidence)) / max(len(y_true), 1))
+    return {
+        "bin_edges": np.linspace(0.0, 1.0, nb_bins + 1).tolist(),
+        "mean_confidence": mean_confidence.tolist(),
+        "accuracy": accuracy.tolist(),
+        "count": counts.tolist(),
+        "ece": ece
+    }
+
+
+def top_confusions(predictions: np.ndarray, y_true: np.ndarray, ids: list, k: int = 20) -> List[dict]:
+    """
+    :return: the k wrong predictions with the highest confidence
+    """
+    y_pred = predictions.argmax(axis=-1)
+    wrong = np.flatnonzero(y_pred != y_true)
+    confidence = predictions[wrong, y_pred[wrong]]
+    k = min(k, len(wrong))
+    top = wrong[np.argsort(-confidence, kind="stable")[:k]]
+    return [{
+        "id": ids[i],
+        "true": int(y_true[i]),
+        "predicted": int(y_pred[i]),
+        "confidence": float(predictions[i, y_pred[i]])
+    } for i in top]
+
+
+def create_report(predictions: np.ndarray, y_true: np.ndarray, ids: list, nb_bins: int = 10,
+                  nb_confusions: int = 20) -> dict:
+    """
+    :param predictions: predicted class probabilities [n, nb_classes]
+    :param y_true: true class ids [n]
+    :param ids: document _ids of the rows
+    :param nb_bins: number of bins for the calibration
+    :param nb_confusions: number of top confusion examples
+    :return: report dict with accuracy, confusion matrix, class scores, calibration and top confusions
+    """
+    nb_classes = predictions.shape[-1]
+    y_pred = predictions.argmax(axis=-1)
+    cm = confusion_matrix(y_true, y_pred, nb_classes)
+    return {
+        "nb_samples": int(len(y_true)),
+        "accuracy": float(np.trace(cm) / max(len(y_true), 1)),
+        "confusion_matrix": cm.tolist(),
+        "classes": class_scores(cm),
+        "calibration": calibration(predictions, y_true, nb_bins),
+        "top_confusions": top_confusions(predictions, y_true, ids, nb_confusions)
+    }
+
+
+def dataset_hash(collection: Collection, processors: List[any], query: dict = None) -> str:
+    """
+    Hash of the collection, query, processors and cheap statistics of the matching documents (number of documents,
+    smallest and largest _id), thus no document has to be read. Inserted or removed documents are detected (unless
+    the same number is removed in between the first and last _id), changes to the content of documents are not.
+    """
+    query = {} if query is None else query
+    h = hashlib.blake2b(digest_size=16)
+    h.update("{0}.{1}|{2}|{3}".format(collection.database.name, collection.name, sorted(query.items()),
+                                      [type(p).__name__ for p in processors]).encode("utf-8"))
+    first = collection.find_one(query, {"_id": 1}, sort=[("_id", 1)])
+    last = collection.find_one(query, {"_id": 1}, sort=[("_id", -1)])
+    h.update("|{0}|{1}|{2}".format(collection.count_documents(query), first and first["_id"],
+                                   last and last["_id"]).encode("utf-8"))
+    return h.hexdigest()
+
+
+class Evaluator:
+    """
+    Evaluate checkpoints of experiments saved with SaveExpMongoDB, reports are cached in the "evaluation" collection
+    of the experiment database e.g.:
+
+    >> evaluator = Evaluator(model_db, custom_objects=get_custom_objects())
+    >> report = evaluator.evaluate(exp_id, collection, [PreProcessData()])
+    """
+    def __init__(self, mongo_db: Database, custom_objects: dict = None, batch_size: int = 1024):
+        """
+        :param mongo_db: pymongo database the experiments are saved in
+        :param custom_objects: custom metrics or layers to load the models
+        :param batch_size: number of documents predicted at once
+        """
+        self._db = mongo_db
+        self._custom_objects = custom_objects
+        self._batch_size = batch_size
+        self._cache = EvaluationSchema(mongo_db["evaluation"])
+
+    def evaluate(self, exp_id, collection: Collection, processors: List[any], index: int = None,
+                 query: dict = None, use_cache: bool = True, **report_args) -> dict:
+        """
+        :param exp_id: id of the experiment
+        :param collection: pymongo collection with the labelled documents
+        :param processors: list of processors to encode the documents
+        :param index: index of the weights, if None the best or latest weights (see get_checkpoint())
+        :param query: optional filter for the documents
+        :param use_cache: return a cached report if there is one
+        :param report_args: further arguments of create_report() (nb_bins, nb_confusions)
+        :return: report dict (see create_report())
+        """
+        checkpoint = get_checkpoint(self._db, exp_id, index)
+        data_hash = dataset_hash(collection, processors, query)
+        if len(report_args) > 0:
+            # reports with other settings are cached separately
+            data_hash += "|" + str(sorted(report_args.items()))
+        if use_cache:
+            report = self._cache.get(checkpoint["exp_id"], checkpoint["index"], data_hash)
+            if report is not None:
+                DLPipeLogger.logger.info("Evaluation loaded from cache")
+                return report
+
+        model = load_checkpoint_model(self._db, checkpoint, self._custom_objects, compile=False)
+        predictions, y_true, ids = predict_collection(model, collection, processors, query, self._batch_size)
+        report = create_report(predictions, y_true, ids, **report_args)
+        report["exp_id"] = checkpoint["exp_id"]
+        report["weights_index"] = checkpoint["index"]
+        report["epoch"] = checkpoint["epoch"]
+        self._cache.put(checkpoint["exp_id"], checkpoint["index"], data_hash, report)
+        return report
@@ -0,0 +1,162 @@
+"""
+Export checkpoints of dense models to compact .npz weight files for the NumPy inference engine (dlpipe.numpy_engine).
+Only h5py is needed to read the weights, the architecture comes from the keras_model config of the experiment.
+"""
+import io
+import json
+import numpy as np
+from pymongo.database import Database
+from bson import ObjectId
+from dlpipe.checkpoint import get_checkpoint, read_checkpoint_bytes
+from dlpipe.numpy_engine import NumpyModel
+
+# layers without weights that do nothing at inference time
+_SKIPPED_LAYERS = ["InputLayer", "Dropout", "GaussianNoise", "GaussianDropout", "AlphaDropout"]
+
+
+def _layer_list(keras_config) -> list:
+    """ layer configs of a Sequential or functional model config, the model must be a linear chain of layers """
+    layers = keras_config["layers"] if isinstance(keras_config, dict) else keras_config
+    previous = None
+    for layer in layers:
+        name = layer.get("name") or layer["config"]["name"]
+        inbound = layer.get("inbound_nodes") or []
+        if len(inbound) > 1 or (len(inbound) == 1 and len(inbound[0]) != 1):
+            raise ValueError("Layer {0} has multiple inputs, only linear models are supported".format(name))
+        if previous is not None and len(inbound) == 1 and inbound[0][0][0] != previous:
+            raise ValueError("Layer {0} does not follow {1}, only linear models are supported".format(name, previous))
+        previous = name
+    return layers
+
+
+def _read_weights(h5_bytes: bytes) -> dict:
+    """
+    :return: {layer name: {"kernel": array, "bias": array}} of the model saved by model.save()
+    """
+    import h5py
+    weights = {}
+    with h5py.File(io.BytesIO(h5_bytes), "r") as h5_file:
+        group = h5_file["model_weights"] if "model_weights" in h5_file else h5_file
+        for layer_name in group.attrs["layer_names"]:
+            layer_name = layer_name.decode("utf-8") if hasattr(layer_name, "decode") else layer_name
+            layer_weights = {}
+            for weight_name in group[layer_name].attrs["weight_names"]:
+                weight_name = weight_name.decode("utf-8") if hasattr(weight_name, "decode") else weight_name
+                # e.g. "dense_1/kernel:0"
+                key = weight_name.split("/")[-1].split(":")[0]
+                layer_weights[key] = np.asarray(group[layer_name][weight_name])
+            weights[layer_name] = layer_weights
+    return weights
+
+
+def quantize_int8(kernel: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    Symmetric int8 quantization with one scale per output unit (column)
+    :return: int8 kernel, float32 scales
+    """
+    scale = np.abs(kernel).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    quantized = np.clip(np.round(kernel / scale), -127, 127).astype(np.int8)
+    return quantized, scale.astype(np.float32)
+
+
+def convert_model(keras_config, h5_bytes: bytes, dtype: str = "float32", meta: dict = None) -> (dict, dict):
+    """
+    :param keras_config: model config (model.get_config()) as saved by SaveExpMongoDB
+    :param h5_bytes: content of the h5 file saved by model.save()
+    :param dtype: "float32", "float16" or "int8" (per unit scales) for the kernels, biases stay float32
+    :param meta: info saved with the model
+    :return: spec of the layers, dict of the weight arrays (see NumpyModel.from_arrays())
+    """
+    if dtype not in ["float32", "float16", "int8"]:
+        raise ValueError("dtype must be any of ['float32', 'float16', 'int8']")
+    weights = _read_weights(h5_bytes)
+    spec_layers = []
+    arrays = {}
+    for layer in _layer_list(keras_config):
+        class_name = layer["class_name"]
+        config = layer["config"]
+        if class_name in _SKIPPED_LAYERS:
+            continue
+        if class_name == "Activation":
+            spec_layers.append({"type": "activation", "activation": config["activation"]})
+        elif class_name == "Dense":
+            i = len(spec_layers)
+            layer_weights = weights[config["name"]]
+            kernel = layer_weights["kernel"].astype(np.float32)
+            if dtype == "int8":
+                arrays["kernel_{0}".format(i)], arrays["kernel_scale_{0}".format(i)] = quantize_int8(kernel)
+            else:
+                arrays["kernel_{0}".format(i)] = kernel.astype(dtype)
+            if config.get("use_bias", True):
+                arrays["bias_{0}".format(i)] = layer_weights["bias"].astype(np.float32)
+            spec_layers.append({"type": "dense", "units": config["units"]})
+            if config.get("activation", "linear") != "linear":
+                spec_layers.append({"type": "activation", "activation": config["activation"]})
+        else:
+            raise ValueError("Layer type {0} is not supported".format(class_name))
+    return {"layers": spec_layers, "meta": dict(meta or {}, dtype=dtype)}, arrays
+
+
+def export_model(keras_config, h5_bytes: bytes, path: str, dtype: str = "float32", meta: dict = None) -> dict:
+    """
+    :param keras_config: model config (model.get_config()) as saved by SaveExpMongoDB
+    :param h5_bytes: content of the h5 file saved by model.save()
+    :param path: file name of the .npz file
+    :param dtype: "float32", "float16" or "int8", see convert_model()
+    :param meta: info saved with the model
+    :return: spec of the exported layers
+    """
+    spec, arrays = convert_model(keras_config, h5_bytes, dtype, meta)
+    arrays["spec"] = np.array(json.dumps(spec))
+    np.savez_compressed(path, **arrays)
+    return spec
+
+
+def _checkpoint_source(mongo_db: Database, exp_id, index: int = None) -> (dict, bytes, dict):
+    checkpoint = get_checkpoint(mongo_db, exp_id, index)
+    exp_obj = mongo_db["experiment"].find_one({"_id": ObjectId(exp_id)}, {"keras_model": 1})
+    meta = {"exp_id": str(checkpoint["exp_id"]), "weights_index": checkpoint["index"], "epoch": checkpoint["epoch"]}
+    return exp_obj["keras_model"], read_checkpoint_bytes(mongo_db, checkpoint), meta
+
+
+def load_numpy_checkpoint(mongo_db: Database, exp_id, index: int = None) -> NumpyModel:
+    """
+    Load a checkpoint of an experiment saved with SaveExpMongoDB directly as NumpyModel (without keras)
+    :param index: index of the weights, if None the best or latest weights (see get_checkpoint())
+    """
+    keras_config, h5_bytes, meta = _checkpoint_source(mongo_db, exp_id, index)
+    return NumpyModel.from_arrays(*convert_model(keras_config, h5_bytes, meta=meta))
+
+
+def export_checkpoint(mongo_db: Database, exp_id, path: str, index: int = None, dtype: str = "float32") -> dict:
+    """
+    Export a checkpoint of an experiment saved with SaveExpMongoDB
+    :param mongo_db: pymongo database the experiments are saved in
+    :param exp_id: id of the experiment
+    :param path: file name of the .npz file
+    :param index: index of the weights, if None the best or latest weights (see get_checkpoint())
+    :param dtype: "float32", "float16" or "int8", see export_model()
+    :return: spec of the exported layers
+    """
+    keras_config, h5_bytes, meta = _checkpoint_source(mongo_db, exp_id, index)
+    return export_model(keras_config, h5_bytes, path, dtype, meta)
+
+
+def parity_check(keras_model, numpy_model: NumpyModel, x: np.ndarray) -> dict:
+    """
+    Compare the predictions of the keras model and the exported model
+    :param keras_model: original keras model
+    :param numpy_model: exported model
+    :param x: input data
+    :return: dict with the max and mean absolute difference of the outputs and the fraction of equal argmax classes
+    """
+    expected = keras_model.predict(x)
+    actual = numpy_model.predict(x)
+    diff = np.abs(expected - actual)
+    return {
+        "nb_samples": int(len(x)),
+        "max_abs_diff": float(diff.max()),
+        "mean_abs_diff": float(diff.mean()),
+        "class_agreement": float(np.mean(expected.argmax(axis=-1) == actual.argmax(axis=-1)))
+    }
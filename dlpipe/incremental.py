@@ -0,0 +1,102 @@
+"""
+Incremental fine tuning: continue training a stored experiment only on the documents that were inserted after it
+was trained, optionally mixed with a random replay sample of the old documents to not forget them
+"""
+import datetime
+from typing import Callable
+from bson import ObjectId
+from pymongo.collection import Collection
+from pymongo.database import Database
+from dlpipe.data_reader.interleaved_reader import InterleavedReader
+from dlpipe.utils import DLPipeLogger
+
+
+def get_watermark(mongo_db: Database, exp_id) -> datetime.datetime:
+    """
+    Time (UTC) up to which the data is already known to an experiment. Fine tuned experiments save it in their
+    config, for all other experiments it is the creation time of the experiment, which is when its data was loaded.
+    :param mongo_db: pymongo database the experiments are saved in
+    :param exp_id: id of the experiment
+    :return: naive UTC datetime
+    """
+    exp_obj = mongo_db["experiment"].find_one({"_id": ObjectId(exp_id)}, {"config": 1})
+    if exp_obj is None:
+        raise ValueError("Experiment {0} does not exist".format(exp_id))
+    config = exp_obj.get("config") or {}
+    if config.get("watermark") is not None:
+        return config["watermark"]
+    return exp_obj["_id"].generation_time.replace(tzinfo=None)
+
+
+def new_data_query(watermark: datetime.datetime, watermark_field: str = None) -> dict:
+    """
+    :param watermark: naive UTC datetime
+    :param watermark_field: name of a field holding the ingestion time of each document, if None the creation time
+                            of the document's ObjectId is used
+    :return: filter for all documents inserted after the watermark
+    """
+    if watermark_field is None:
+        return {"_id": {"$gt": ObjectId.from_datetime(watermark)}}
+    return {watermark_field: {"$gt": watermark}}
+
+
+def old_data_query(watermark: datetime.datetime, watermark_field: str = None) -> dict:
+    """
+    :return: filter for all documents inserted up to the watermark (see new_data_query())
+    """
+    if watermark_field is None:
+        return {"_id": {"$lte": ObjectId.from_datetime(watermark)}}
+    return {watermark_field: {"$lte": watermark}}
+
+
+def sample_replay_ids(collection: Collection, query: dict, size: int) -> list:
+    """
+    :return: _ids of a random sample of the documents matching the query (sampled by the database)
+    """
+    pipeline = [
+        {"$match": query},
+        {"$sample": {"size": size}},
+        {"$project": {"_id": 1}}
+    ]
+    return [doc["_id"] for doc in collection.aggregate(pipeline)]
+
+
+def create_incremental_reader(reader_fn: Callable,
+                              collection: Collection,
+                              watermark: datetime.datetime,
+                              replay_size: int = 0,
+                              replay_weight: float = 0.2,
+                              watermark_field: str = None) -> (any, dict):
+    """
+    Create the data reader for fine tuning. The epoch is defined by the new documents, which are also used for
+    validation. The replay documents are only used for training.
+    :param reader_fn: function taking query and doc_ids as keyword arguments and returning a MongoDBReader
+    :param collection: pymongo collection of the data
+    :param watermark: only documents inserted after this time (naive UTC) are new (see get_watermark())
+    :param replay_size: number of old documents sampled for replay, 0 for no replay
+    :param replay_weight: fraction of the training batches taken from the replay documents
+    :param watermark_field: field with the ingestion time of each document, None to use the ObjectId time
+    :return: data reader, dict with the new watermark and the number of new and replayed documents
+    """
+    # everything inserted from now on is new for the next fine tuning
+    new_watermark = datetime.datetime.utcnow()
+    reader = reader_fn(query=new_data_query(watermark, watermark_field), doc_ids=None)
+    if len(reader.doc_ids["train"]) == 0:
+        raise ValueError("No new training documents since {0}".format(watermark))
+
+    replay_ids = []
+    if replay_size > 0:
+        replay_ids = sample_replay_ids(collection, old_data_query(watermark, watermark_field), replay_size)
+    if len(replay_ids) > 0:
+        replay_reader = reader_fn(query=None, doc_ids={"train": replay_ids})
+        reader = InterleavedReader([reader, replay_reader], [1.0 - replay_weight, replay_weight])
+
+    info = {
+        "watermark": new_watermark,
+        "parent_watermark": watermark,
+        "nb_new_docs": (reader.readers[0] if len(replay_ids) > 0 else reader).nb_docs,
+        "nb_replay_docs": len(replay_ids)
+    }
+    DLPipeLogger.logger.info("Fine tuning on {0} new documents (since {1}) and {2} replayed documents".format(
+        info["nb_new_docs"], watermark, info["nb_replay_docs"]))
+    return reader, info
@@ -0,0 +1,112 @@
+"""
+Registry of loaded checkpoint models. Models are loaded from GridFS in memory and kept in a LRU cache, scoring
+the same checkpoint again does not fetch or deserialize the model.
+"""
+import threading
+from collections import OrderedDict
+from pymongo.database import Database
+from dlpipe.checkpoint import get_checkpoint, read_checkpoint_bytes, load_model_from_bytes
+from dlpipe.utils import DLPipeLogger
+
+
+class ModelRegistry:
+    """
+    LRU cache of keras models keyed by (exp_id, weights index) with a memory budget for the model weights e.g.:
+
+    >> registry = ModelRegistry(model_db, custom_objects=get_custom_objects(), max_bytes=512 * 1024 * 1024)
+    >> model = registry.get(exp_id)  # best or latest weights
+    >> model = registry.get(exp_id, 3)
+
+    The registry is thread safe, models are loaded for predictions only (not compiled) by default.
+    """
+    def __init__(self, mongo_db: Database, custom_objects: dict = None, max_bytes: int = 1024 * 1024 * 1024,
+                 compile: bool = False):
+        """
+        :param mongo_db: pymongo database the experiments are saved in
+        :param custom_objects: custom metrics or layers of the models, unknown metrics are resolved automatically
+        :param max_bytes: budget for the weights of all cached models, least recently used models are evicted
+        :param compile: compile the loaded models (e.g. to continue training or evaluate())
+        """
+        self._db = mongo_db
+        self._custom_objects = custom_objects
+        self._compile = compile
+        self.max_bytes = max_bytes
+        self._models = OrderedDict()  # (exp_id, index) -> (model, nb_bytes)
+        self._nb_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(exp_id, index: int) -> tuple:
+        return str(exp_id), index
+
+    def _lookup(self, key: tuple):
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is None:
+                return None
+            self._models.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get(self, exp_id, index: int = None):
+        """
+        :param exp_id: id of the experiment
+        :param index: index of the weights, if None the best or latest weights (see get_checkpoint())
+        :return: keras model
+        """
+        if index is not None and index >= 0:
+            model = self._lookup(self._key(exp_id, index))
+            if model is not None:
+                return model
+        # the best or latest weights can change while an experiment is trained, they are resolved each time
+        checkpoint = get_checkpoint(self._db, exp_id, index)
+        key = self._key(exp_id, checkpoint["index"])
+        model = self._lookup(key)
+        if model is not None:
+            return model
+
+        model = load_model_from_bytes(read_checkpoint_bytes(self._db, checkpoint), self._custom_objects,
+                                      self._compile)
+        nb_bytes = int(sum(w.nbytes for w in model.get_weights()))
+        with self._lock:
+            self.misses += 1
+            if key not in self._models:
+                self._models[key] = (model, nb_bytes)
+                self._nb_bytes += nb_bytes
+            self._evict()
+        DLPipeLogger.logger.info("Loaded model {0} ({1:.1f}MB weights)".format(key, nb_bytes / 1024 / 1024))
+        return model
+
+    def _evict(self):
+        # the most recent model is kept even if it exceeds the budget on its own
+        while self._nb_bytes > self.max_bytes and len(self._models) > 1:
+            _, (_, nb_bytes) = self._models.popitem(last=False)
+            self._nb_bytes -= nb_bytes
+            self.evictions += 1
+
+    def remove(self, exp_id, index: int):
+        with self._lock:
+            entry = self._models.pop(self._key(exp_id, index), None)
+            if entry is not None:
+                self._nb_bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._nb_bytes = 0
+
+    def stats(self) -> dict:
+        """
+        :return: dict with the number of cached models, their weight bytes, hits, misses and evictions
+        """
+        with self._lock:
+            return {
+                "nb_models": len(self._models),
+                "nb_bytes": self._nb_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
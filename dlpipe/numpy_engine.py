@@ -0,0 +1,109 @@
+"""
+Forward pass of exported dense models (see dlpipe.export) with NumPy only. Neither TensorFlow nor Keras is imported,
+scoring processes start in milliseconds.
+"""
+import json
+import numpy as np
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+def _elu(x):
+    return np.where(x > 0, x, np.expm1(np.minimum(x, 0)))
+
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "sigmoid": lambda x: 1.0 / (1.0 + np.exp(-x)),
+    "tanh": np.tanh,
+    "elu": _elu,
+    "softmax": _softmax
+}
+
+
+class NumpyModel:
+    """
+    Sequence of dense layers and activations loaded from an exported .npz file e.g.:
+
+    >> model = NumpyModel.load("accident_model.npz")
+    >> predictions = model.predict(x)
+
+    Quantized weights (float16, int8) are converted back to float32 once when loading, the forward pass is float32.
+    """
+    def __init__(self, layers: list, meta: dict = None):
+        """
+        :param layers: list of ("dense", kernel, bias) and ("activation", name) tuples
+        :param meta: info about the exported model (e.g. exp_id, weights index, quantization)
+        """
+        for layer in layers:
+            if layer[0] == "activation" and layer[1] not in ACTIVATIONS:
+                raise ValueError("Activation {0} is not supported".format(layer[1]))
+        self.layers = layers
+        self.meta = meta or {}
+
+    @classmethod
+    def from_arrays(cls, spec: dict, arrays) -> "NumpyModel":
+        """
+        :param spec: dict with the list of layers and meta info (see dlpipe.export)
+        :param arrays: mapping of the kernel, scale and bias arrays
+        """
+        layers = []
+        for i, layer in enumerate(spec["layers"]):
+            if layer["type"] == "activation":
+                layers.append(("activation", layer["activation"]))
+                continue
+            kernel = arrays["kernel_{0}".format(i)]
+            if "kernel_scale_{0}".format(i) in arrays:
+                # int8 with one scale per output unit
+                kernel = kernel.astype(np.float32) * arrays["kernel_scale_{0}".format(i)]
+            bias = arrays["bias_{0}".format(i)] if "bias_{0}".format(i) in arrays else None
+            layers.append(("dense", kernel.astype(np.float32), None if bias is None else bias.astype(np.float32)))
+        return cls(layers, spec.get("meta"))
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyModel":
+        with np.load(path, allow_pickle=False) as data:
+            return cls.from_arrays(json.loads(str(data["spec"])), data)
+
+    def same_structure(self, other: "NumpyModel") -> bool:
+        """ True if both models have the same layer types, activations and weight shapes """
+        if len(self.layers) != len(other.layers):
+            return False
+        for a, b in zip(self.layers, other.layers):
+            if a[0] != b[0]:
+                return False
+            if a[0] == "activation" and a[1] != b[1]:
+                return False
+            if a[0] == "dense" and (a[1].shape != b[1].shape or (a[2] is None) != (b[2] is None)):
+                return False
+        return True
+
+    @property
+    def input_dim(self) -> int:
+        for layer in self.layers:
+            if layer[0] == "dense":
+                return layer[1].shape[0]
+        return None
+
+    def predict(self, x: np.ndarray, batch_size: int = None) -> np.ndarray:
+        """
+        :param x: input data [n, nb_features]
+        :param batch_size: optional number of rows per forward pass to limit the memory of the activations
+        :return: output of the model [n, nb_outputs]
+        """
+        x = np.asarray(x, dtype=np.float32)
+        if batch_size is not None and len(x) > batch_size:
+            return np.concatenate([self.predict(x[i:i + batch_size]) for i in range(0, len(x), batch_size)])
+        for layer in self.layers:
+            if layer[0] == "dense":
+                y = x @ layer[1]
+                if layer[2] is not None:
+                    y += layer[2]
+                x = y
+            else:
+                x = ACTIVATIONS[layer[1]](x)
+        return x
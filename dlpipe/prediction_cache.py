@@ -0,0 +1,111 @@
+"""
+Memo cache for model predictions keyed by a hash of the encoded feature vector. Records that encode to the same
+vector (e.g. duplicates or records only differing in fields that are not used) skip the forward pass.
+"""
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Callable
+import numpy as np
+from dlpipe.utils import DLPipeLogger
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of prediction rows, valid for one model checkpoint (model_key) e.g.:
+
+    >> cache = PredictionCache("5bac50ca32b9011693a63274:12", path="prediction_cache.npz")
+    >> predictions = cache.predict(model.predict, x)
+    >> cache.save()
+
+    A persisted cache is only loaded if it was saved for the same model_key.
+    """
+    def __init__(self, model_key: str, max_entries: int = 100000, path: str = None):
+        """
+        :param model_key: identifies the model (e.g. "<exp_id>:<weights index>"), cached predictions of other
+                          models are invalid
+        :param max_entries: maximum number of cached predictions, the least recently used ones are evicted
+        :param path: optional .npz file the cache is loaded from and saved to
+        """
+        self.model_key = model_key
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = OrderedDict()  # feature hash -> prediction row
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            self._load()
+
+    @staticmethod
+    def hash_rows(x: np.ndarray) -> list:
+        """
+        :return: 16 byte blake2b digest of each row of the float32 feature matrix
+        """
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        return [hashlib.blake2b(row.tobytes(), digest_size=16).digest() for row in x]
+
+    def predict(self, predict_fn: Callable, x: np.ndarray) -> np.ndarray:
+        """
+        :param predict_fn: function taking a feature matrix and returning the predictions, only called for the
+                           rows that are not cached (each distinct row once)
+        :param x: feature matrix [n, nb_features]
+        :return: predictions [n, ...]
+        """
+        if len(x) == 0:
+            return np.asarray(predict_fn(x))
+        keys = self.hash_rows(x)
+        rows = [None] * len(keys)
+        missing = OrderedDict()  # key -> indices of the rows with this key
+        for i, key in enumerate(keys):
+            cached = self._entries.get(key)
+            if cached is None:
+                missing.setdefault(key, []).append(i)
+            else:
+                self._entries.move_to_end(key)
+                rows[i] = cached
+        self.hits += len(keys) - sum(len(indices) for indices in missing.values())
+        self.misses += sum(len(indices) for indices in missing.values())
+
+        if len(missing) > 0:
+            first_indices = [indices[0] for indices in missing.values()]
+            predictions = np.asarray(predict_fn(np.asarray(x)[first_indices]))
+            for (key, indices), prediction in zip(missing.items(), predictions):
+                self._entries[key] = prediction
+                for i in indices:
+                    rows[i] = prediction
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return np.stack(rows)
+
+    def invalidate(self, model_key: str = None):
+        """ drop all cached predictions, e.g. because the model changed """
+        self._entries.clear()
+        if model_key is not None:
+            self.model_key = model_key
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0
+        }
+
+    def save(self):
+        if self.path is None or len(self._entries) == 0:
+            return
+        # raw digest bytes, fixed size byte strings ("S16") would strip trailing zero bytes
+        keys = np.frombuffer(b"".join(self._entries.keys()), dtype=np.uint8).reshape(-1, 16)
+        values = np.stack(list(self._entries.values()))
+        np.savez(self.path, model_key=np.array(self.model_key), keys=keys, values=values)
+
+    def _load(self):
+        with np.load(self.path, allow_pickle=False) as data:
+            if str(data["model_key"]) != self.model_key:
+                DLPipeLogger.logger.info("Prediction cache {0} belongs to another model, it is not used".format(
+                    self.path))
+                return
+            # saved oldest first, the most recent entries are kept if the cache got smaller
+            for key, value in list(zip(data["keys"], data["values"]))[-self.max_entries:]:
+                self._entries[key.tobytes()] = value
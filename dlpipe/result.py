@@ -16,6 +16,20 @@ class Result:
         self.max_epochs: int = None
         self.curr_epoch: int = -1  # -1 represents initialization
         self.curr_batch: int = 0
+        self.timings: list = []  # per epoch timing summaries of the StepProfiler (if persisted)
+        self.memory_profile: list = []  # latest samples of the MemoryProfiler callback, see add_memory_sample()
+        self.nb_memory_samples: int = 0  # number of samples added in total, including the dropped ones
+        self.max_memory_samples: int = 1000
+        self.stop_training: bool = False  # set to True (e.g. by the EarlyStopping callback) to end training
+        self.best_epoch: int = None  # epoch with the best monitored validation metric
+        self.best_value: float = None
+        # training metrics accumulated over the epoch by the model (stateful metrics), the last value of an epoch is
+        # the exact value of the whole epoch
+        self.cumulative_metrics: tuple = ()
+        # weights (and optimizer state) of curr_epoch if the model is already further ahead, e.g. while the epoch_end
+        # callbacks of a background validation run, None if the model holds the weights of curr_epoch
+        self.weights: list = None
+        self.optimizer_weights: list = None
 
     def append_to_metric(self, metric_name: str, value: any, phase: str="training", epoch: int=None, batch: int=None):
         if phase not in self.metrics:
@@ -28,6 +42,13 @@ class Result:
             self.metrics[phase][metric_name] = []
         self.metrics[phase][metric_name].append({"value": float(value), "epoch": epoch, "batch": batch})
 
+    def add_memory_sample(self, entry: dict):
+        """ append a sample to memory_profile, only the latest max_memory_samples samples are kept """
+        self.memory_profile.append(entry)
+        self.nb_memory_samples += 1
+        if len(self.memory_profile) > self.max_memory_samples:
+            del self.memory_profile[:len(self.memory_profile) - self.max_memory_samples]
+
     def update_weights(self, model, curr_epoch: int=None, curr_batch: int=None):
         if curr_epoch is None:
             curr_epoch = self.curr_epoch
@@ -36,3 +57,66 @@ class Result:
         self.model = model
         self.curr_epoch = curr_epoch
         self.curr_batch = curr_batch
+
+    def snapshot(self, with_weights: bool=False) -> "ResultSnapshot":
+        """
+        :param with_weights: copy the current weights (and optimizer state) of the model into the snapshot
+        :return: immutable view of the current state, values appended to the result later on are not visible
+        """
+        return ResultSnapshot(self, with_weights)
+
+
+class ResultSnapshot:
+    """
+    Read only view of a Result at the time of its creation. Metric lists are only appended to, thus the snapshot just
+    remembers their lengths and creates the truncated copies on first access.
+    Note: the model is still a reference to the live model, its weights at the time of the snapshot are only kept
+    if it was created with_weights or the result holds the weights of its epoch (weights and optimizer_weights are
+    None otherwise)
+    """
+    __slots__ = ("_metrics", "_lengths", "_metrics_view", "model", "weights", "optimizer_weights",
+                 "max_batches_per_epoch", "max_epochs", "curr_epoch", "curr_batch", "timings", "memory_profile",
+                 "nb_memory_samples", "stop_training", "best_epoch", "best_value", "cumulative_metrics")
+
+    def __init__(self, result: Result, with_weights: bool=False):
+        set_attr = object.__setattr__
+        set_attr(self, "_metrics", result.metrics)
+        set_attr(self, "_lengths", {phase: {name: len(values) for name, values in metrics.items()}
+                                    for phase, metrics in result.metrics.items()})
+        set_attr(self, "_metrics_view", None)
+        set_attr(self, "model", result.model)
+        weights = result.weights
+        optimizer_weights = result.optimizer_weights
+        if with_weights and weights is None and result.model is not None:
+            weights = result.model.get_weights()
+            optimizer = getattr(result.model, "optimizer", None)
+            if optimizer is not None:
+                optimizer_weights = optimizer.get_weights()
+        set_attr(self, "weights", weights)
+        set_attr(self, "optimizer_weights", optimizer_weights)
+        set_attr(self, "max_batches_per_epoch", result.max_batches_per_epoch)
+        set_attr(self, "max_epochs", result.max_epochs)
+        set_attr(self, "curr_epoch", result.curr_epoch)
+        set_attr(self, "curr_batch", result.curr_batch)
+        set_attr(self, "timings", tuple(result.timings))
+        set_attr(self, "memory_profile", tuple(result.memory_profile))
+        set_attr(self, "nb_memory_samples", result.nb_memory_samples)
+        set_attr(self, "stop_training", result.stop_training)
+        set_attr(self, "best_epoch", result.best_epoch)
+        set_attr(self, "best_value", result.best_value)
+        set_attr(self, "cumulative_metrics", result.cumulative_metrics)
+
+    @property
+    def metrics(self) -> dict:
+        if self._metrics_view is None:
+            view = {}
+            for phase, lengths in self._lengths.items():
+                view[phase] = {name: tuple(self._metrics[phase][name][:length]) for name, length in lengths.items()}
+            object.__setattr__(self, "_metrics_view", view)
+        return self._metrics_view
+
+    def snapshot(self, with_weights: bool=False) -> "ResultSnapshot":
+        return self
+
+    def __setattr__(self, key, value):
+        raise AttributeError("ResultSnapshot is read only")
@@ -1 +1,3 @@
-from .experiment import ExperimentSchema
\ No newline at end of file
+from .experiment import ExperimentSchema
+from .metric_series import MetricSeriesSchema
+from .evaluation import EvaluationSchema
@@ -0,0 +1,47 @@
+"""
+Cache for evaluation reports of model checkpoints. A report is identified by the experiment, the index of the weights
+in the experiment and a hash of the evaluated dataset.
+"""
+import datetime
+from bson import ObjectId
+from pymongo import ASCENDING
+
+
+class EvaluationSchema:
+    def __init__(self, collection):
+        """
+        :param collection: pymongo collection the reports are stored in e.g. db["evaluation"]
+        """
+        self._collection = collection
+        self._collection.create_index([
+            ("exp_id", ASCENDING),
+            ("weights_index", ASCENDING),
+            ("dataset_hash", ASCENDING)
+        ], unique=True)
+
+    def get(self, exp_id, weights_index: int, dataset_hash: str) -> dict:
+        """
+        :return: the cached report or None
+        """
+        doc = self._collection.find_one({
+            "exp_id": ObjectId(exp_id),
+            "weights_index": weights_index,
+            "dataset_hash": dataset_hash
+        })
+        return None if doc is None else doc["report"]
+
+    def put(self, exp_id, weights_index: int, dataset_hash: str, report: dict):
+        self._collection.replace_one({
+            "exp_id": ObjectId(exp_id),
+            "weights_index": weights_index,
+            "dataset_hash": dataset_hash
+        }, {
+            "exp_id": ObjectId(exp_id),
+            "weights_index": weights_index,
+            "dataset_hash": dataset_hash,
+            "created": datetime.datetime.utcnow(),
+            "report": report
+        }, upsert=True)
+
+    def delete(self, exp_id):
+        self._collection.delete_many({"exp_id": ObjectId(exp_id)})
@@ -2,11 +2,37 @@
 Data Container for an Experiment (which also saves it to the mongodb)
 """
 from dlpipe.result import Result
+from dlpipe.schemas.metric_series import MetricSeriesSchema
 from bson import ObjectId
 import gridfs
 import os
 
 
+def _write_snapshot_weights(path: str, model, weights: list, optimizer_weights: list = None):
+    """
+    Overwrite the weights in a model file saved by model.save() with the weights of a ResultSnapshot, the weights are
+    stored per layer in the same order as model.get_weights() returns them
+    """
+    import h5py
+
+    def names(group):
+        return [n.decode("utf-8") if hasattr(n, "decode") else n for n in group.attrs["weight_names"]]
+
+    with h5py.File(path, "r+") as h5_file:
+        group = h5_file["model_weights"]
+        i = 0
+        for layer in model.layers:
+            for weight_name in names(group[layer.name]):
+                group[layer.name][weight_name][...] = weights[i]
+                i += 1
+        if optimizer_weights is not None and "optimizer_weights" in h5_file:
+            optimizer_group = h5_file["optimizer_weights"]
+            weight_names = names(optimizer_group)
+            if len(weight_names) == len(optimizer_weights):
+                for weight_name, value in zip(weight_names, optimizer_weights):
+                    optimizer_group[weight_name][...] = value
+
+
 class ExperimentSchema:
     def __init__(self,
                  collection,
@@ -21,8 +47,23 @@ class ExperimentSchema:
         self.status: int = 0
         self.log_file_path = ""
         self.id = None
+        # lineage and meta info
+        self.parent_id = None  # id of the experiment this one belongs to (e.g. a sweep) or is derived from
+        self.config: dict = None  # hyperparameters or settings the experiment was created with
+        self.summary: dict = None  # aggregated results e.g. of all trials of a sweep
         # mongodb connection
         self._collection = collection
+        self._series = None
+        if collection is not None:
+            self._series = MetricSeriesSchema(collection.database["experiment_metrics"])
+        # number of values per (phase, metric) that are already written to the metric series
+        self._nb_flushed = {}
+        # per epoch summaries of each metric: {phase: {metric: {epoch: [sum, count, last_batch, last_value]}}}
+        self._epoch_sums = {}
+        # epoch of each entry in the "weights" list of the experiment document
+        self._weights_epochs = []
+        # number of entries of Result.timings and Result.memory_profile that are already pushed to the document
+        self._nb_pushed = {"timings": 0, "memory_profile": 0}
 
     def get_dict(self) -> dict:
         """
@@ -33,10 +74,15 @@ class ExperimentSchema:
             "keras_model": self.keras_model,
             "status": self.status,
             "log_file_path": self.log_file_path,
+            "parent_id": None if self.parent_id is None else ObjectId(self.parent_id),
+            "config": self.config,
+            "summary": self.summary,
             "curr_epoch": None,
             "curr_batch": None,
             "max_batches_per_epoch": None,
-            "max_epochs": None
+            "max_epochs": None,
+            "best_epoch": None,
+            "best_weights_index": None
         }
         if self.result is not None:
             return_dict.update({
@@ -45,12 +91,45 @@ class ExperimentSchema:
                 "max_batches_per_epoch": self.result.max_batches_per_epoch,
                 "max_epochs": self.result.max_epochs
             })
+            if self.result.best_epoch is not None:
+                return_dict["best_epoch"] = self.result.best_epoch
+                return_dict["best_weights_index"] = self.get_weights_index(self.result.best_epoch)
         return return_dict
 
+    def get_weights_index(self, epoch: int):
+        """
+        :param epoch: epoch of the weights
+        :return: index of the latest saved weights of that epoch in the "weights" list, None if they were not saved
+        """
+        for i in range(len(self._weights_epochs) - 1, -1, -1):
+            if self._weights_epochs[i] == epoch:
+                return i
+        return None
+
+    def _new_entries(self) -> dict:
+        """
+        :return: {field: list of entries} of Result.timings and Result.memory_profile which were added since the last
+                 call, memory samples that were already dropped from the result are skipped
+        """
+        sources = {
+            "timings": (self.result.timings, len(self.result.timings)),
+            "memory_profile": (self.result.memory_profile, self.result.nb_memory_samples)
+        }
+        new_entries = {}
+        for field, (values, nb_total) in sources.items():
+            nb_new = min(nb_total - self._nb_pushed[field], len(values))
+            if nb_new > 0:
+                new_entries[field] = list(values[len(values) - nb_new:])
+            self._nb_pushed[field] = nb_total
+        return new_entries
+
     def save(self):
         data_dict = self.get_dict()
         data_dict["metrics"] = None
         data_dict["weights"] = []
+        # only appended to by update(), the lists would otherwise be written again completely on every update
+        data_dict["timings"] = []
+        data_dict["memory_profile"] = []
         if self._collection is not None:
             self.id = self._collection.insert_one(data_dict).inserted_id
             self.update_result()
@@ -58,23 +137,72 @@ class ExperimentSchema:
     def update(self, update_result: bool=True, update_weights: bool=True):
         data_dict = self.get_dict()
         if self._collection is not None:
-            self._collection.update_one(
-                {'_id': ObjectId(self.id)},
-                {
-                    '$set': data_dict
-                }
-            )
+            query = {'$set': data_dict}
+            new_entries = self._new_entries() if self.result is not None else {}
+            if len(new_entries) > 0:
+                query['$push'] = {field: {'$each': entries} for field, entries in new_entries.items()}
+                if "memory_profile" in new_entries:
+                    # the document keeps the same number of samples as the result
+                    query['$push']["memory_profile"]['$slice'] = -self.result.max_memory_samples
+            self._collection.update_one({'_id': ObjectId(self.id)}, query)
         if update_result:
             self.update_result(update_weights=update_weights)
 
+    def _flush_metrics(self):
+        """
+        Write all metric values which were added to the result since the last flush to the metric series collection
+        and update the per epoch summaries
+        """
+        for phase, metrics in self.result.metrics.items():
+            for metric_name, values in metrics.items():
+                key = (phase, metric_name)
+                start = self._nb_flushed.get(key, 0)
+                new_values = values[start:]
+                if len(new_values) == 0:
+                    continue
+                self._series.insert(self.id, phase, metric_name, new_values, start_seq=start)
+                self._nb_flushed[key] = start + len(new_values)
+
+                epoch_sums = self._epoch_sums.setdefault(phase, {}).setdefault(metric_name, {})
+                for entry in new_values:
+                    summary = epoch_sums.setdefault(entry["epoch"], [0.0, 0, 0, 0.0])
+                    summary[0] += entry["value"]
+                    summary[1] += 1
+                    summary[2] = entry["batch"]
+                    summary[3] = entry["value"]
+
+    def get_epoch_metrics(self) -> dict:
+        """
+        :return: metrics averaged per epoch in the same format as Result.metrics (one entry per epoch), metrics which
+                 are accumulated by the model (Result.cumulative_metrics) take the last value of the epoch instead
+        """
+        cumulative = self.result.cumulative_metrics if self.result is not None else ()
+        metrics = {}
+        for phase, phase_sums in self._epoch_sums.items():
+            metrics[phase] = {}
+            for metric_name, epoch_sums in phase_sums.items():
+                use_last = phase == "training" and metric_name in cumulative
+                metrics[phase][metric_name] = [
+                    {"value": last_value if use_last else value_sum / count, "epoch": epoch, "batch": batch}
+                    for epoch, (value_sum, count, batch, last_value) in sorted(epoch_sums.items())
+                ]
+        return metrics
+
     def update_result(self, update_weights: bool=True):
         if self.result is not None and self._collection is not None:
+            # the full history of metrics goes into the series collection, the experiment only keeps epoch summaries
+            self._flush_metrics()
             if update_weights:
                 fs = gridfs.GridFS(self._collection.database)
                 tmp_filename = "tmp_model_weights_save.h5"
                 model_gridfs = None
                 if self.result.model is not None:
                     self.result.model.save(tmp_filename)
+                    # a snapshot of an async callback or the result of a background validated epoch holds the weights
+                    # of its epoch, the live model is further ahead
+                    if getattr(self.result, "weights", None) is not None:
+                        _write_snapshot_weights(tmp_filename, self.result.model, self.result.weights,
+                                                self.result.optimizer_weights)
                     with open(tmp_filename, mode='rb') as file:
                         file_bytes = file.read()
                         model_gridfs = fs.put(file_bytes)
@@ -85,16 +213,20 @@ class ExperimentSchema:
                     "epoch": self.result.curr_epoch,
                     "batch": self.result.curr_batch
                 }
+                self._weights_epochs.append(self.result.curr_epoch)
                 query = {
                     '$set': {
-                        'metrics': self.result.metrics,
+                        'metrics': self.get_epoch_metrics(),
                     },
                     '$push': {'weights': weights}
                 }
+                if self.result.best_epoch is not None:
+                    # the weights of the best epoch might just have been pushed, update() set the index before
+                    query['$set']['best_weights_index'] = self.get_weights_index(self.result.best_epoch)
             else:
                 query = {
                     '$set': {
-                        'metrics': self.result.metrics,
+                        'metrics': self.get_epoch_metrics(),
                     }
                 }
 
@@ -0,0 +1,87 @@
+"""
+Time series storage for per batch metrics. Each metric value is one small document in a dedicated collection instead of
+a growing list embedded in the experiment document, so loading an experiment stays constant in size.
+"""
+import math
+from bson import ObjectId
+from pymongo import ASCENDING
+
+
+class MetricSeriesSchema:
+    def __init__(self, collection):
+        """
+        :param collection: pymongo collection the metric values are stored in e.g. db["experiment_metrics"]
+        """
+        self._collection = collection
+        self._collection.create_index([
+            ("exp_id", ASCENDING),
+            ("phase", ASCENDING),
+            ("metric", ASCENDING),
+            ("epoch", ASCENDING),
+            ("batch", ASCENDING)
+        ])
+
+    def insert(self, exp_id, phase: str, metric_name: str, entries: list, start_seq: int=0):
+        """
+        Write a list of metric entries in one bulk insert
+        :param exp_id: id of the experiment the metrics belong to
+        :param phase: one of ["training", "validation", "test"]
+        :param metric_name: name of the metric e.g. "loss"
+        :param entries: list of dicts with keys [value, epoch, batch] as created by Result.append_to_metric()
+        :param start_seq: sequence number of the first entry (= number of entries already stored for this metric)
+        """
+        if len(entries) == 0:
+            return
+        docs = []
+        for i, entry in enumerate(entries):
+            docs.append({
+                "exp_id": ObjectId(exp_id),
+                "phase": phase,
+                "metric": metric_name,
+                "seq": start_seq + i,
+                "epoch": entry["epoch"],
+                "batch": entry["batch"],
+                "value": entry["value"]
+            })
+        self._collection.insert_many(docs, ordered=False)
+
+    def query(self, exp_id, phase: str, metric_name: str, max_points: int=None, epoch_range: tuple=None) -> list:
+        """
+        Get a metric series, optionally downsampled on the server by averaging consecutive values
+        :param exp_id: id of the experiment
+        :param phase: one of ["training", "validation", "test"]
+        :param metric_name: name of the metric e.g. "loss"
+        :param max_points: maximum number of points returned, None returns the full series
+        :param epoch_range: optional (first_epoch, last_epoch) tuple, both inclusive
+        :return: list of dicts with keys [value, epoch, batch] (same format as Result.metrics)
+        """
+        match = {"exp_id": ObjectId(exp_id), "phase": phase, "metric": metric_name}
+        if epoch_range is not None:
+            match["epoch"] = {"$gte": epoch_range[0], "$lte": epoch_range[1]}
+
+        nb_values = self._collection.count_documents(match)
+        bucket_width = 1
+        if max_points is not None and nb_values > max_points:
+            bucket_width = int(math.ceil(nb_values / max_points))
+
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"epoch": 1, "batch": 1}}
+        ]
+        if bucket_width > 1:
+            # sequence numbers are consecutive per metric, dividing them gives the bucket a value belongs to
+            pipeline += [
+                {"$group": {
+                    "_id": {"$floor": {"$divide": ["$seq", bucket_width]}},
+                    "value": {"$avg": "$value"},
+                    "epoch": {"$last": "$epoch"},
+                    "batch": {"$last": "$batch"}
+                }},
+                {"$sort": {"_id": 1}}
+            ]
+        pipeline.append({"$project": {"_id": 0, "value": 1, "epoch": 1, "batch": 1}})
+        return list(self._collection.aggregate(pipeline))
+
+    def delete(self, exp_id):
+        """ remove all stored metric values of an experiment """
+        self._collection.delete_many({"exp_id": ObjectId(exp_id)})
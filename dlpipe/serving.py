@@ -0,0 +1,149 @@
+"""
+Online scoring: concurrent requests are coalesced into micro batches which are predicted with one call of the model
+"""
+import queue
+import threading
+import time
+import numpy as np
+from concurrent.futures import Future
+from typing import Callable
+from dlpipe.utils.profiler import RingBuffer
+
+
+class ServingStats:
+    """ thread safe latency percentiles (over the most recent requests) and throughput counters """
+    def __init__(self, capacity: int = 10000, percentiles: tuple = (50, 99)):
+        self._latencies = RingBuffer(capacity)
+        self._batch_sizes = RingBuffer(capacity)
+        self._percentiles = percentiles
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self.nb_requests = 0
+        self.nb_rows = 0
+        self.nb_batches = 0
+        self.nb_errors = 0
+
+    def add_request(self, nb_rows: int, latency: float):
+        with self._lock:
+            self.nb_requests += 1
+            self.nb_rows += nb_rows
+            self._latencies.append(latency)
+
+    def add_batch(self, nb_rows: int):
+        with self._lock:
+            self.nb_batches += 1
+            self._batch_sizes.append(nb_rows)
+
+    def add_error(self):
+        with self._lock:
+            self.nb_errors += 1
+
+    def summary(self) -> dict:
+        """
+        :return: dict with the counters, latency percentiles in ms (e.g. p50_ms, p99_ms), mean batch size and
+                 requests and rows per second since the start
+        """
+        with self._lock:
+            latencies = self._latencies.last()
+            batch_sizes = self._batch_sizes.last()
+            elapsed = time.perf_counter() - self._start
+            summary = {
+                "requests": self.nb_requests,
+                "rows": self.nb_rows,
+                "batches": self.nb_batches,
+                "errors": self.nb_errors,
+                "mean_batch_size": float(batch_sizes.mean()) if len(batch_sizes) > 0 else 0.0,
+                "requests_per_sec": self.nb_requests / elapsed if elapsed > 0 else 0.0,
+                "rows_per_sec": self.nb_rows / elapsed if elapsed > 0 else 0.0
+            }
+        for p in self._percentiles:
+            value = float(np.percentile(latencies, p)) * 1000 if len(latencies) > 0 else 0.0
+            summary["p{0}_ms".format(p)] = value
+        return summary
+
+
+class MicroBatcher:
+    """
+    Collects the rows of concurrent predict() calls and runs them as one batch on a worker thread. A batch is
+    started once max_batch_size rows are waiting or the first waiting row is max_latency_ms old.
+    """
+    def __init__(self, predict_fn: Callable, max_batch_size: int = 256, max_latency_ms: float = 5.0,
+                 stats: ServingStats = None):
+        """
+        :param predict_fn: function taking a feature matrix [n, nb_features] and returning predictions [n, ...],
+                           it is only called from the worker thread
+        :param max_batch_size: maximum number of rows per batch
+        :param max_latency_ms: maximum time a row waits for other rows before its batch is started
+        :param stats: optional ServingStats the batch sizes are recorded to
+        """
+        self._predict_fn = predict_fn
+        self._max_batch_size = max_batch_size
+        self._max_latency = max_latency_ms / 1000.0
+        self._stats = stats
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="MicroBatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, features: np.ndarray) -> Future:
+        """
+        :param features: feature matrix of one request [n, nb_features]
+        :return: future with the predictions of the rows
+        """
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((np.asarray(features, dtype=np.float32), future))
+        return future
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        return self.submit(features).result()
+
+    def _collect(self) -> list:
+        """ wait for the first request and collect further ones until the batch is full or the latency is up """
+        item = self._queue.get()
+        if item is None:
+            return []
+        items = [item]
+        nb_rows = len(item[0])
+        deadline = time.perf_counter() + self._max_latency
+        while nb_rows < self._max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                # closed, finish the collected requests first
+                self._queue.put(None)
+                break
+            items.append(item)
+            nb_rows += len(item[0])
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            if len(items) == 0:
+                return
+            features = np.concatenate([features for features, _ in items])
+            try:
+                predictions = self._predict_fn(features)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            if self._stats is not None:
+                self._stats.add_batch(len(features))
+            offset = 0
+            for rows, future in items:
+                future.set_result(predictions[offset:offset + len(rows)])
+                offset += len(rows)
+
+    def close(self):
+        """ stop the worker thread after the waiting requests are predicted """
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,230 @@
+"""
+Score a large collection with several worker processes. The collection is split into _id ranges, every worker loads
+the model once and scores its ranges chunk by chunk. The predictions are either merged and returned sorted by a key
+field (e.g. to write a csv file) or written back to the documents with bulk writes.
+"""
+import multiprocessing
+import os
+import time
+import numpy as np
+from typing import Callable, List
+from pymongo import UpdateOne
+from dlpipe.data_reader.mongodb import MongoDBConnect, MongoDBActions
+from dlpipe.evaluation import encode_documents
+from dlpipe.utils import DLPipeLogger
+from dlpipe.utils.tf_config import limit_threads
+
+
+def split_id_ranges(collection, nb_shards: int, query: dict = None) -> List[dict]:
+    """
+    Split the documents into _id ranges with about the same number of documents ($bucketAuto on the _id index)
+    :param collection: pymongo collection
+    :param nb_shards: number of ranges
+    :param query: optional filter for the documents
+    :return: list of queries, one per range (including the filter)
+    """
+    pipeline = [{"$match": query or {}}, {"$bucketAuto": {"groupBy": "$_id", "buckets": nb_shards}}]
+    buckets = list(collection.aggregate(pipeline, allowDiskUse=True))
+    shards = []
+    for i, bucket in enumerate(buckets):
+        # the upper bound is exclusive except for the last bucket
+        upper = "$lte" if i == len(buckets) - 1 else "$lt"
+        id_range = {"_id": {"$gte": bucket["_id"]["min"], upper: bucket["_id"]["max"]}}
+        shards.append({"$and": [query, id_range]} if query else id_range)
+    return shards
+
+
+_worker = {}
+
+
+def _init_worker(model_fn, config_file, intra_op_threads, uses_tensorflow):
+    if intra_op_threads is not None:
+        # read by numpy (BLAS) and TensorFlow when their thread pools start, i.e. when model_fn() imports them
+        os.environ["OMP_NUM_THREADS"] = str(intra_op_threads)
+        os.environ["TF_NUM_INTRAOP_THREADS"] = str(intra_op_threads)
+    if config_file is not None:
+        MongoDBActions.add_config(config_file)
+    _worker["model_fn"] = model_fn
+    _worker["intra_op_threads"] = intra_op_threads
+    _worker["uses_tensorflow"] = uses_tensorflow
+
+
+def _get_model():
+    """
+    The model is loaded on the first shard of a worker and used for all of its shards. It is not loaded in the pool
+    initializer, the pool would replace a worker whose initializer raises over and over again.
+    """
+    if "model" not in _worker:
+        if _worker["uses_tensorflow"] and _worker["intra_op_threads"] is not None:
+            # the TensorFlow session must be configured before the model is created
+            limit_threads(_worker["intra_op_threads"], 1)
+        _worker["model"] = _worker["model_fn"]()
+    return _worker["model"]
+
+
+def _score_shard(shard: int, shard_query: dict, settings: dict) -> dict:
+    start = time.perf_counter()
+    model = _get_model()
+    collection = MongoDBConnect.get_collection(settings["connection"], settings["db_name"], settings["collection"])
+    chunk_size = settings["chunk_size"]
+    key_field = settings["key_field"]
+    output_field = settings["output_field"]
+
+    keys = []
+    predictions = []
+    nb_scored = 0
+    nb_written = 0
+    x = None
+    y = None
+
+    def score(docs):
+        nonlocal x, y, nb_scored, nb_written
+        x, y = encode_documents(docs, settings["processors"], x, y)
+        chunk_predictions = np.asarray(model.predict(x[:len(docs)], batch_size=chunk_size))
+        nb_scored += len(docs)
+        if output_field is None:
+            keys.extend(doc[key_field] for doc in docs)
+            predictions.append(chunk_predictions)
+        else:
+            classes = chunk_predictions.argmax(axis=-1)
+            requests = [UpdateOne({"_id": doc["_id"]}, {"$set": {output_field: {
+                "class": int(c),
+                "distribution": [float(v) for v in p]
+            }}}) for doc, c, p in zip(docs, classes, chunk_predictions)]
+            nb_written += collection.bulk_write(requests, ordered=False).modified_count
+
+    projection = settings["projection"]
+    cursor = collection.find(shard_query, projection).batch_size(chunk_size)
+    docs = []
+    for doc in cursor:
+        docs.append(doc)
+        if len(docs) == chunk_size:
+            score(docs)
+            docs = []
+    if len(docs) > 0:
+        score(docs)
+
+    return {
+        "shard": shard,
+        "keys": keys,
+        "predictions": np.concatenate(predictions) if len(predictions) > 0 else None,
+        "nb_scored": nb_scored,
+        "nb_written": nb_written,
+        "seconds": time.perf_counter() - start
+    }
+
+
+class ShardedScorer:
+    """
+    Score all documents of a collection with nb_workers processes e.g.:
+
+    >> scorer = ShardedScorer(load_model, [PreProcessData()], "./connections.ini", "localhost_mongo_db", "accident",
+    >>                        "test", nb_workers=8)
+    >> row_ids, predictions = scorer.run()
+
+    model_fn() is called once in each worker and returns a model with a predict(x, batch_size) method (keras model,
+    NumpyModel, Ensemble), it must be defined on module level. A NumpyModel keeps the workers free of TensorFlow
+    (set uses_tensorflow=False).
+    With output_field set, the predictions are written to the documents instead of being returned.
+    """
+    def __init__(self,
+                 model_fn: Callable,
+                 processors: List[any],
+                 config_file: str,
+                 connection: str,
+                 db_name: str,
+                 collection: str,
+                 query: dict = None,
+                 key_field: str = "_id",
+                 output_field: str = None,
+                 projection: dict = None,
+                 nb_workers: int = None,
+                 shards_per_worker: int = 4,
+                 chunk_size: int = 2048,
+                 intra_op_threads: int = 1,
+                 uses_tensorflow: bool = True):
+        """
+        :param model_fn: function returning the model, called once per worker process
+        :param processors: list of processors to encode the documents
+        :param config_file: path to the connections .ini file, loaded in each worker process
+        :param connection: name of the MongoDB connection
+        :param db_name: name of the database
+        :param collection: name of the collection that is scored
+        :param query: optional filter for the documents
+        :param key_field: field the merged predictions are sorted by (e.g. "row_id")
+        :param output_field: if set the predictions are written back to this field of each document with bulk writes
+        :param projection: optional projection of the documents, must include all fields the processors need
+        :param nb_workers: number of worker processes, defaults to the number of cores
+        :param shards_per_worker: more shards than workers balance ranges that take longer
+        :param chunk_size: number of documents encoded and predicted at once
+        :param intra_op_threads: threads per worker for the forward pass, None to not limit them
+        :param uses_tensorflow: if the model of model_fn() runs on TensorFlow, its session is then limited to
+                                intra_op_threads (see dlpipe.utils.tf_config.limit_threads())
+        """
+        self._model_fn = model_fn
+        self._processors = processors
+        self._config_file = config_file
+        self._connection = connection
+        self._db_name = db_name
+        self._collection = collection
+        self._query = query
+        self._key_field = key_field
+        self._output_field = output_field
+        self._projection = projection
+        self._nb_workers = multiprocessing.cpu_count() if nb_workers is None else nb_workers
+        self._shards_per_worker = shards_per_worker
+        self._chunk_size = chunk_size
+        self._intra_op_threads = intra_op_threads
+        self._uses_tensorflow = uses_tensorflow
+
+    def run(self) -> (np.ndarray, np.ndarray):
+        """
+        :return: keys and predictions [n, nb_outputs] sorted by the key field, (None, None) if the predictions were
+                 written back to the collection
+        """
+        collection = MongoDBConnect.get_collection(self._connection, self._db_name, self._collection)
+        shard_queries = split_id_ranges(collection, self._nb_workers * self._shards_per_worker, self._query)
+        settings = {
+            "processors": self._processors,
+            "connection": self._connection,
+            "db_name": self._db_name,
+            "collection": self._collection,
+            "key_field": self._key_field,
+            "output_field": self._output_field,
+            "projection": self._projection,
+            "chunk_size": self._chunk_size
+        }
+
+        start = time.perf_counter()
+        DLPipeLogger.logger.info("Score {0} shards of {1} on {2} workers".format(
+            len(shard_queries), self._collection, self._nb_workers))
+        context = multiprocessing.get_context("spawn")
+        pool = context.Pool(self._nb_workers, initializer=_init_worker,
+                            initargs=(self._model_fn, self._config_file, self._intra_op_threads,
+                                      self._uses_tensorflow))
+        try:
+            pending = [pool.apply_async(_score_shard, (i, q, settings)) for i, q in enumerate(shard_queries)]
+            shard_results = [p.get() for p in pending]
+        except Exception:
+            # e.g. model_fn() failed, the remaining shards are not scored
+            pool.terminate()
+            raise
+        finally:
+            pool.close()
+            pool.join()
+
+        nb_docs = sum(r["nb_scored"] for r in shard_results)
+        seconds = time.perf_counter() - start
+        DLPipeLogger.logger.info("Scored {0} documents in {1:.1f}s ({2:.0f} docs/s)".format(
+            nb_docs, seconds, nb_docs / seconds if seconds > 0 else 0.0))
+
+        if self._output_field is not None:
+            DLPipeLogger.logger.info("Updated {0} documents".format(sum(r["nb_written"] for r in shard_results)))
+            return None, None
+        results = [r for r in shard_results if r["predictions"] is not None]
+        if len(results) == 0:
+            return np.asarray([]), np.asarray([])
+        keys = np.asarray([k for r in results for k in r["keys"]])
+        predictions = np.concatenate([r["predictions"] for r in results])
+        order = np.argsort(keys, kind="stable")
+        return keys[order], predictions[order]
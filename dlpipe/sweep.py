@@ -0,0 +1,259 @@
+"""
+Run a hyperparameter sweep in a local process pool. Trials that perform worse than their peers at certain epochs
+(rungs) are stopped early according to the asynchronous successive halving (ASHA) schedule.
+"""
+import multiprocessing
+import numpy as np
+from typing import List, Callable
+from dlpipe.callbacks import Callback, SaveExpMongoDB
+from dlpipe.data_reader.mongodb import MongoDBConnect, MongoDBActions
+from dlpipe.schemas import ExperimentSchema
+from dlpipe.utils import DLPipeLogger
+from dlpipe.utils.tf_config import limit_threads
+
+
+class AshaScheduler:
+    """
+    Asynchronous successive halving: rungs are at min_epochs * eta^k epochs. A trial reaching a rung is stopped
+    if its value is not within the best 1/eta of all values that were recorded at this rung so far.
+    The recorded values are shared between processes with a multiprocessing Manager.
+    """
+    def __init__(self, manager, max_epochs: int, min_epochs: int = 1, eta: int = 3, mode: str = "min"):
+        """
+        :param manager: multiprocessing Manager to share the rung values between the worker processes
+        :param max_epochs: maximum number of epochs of a trial
+        :param min_epochs: epochs of the first rung
+        :param eta: reduction factor, only 1/eta of the trials are continued at each rung
+        :param mode: "min" if lower values are better (e.g. loss), "max" if higher values are better (e.g. acc)
+        """
+        if mode not in ["min", "max"]:
+            raise ValueError("mode must be any of ['min', 'max']")
+        self.mode = mode
+        self.eta = eta
+        self.rungs = []
+        rung = min_epochs
+        while rung < max_epochs:
+            self.rungs.append(rung)
+            rung *= eta
+        self._values = manager.dict()
+        self._lock = manager.Lock()
+
+    def on_result(self, epochs_done: int, value: float) -> bool:
+        """
+        Report the value of a trial after epochs_done epochs
+        :return: False if the trial should be stopped
+        """
+        if epochs_done not in self.rungs:
+            return True
+        with self._lock:
+            recorded = list(self._values.get(epochs_done, []))
+            self._values[epochs_done] = recorded + [value]
+        if len(recorded) == 0:
+            return True
+        # the cutoff is computed without the new value, the first trials at a rung are always continued
+        if self.mode == "min":
+            cutoff = np.percentile(recorded, 100.0 / self.eta)
+            return value <= cutoff
+        cutoff = np.percentile(recorded, 100.0 - 100.0 / self.eta)
+        return value >= cutoff
+
+
+class _AshaCallback(Callback):
+    def __init__(self, scheduler: AshaScheduler, monitor: str, phase: str):
+        self._scheduler = scheduler
+        self._monitor = monitor
+        self._phase = phase
+        self.values = []
+
+    def epoch_end(self, result):
+        values = result.metrics[self._phase].get(self._monitor, [])
+        if len(values) == 0:
+            return
+        value = values[-1]["value"]
+        self.values.append(value)
+        if not self._scheduler.on_result(result.curr_epoch + 1, value):
+            DLPipeLogger.logger.info("ASHA: stopping trial after {0} epochs ({1} {2}: {3:.4f})".format(
+                result.curr_epoch + 1, self._phase, self._monitor, value))
+            result.stop_training = True
+
+
+def _init_worker(config_file: str, intra_op_threads: int, inter_op_threads: int):
+    limit_threads(intra_op_threads, inter_op_threads)
+    MongoDBActions.add_config(config_file)
+
+
+def _run_trial(trial_id: int, config: dict, build_fn: Callable, settings: dict, scheduler: AshaScheduler) -> dict:
+    """ train one configuration inside a worker process """
+    model, data_reader = build_fn(config)
+
+    asha_cb = _AshaCallback(scheduler, settings["monitor"], settings["phase"])
+    model_db = MongoDBConnect.get_db(settings["connection"], settings["db_name"])
+    mongo_db_cb = SaveExpMongoDB(model_db, settings["name"] + "_trial_" + str(trial_id), model.get_config(),
+                                 parent_id=settings["sweep_id"], config=config)
+    from dlpipe.trainer import Trainer
+    trainer = Trainer(model=model, data_reader=data_reader, callbacks=[asha_cb, mongo_db_cb])
+    trainer.train(epochs=settings["max_epochs"])
+
+    best_value = None
+    if len(asha_cb.values) > 0:
+        best_value = float(min(asha_cb.values) if scheduler.mode == "min" else max(asha_cb.values))
+    return {
+        "trial": trial_id,
+        "exp_id": mongo_db_cb.get_exp_id(),
+        "config": config,
+        "best_value": best_value,
+        "epochs": len(asha_cb.values),
+        "stopped_early": trainer.result.stop_training
+    }
+
+
+class SweepRunner:
+    """
+    Train a list of configurations in parallel processes. build_fn(config) must return (compiled model, data reader)
+    and has to be defined on module level to be picklable. Every trial is saved as experiment (SaveExpMongoDB) which
+    is linked by parent_id to one sweep experiment holding the summary of all trials. A failing trial is recorded with
+    its error in the summary, if the sweep itself fails its experiment gets status -1 e.g.:
+
+    >> runner = SweepRunner(build_fn, [{"lr": 0.001}, {"lr": 0.0001}], "./connections.ini", "localhost_mongo_db")
+    >> summary = runner.run()
+
+    """
+    def __init__(self,
+                 build_fn: Callable,
+                 configs: List[dict],
+                 config_file: str,
+                 connection: str,
+                 db_name: str = "models",
+                 name: str = "sweep",
+                 max_epochs: int = 30,
+                 min_epochs: int = 1,
+                 eta: int = 3,
+                 monitor: str = "loss",
+                 phase: str = "validation",
+                 mode: str = "min",
+                 nb_workers: int = 4,
+                 intra_op_threads: int = 1,
+                 inter_op_threads: int = 1):
+        """
+        :param build_fn: function taking a config dict and returning (compiled keras model, data reader)
+        :param configs: list of configurations (dicts) that are passed to build_fn
+        :param config_file: path to the connections .ini file, each worker process creates its own connections
+        :param connection: name of the MongoDB connection in the config file
+        :param db_name: name of the database experiments are saved to
+        :param name: name of the sweep experiment, trials are named <name>_trial_<index>
+        :param max_epochs: maximum number of epochs per trial
+        :param min_epochs: epochs until the first rung of the ASHA schedule
+        :param eta: ASHA reduction factor
+        :param monitor: metric used to compare trials
+        :param phase: phase of the monitored metric
+        :param mode: "min" or "max", if lower or higher values of the monitored metric are better
+        :param nb_workers: number of parallel worker processes
+        :param intra_op_threads: TensorFlow intra op threads per worker
+        :param inter_op_threads: TensorFlow inter op threads per worker
+        """
+        self._build_fn = build_fn
+        self._configs = configs
+        self._config_file = config_file
+        self._connection = connection
+        self._db_name = db_name
+        self._name = name
+        self._max_epochs = max_epochs
+        self._min_epochs = min_epochs
+        self._eta = eta
+        self._monitor = monitor
+        self._phase = phase
+        self._mode = mode
+        self._nb_workers = nb_workers
+        self._intra_op_threads = intra_op_threads
+        self._inter_op_threads = inter_op_threads
+
+    def _run_trials(self, settings: dict) -> List[dict]:
+        """
+        :return: results of all trials in the order of the configs, failed trials have an "error" and no best_value
+        """
+        # spawn fresh processes, forking a process which already initialized TensorFlow or pymongo is not safe
+        context = multiprocessing.get_context("spawn")
+        with context.Manager() as manager:
+            scheduler = AshaScheduler(manager, self._max_epochs, self._min_epochs, self._eta, self._mode)
+            DLPipeLogger.logger.info("Start sweep with {0} trials on {1} workers, rungs at epochs: {2}".format(
+                len(self._configs), self._nb_workers, scheduler.rungs))
+            pool = context.Pool(self._nb_workers, initializer=_init_worker, maxtasksperchild=1,
+                                initargs=(self._config_file, self._intra_op_threads, self._inter_op_threads))
+            try:
+                pending = [pool.apply_async(_run_trial, (i, config, self._build_fn, settings, scheduler))
+                           for i, config in enumerate(self._configs)]
+                trials = []
+                for i, p in enumerate(pending):
+                    try:
+                        trials.append(p.get())
+                    except Exception as err:
+                        # a failing trial does not stop the others
+                        DLPipeLogger.logger.error("Trial {0} failed: {1}".format(i, repr(err)))
+                        trials.append({"trial": i, "exp_id": None, "config": self._configs[i], "best_value": None,
+                                       "epochs": 0, "stopped_early": False, "error": repr(err)})
+            finally:
+                pool.close()
+                pool.join()
+        return trials
+
+    def run(self) -> dict:
+        """
+        Run all trials and wait for them to finish
+        :return: summary dict with the results of all trials and the best experiment id
+        """
+        collection = MongoDBConnect.get_collection(self._connection, self._db_name, "experiment")
+        sweep_exp = ExperimentSchema(collection, self._name, None)
+        sweep_exp.config = {
+            "type": "sweep",
+            "configs": self._configs,
+            "max_epochs": self._max_epochs,
+            "min_epochs": self._min_epochs,
+            "eta": self._eta,
+            "monitor": self._phase + "/" + self._monitor,
+            "mode": self._mode
+        }
+        sweep_exp.status = 100
+        sweep_exp.save()
+
+        settings = {
+            "connection": self._connection,
+            "db_name": self._db_name,
+            "name": self._name,
+            "sweep_id": sweep_exp.id,
+            "max_epochs": self._max_epochs,
+            "monitor": self._monitor,
+            "phase": self._phase
+        }
+
+        try:
+            trials = self._run_trials(settings)
+
+            finished_trials = [t for t in trials if t["best_value"] is not None]
+            best_trial = None
+            if len(finished_trials) > 0:
+                sign = 1 if self._mode == "min" else -1
+                best_trial = min(finished_trials, key=lambda t: sign * t["best_value"])
+
+            sweep_exp.summary = {
+                "trials": [{
+                    "trial": t["trial"],
+                    "exp_id": t["exp_id"],
+                    "best_value": t["best_value"],
+                    "epochs": t["epochs"],
+                    "stopped_early": t["stopped_early"],
+                    "error": t.get("error")
+                } for t in trials],
+                "nb_failed": len([t for t in trials if t.get("error") is not None]),
+                "best_exp_id": None if best_trial is None else best_trial["exp_id"],
+                "best_value": None if best_trial is None else best_trial["best_value"],
+                "best_config": None if best_trial is None else best_trial["config"]
+            }
+            sweep_exp.status = 2
+        finally:
+            if sweep_exp.status != 2:
+                # the sweep itself failed (e.g. the worker pool), not only single trials
+                sweep_exp.status = -1
+            sweep_exp.update(update_result=False)
+        DLPipeLogger.logger.info("Sweep done, best experiment: {0}, {1} failed trials".format(
+            sweep_exp.summary["best_exp_id"], sweep_exp.summary["nb_failed"]))
+        return sweep_exp.summary
@@ -5,27 +5,92 @@ for better generalization
 
 import numpy as np
 import math
-from typing import List
+from typing import List, TYPE_CHECKING
 from dlpipe.data_reader.data_reader_interface import IDataReader
-from keras.models import Model
+from dlpipe.data_reader.interleaved_reader import InterleavedReader
 from dlpipe.result import Result
+from dlpipe.callbacks.dispatcher import CallbackDispatcher
+from dlpipe.background_validation import BackgroundValidator
 from dlpipe.utils import DLPipeLogger
+from dlpipe.utils.profiler import StepProfiler, disabled_profiler
+
+if TYPE_CHECKING:
+    # keras (and with it TensorFlow) is only needed for type hints here, importing it is slow
+    from keras.models import Model
+
+
+def _create_batch_recorder(metrics_names: List[str]):
+    """
+    :param metrics_names: names of the metrics of the model in the order train_on_batch() returns them
+    :return: keras callback collecting the metric results of each batch during fit()
+    """
+    from keras.callbacks import Callback as KerasCallback
+
+    class BatchRecorder(KerasCallback):
+        def __init__(self):
+            super().__init__()
+            self.batch_results = []
+
+        def on_batch_end(self, batch, logs=None):
+            logs = logs or {}
+            self.batch_results.append([logs.get(name, np.nan) for name in metrics_names])
+
+    return BatchRecorder()
 
 
 class Trainer:
-    def __init__(self, model: Model = None, data_reader: IDataReader = None, callbacks: List[any] = None):
+    def __init__(self,
+                 model: "Model" = None,
+                 data_reader: IDataReader = None,
+                 callbacks: List[any] = None,
+                 callback_queue_size: int = 100,
+                 callback_on_full: str = "block",
+                 profiler: StepProfiler = None,
+                 background_validation: bool = False,
+                 reader_weights: List[float] = None,
+                 chunk_size: int = None):
+        """
+        :param model: compiled keras model
+        :param data_reader: data reader providing the training, validation and test data, can also be a list of
+                            readers whose training batches are mixed (see InterleavedReader), the first reader
+                            defines the epochs and provides the validation and test data
+        :param callbacks: list of Callback instances, callbacks with run_async = True run on a background thread
+        :param callback_queue_size: maximum number of pending events per async callback
+        :param callback_on_full: "block" or "drop", behaviour for batch_end events if an async callback queue is full
+        :param profiler: StepProfiler to record the wall time per phase and batch, None disables profiling
+        :param background_validation: validate a copy of each epoch's weights in a background thread while training
+                                      continues, the epoch_end callbacks are called once the validation finished
+        :param reader_weights: in case of multiple data readers, relative frequency of batches from each reader
+        :param chunk_size: if set, this many batches are read at once and trained with one fit() call of the model,
+                           callbacks (batch_end) and printing are then done once per chunk instead of once per batch.
+                           Note that fit() resets stateful metrics, they are then accumulated per chunk only
+        """
         self._callbacks: List[any] = []
         self._print_counter: int = 0  # to make sure the console does not get spamed
         self._max_prints: int = 5
+        # an InterleavedReader created here prefetches on its own threads, they are stopped when training ends
+        self._owned_reader = None
+        if isinstance(data_reader, (list, tuple)):
+            data_reader = InterleavedReader(list(data_reader), reader_weights)
+            self._owned_reader = data_reader
         self.data_reader: IDataReader = data_reader
 
         if callbacks is not None:
             self._callbacks = callbacks
+        self._dispatcher = CallbackDispatcher(self._callbacks, callback_queue_size, callback_on_full)
 
         self.model = model
         self.result = Result()
 
-    def set_model(self, model: Model):
+        self._background_validation = background_validation
+        self._chunk_size = chunk_size
+        self._validator = None
+
+        self.profiler = profiler if profiler is not None else disabled_profiler()
+        if self.profiler.enabled and self.data_reader is not None:
+            self.data_reader.profiler = self.profiler
+
+    def set_model(self, model: "Model"):
         self.model = model
 
     def _create_metrics(self, results):
@@ -69,86 +134,214 @@ class Trainer:
 
             DLPipeLogger.logger.info(display)
 
-    def _validation(self, curr_epoch):
-        val_finished = False
-        val_counter = 0
-        tmp_val_results = []
-        while not val_finished:
-            x, y, val_finished = self.data_reader.get_next(mode="validation")
-            tmp_val_results.append(self._create_metrics(self.model.test_on_batch(x, y)))
-            val_counter += 1
+    @staticmethod
+    def _reset_metric_states(model):
+        """ reset the counts of stateful metrics (e.g. accumulated confusion matrices) of a keras model """
+        for metric in getattr(model, "stateful_metric_functions", []):
+            metric.reset_states()
+
+    def _run_validation(self, model) -> list:
+        """
+        :param model: model that is validated (the trained model or the clone of the BackgroundValidator)
+        :return: list of metric results of the validation data
+        """
+        self._reset_metric_states(model)
+        with self.profiler.phase("validation"):
+            val_finished = False
+            val_counter = 0
+            tmp_val_results = []
+            while not val_finished:
+                x, y, val_finished = self.data_reader.get_next(mode="validation")
+                tmp_val_results.append(self._create_metrics(model.test_on_batch(x, y)))
+                val_counter += 1
 
         # TODO: make averages for multiple results in case val_batch_size is set on the reader (val_counter > 1)
-        final_results = tmp_val_results[0]
+        return tmp_val_results[0]
+
+    def _store_validation(self, curr_epoch, final_results):
         for metric_result in final_results:
-            self.result.append_to_metric(metric_result["name"], metric_result["value"], phase="validation")
+            self.result.append_to_metric(metric_result["name"], metric_result["value"], phase="validation",
+                                         epoch=curr_epoch)
 
         display = "Validation => \tEpoch: {0}\t".format(curr_epoch)
         for metric in final_results:
             display += "{0}: {1:.4f} \t".format(metric["name"], metric["value"])
         DLPipeLogger.logger.info(display+"\n")
 
-    def train(self, epochs: int = 5, sample_weight=None, class_weight=None):
+    def _validation(self, curr_epoch):
+        self._store_validation(curr_epoch, self._run_validation(self.model))
+
+    def _collect_background_validation(self, wait: bool):
+        """
+        Store the results of the background validation and call the epoch_end callbacks for the validated epoch.
+        During these callbacks the result holds the epoch and batch of that epoch and its weights (Result.weights),
+        the model is the trained model which is already further ahead.
+        :param wait: if False only collect if the validation is already done
+        """
+        if not self._validator.pending or (not wait and not self._validator.done()):
+            return
+        epoch, batch, results = self._validator.collect()
+        self._store_validation(epoch, results)
+
+        live_epoch, live_batch = self.result.curr_epoch, self.result.curr_batch
+        self.result.update_weights(self.model, epoch, batch)
+        self.result.weights = self._validator.weights
+        self.result.optimizer_weights = self._validator.optimizer_weights
+        self._dispatcher.dispatch("epoch_end", self.result)
+        self.result.weights = None
+        self.result.optimizer_weights = None
+        self.result.update_weights(self.model, live_epoch, live_batch)
+
+    def _epoch_timing(self, curr_epoch, nb_samples):
+        """ log the timings of the finished epoch and optionally add them to the result """
+        summary = self.profiler.epoch_summary(nb_samples)
+        self.profiler.log_summary(curr_epoch, summary)
+        if self.profiler.persist:
+            summary["epoch"] = curr_epoch
+            self.result.timings.append(summary)
+
+    def _on_batch_trained(self, nb_samples: int, epoch_finished: bool):
+        """
+        Called right after the model was trained on a batch, before results are stored and validation is run
+        (e.g. used to synchronise weights between processes in data parallel training)
+        :param nb_samples: number of samples in the batch
+        :param epoch_finished: True if this was the last batch of the epoch
+        """
+
+    def _read_chunk(self):
+        """
+        Read up to chunk_size batches from the data reader, stops early at the end of an epoch
+        :return: input data of all batches, ground truth of all batches, size of one batch, epoch finished flag
+        """
+        xs = []
+        ys = []
+        epoch_finished = False
+        while len(xs) < self._chunk_size and not epoch_finished:
+            x, y, epoch_finished = self.data_reader.get_next(mode="train")
+            xs.append(np.asarray(x))
+            ys.append(np.asarray(y))
+        return np.concatenate(xs), np.concatenate(ys), len(xs[0]), epoch_finished
+
+    def _train_chunk(self, input_data, ground_truth, batch_size, class_weight=None) -> list:
+        """
+        Train on many batches with a single fit() call, the batches are kept in order (no shuffling)
+        :return: list of the metric results of each batch (same format as train_on_batch() returns)
+        """
+        recorder = _create_batch_recorder(self.model.metrics_names)
+        self.model.fit(input_data, ground_truth, batch_size=batch_size, epochs=1, verbose=0, shuffle=False,
+                       class_weight=class_weight, callbacks=[recorder])
+        return recorder.batch_results
+
+    def train(self, epochs: int = 5, sample_weight=None, class_weight=None, validate: bool = True):
+        """
+        :param epochs: maximum number of epochs
+        :param sample_weight: passed to the train_on_batch() of the model, not supported in chunked mode
+        :param class_weight: passed to the train_on_batch() of the model
+        :param validate: run validation after each epoch
+        """
+        if self._chunk_size is not None and sample_weight is not None:
+            raise ValueError("sample_weight is not supported when training in chunks (chunk_size is set)")
+
         current_epoch = 0
         current_batch = 0
         finished = False
+        profiler = self.profiler
+        epoch_samples = 0
 
         # at epoch -1 the weights are set to initialized weights
         self.result.update_weights(self.model)
-
-        for cb in self._callbacks:
-            cb.training_start(self.result)
-
-        while not finished:
-            epoch_finished = False
-            batches = []
-            x, y, dr_finished = self.data_reader.get_next(mode="train")
-            batches.append({
-                "x": x,
-                "y": y
-            })
-            if dr_finished:
-                epoch_finished = True
-
-            # for now just take the data of the first data_reader
-            input_data = np.asarray(batches[0]["x"])
-            ground_truth = np.asarray(batches[0]["y"])
-
-            # Train the model
-            results = self.model.train_on_batch(input_data, ground_truth,
-                                                sample_weight=sample_weight, class_weight=class_weight)
-
-            # update result instance for the training results
-            self.result.update_weights(self.model, current_epoch, current_batch)
-            for i, metric_result in enumerate(results):
-                self.result.append_to_metric(self.model.metrics_names[i], metric_result, phase="training")
-
-            for cb in self._callbacks:
-                cb.batch_end(self.result)
-
-            self._batch_printer(current_epoch, current_batch, epochs, results)
-
-            if epoch_finished:
-                self._print_counter = 0
-                self._validation(current_epoch)
-
-                self.data_reader.reset_epoch()
-
-                for cb in self._callbacks:
-                    cb.epoch_end(self.result)
-
-                current_batch = 0
-                current_epoch += 1
-            else:
-                current_batch += 1
-
-            if current_epoch >= epochs:
-                finished = True
-
-        for cb in self._callbacks:
-            cb.training_end(self.result)
+        if self._chunk_size is None:
+            self.result.cumulative_metrics = tuple(getattr(self.model, "stateful_metric_names", []))
+        self._reset_metric_states(self.model)
+
+        if validate and self._background_validation and self._validator is None:
+            self._validator = BackgroundValidator(self.model, self._run_validation)
+
+        try:
+            self._dispatcher.dispatch("training_start", self.result)
+            profiler.epoch_start()
+
+            while not finished:
+                if self._chunk_size is None:
+                    with profiler.phase("read"):
+                        x, y, epoch_finished = self.data_reader.get_next(mode="train")
+
+                    input_data = np.asarray(x)
+                    ground_truth = np.asarray(y)
+
+                    # Train the model
+                    with profiler.phase("train"):
+                        batch_results = [self.model.train_on_batch(
+                            input_data, ground_truth, sample_weight=sample_weight, class_weight=class_weight)]
+                else:
+                    with profiler.phase("read"):
+                        input_data, ground_truth, batch_size, epoch_finished = self._read_chunk()
+                    with profiler.phase("train"):
+                        batch_results = self._train_chunk(input_data, ground_truth, batch_size, class_weight)
+
+                epoch_samples += len(input_data)
+                self._on_batch_trained(len(input_data), epoch_finished)
+
+                # update result instance for the training results
+                for chunk_index, results in enumerate(batch_results):
+                    for i, metric_result in enumerate(results):
+                        self.result.append_to_metric(self.model.metrics_names[i], metric_result, phase="training",
+                                                     epoch=current_epoch, batch=current_batch + chunk_index)
+                # in chunked mode, the current batch is the last batch of the chunk
+                current_batch += len(batch_results) - 1
+                self.result.update_weights(self.model, current_epoch, current_batch)
+
+                with profiler.phase("callbacks"):
+                    self._dispatcher.dispatch("batch_end", self.result)
+
+                self._batch_printer(current_epoch, current_batch, epochs, batch_results[-1])
+
+                if self._validator is not None:
+                    self._collect_background_validation(wait=epoch_finished)
+
+                if epoch_finished:
+                    self._print_counter = 0
+                    if validate and self._validator is None:
+                        self._validation(current_epoch)
+
+                    self.data_reader.reset_epoch()
+
+                    if profiler.enabled:
+                        self._epoch_timing(current_epoch, epoch_samples)
+                    epoch_samples = 0
+
+                    if self._validator is not None:
+                        self._validator.submit(current_epoch, current_batch, self.model.get_weights(),
+                                               self.model.optimizer.get_weights())
+                    else:
+                        self._dispatcher.dispatch("epoch_end", self.result)
+                    self._reset_metric_states(self.model)
+                    profiler.epoch_start()
+
+                    current_batch = 0
+                    current_epoch += 1
+                else:
+                    current_batch += 1
+
+                if current_epoch >= epochs or self.result.stop_training:
+                    finished = True
+
+            if self._validator is not None:
+                self._collect_background_validation(wait=True)
+
+            self._dispatcher.dispatch("training_end", self.result)
+        finally:
+            # also if training failed, the background threads are stopped and pending callback events are processed
+            if self._validator is not None:
+                self._validator.close()
+                self._validator = None
+            if self._owned_reader is not None:
+                self._owned_reader.close()
+            # stop the threads of async callbacks, they are started again if test() dispatches events
+            self._dispatcher.close()
 
     def test(self):
+        self._reset_metric_states(self.model)
         test_finished = False
         val_counter = 0
         tmp_val_results = []
@@ -167,7 +360,7 @@ class Trainer:
             display += "{0}: {1:.4f} \t".format(metric["name"], metric["value"])
         DLPipeLogger.logger.info(display)
 
-        for cb in self._callbacks:
-            cb.test_end(self.result)
+        self._dispatcher.dispatch("test_end", self.result)
+        self._dispatcher.close()
 
         return final_results
@@ -1 +1,2 @@
 from .logger import DLPipeLogger
+from .profiler import StepProfiler
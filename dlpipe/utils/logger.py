@@ -3,27 +3,36 @@ import io
 import os
 
 
-class DLPipeLogger:
+class _LazyLoggerMeta(type):
+    @property
+    def logger(cls) -> logging.Logger:
+        """ the logger is set up on first use, importing dlpipe creates no handlers or files """
+        if cls._logger is None:
+            cls.setup_logger()
+        return cls._logger
+
+
+class DLPipeLogger(metaclass=_LazyLoggerMeta):
 
     _logger_level = logging.DEBUG
     _logger_name = 'DLPipe.logger'
     _formatter = logging.Formatter('[%(asctime)s] %(levelname)-10s %(message)s')
     _log_contents = io.StringIO()
     _current_log_file_path = "dlpipe.log"
-    logger = None
+    _logger = None
     string_handler = None
     file_handler = None
     console_handler = None
 
     @staticmethod
     def setup_logger():
-        if DLPipeLogger.logger is not None:
+        if DLPipeLogger._logger is not None:
             print("WARNING: logger was setup already, deleting all previously existing handlers")
-            for hdlr in DLPipeLogger.logger.handlers[:]:  # remove all old handlers
-                DLPipeLogger.logger.removeHandler(hdlr)
+            for hdlr in DLPipeLogger._logger.handlers[:]:  # remove all old handlers
+                DLPipeLogger._logger.removeHandler(hdlr)
 
         # Create the logger
-        DLPipeLogger.logger = logging.getLogger(DLPipeLogger._logger_name)
+        DLPipeLogger._logger = logging.getLogger(DLPipeLogger._logger_name)
         DLPipeLogger.logger.setLevel(DLPipeLogger._logger_level)
 
         # Setup the StringIO handler
@@ -35,8 +44,8 @@ class DLPipeLogger:
         DLPipeLogger.console_handler = logging.StreamHandler()
         DLPipeLogger.console_handler.setLevel(DLPipeLogger._logger_level)
 
-        # Setup the file handler
-        DLPipeLogger.file_handler = logging.FileHandler(DLPipeLogger._current_log_file_path, 'a')
+        # Setup the file handler, the file is only created once the first record is written
+        DLPipeLogger.file_handler = logging.FileHandler(DLPipeLogger._current_log_file_path, 'a', delay=True)
         DLPipeLogger.file_handler.setLevel(DLPipeLogger._logger_level)
 
         # Optionally add a formatter
@@ -54,7 +63,7 @@ class DLPipeLogger:
         DLPipeLogger._current_log_file_path = path
         DLPipeLogger.logger.removeHandler(DLPipeLogger.file_handler)
 
-        DLPipeLogger.file_handler = logging.FileHandler(DLPipeLogger._current_log_file_path, mode)
+        DLPipeLogger.file_handler = logging.FileHandler(DLPipeLogger._current_log_file_path, mode, delay=True)
         DLPipeLogger.file_handler.setLevel(DLPipeLogger._logger_level)
         DLPipeLogger.logger.addHandler(DLPipeLogger.file_handler)
 
@@ -76,6 +85,3 @@ class DLPipeLogger:
     def set_level(lvl):
         DLPipeLogger._logger_level = lvl
         DLPipeLogger.setup_logger()
-
-
-DLPipeLogger.setup_logger()
@@ -0,0 +1,35 @@
+"""
+Helper to read the memory usage of the current process
+"""
+import os
+import resource
+import sys
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def get_rss_bytes() -> int:
+    """
+    :return: current resident set size of this process in bytes, falls back to the peak RSS if the current value
+             can not be read (no psutil and no /proc filesystem)
+    """
+    if psutil is not None:
+        return psutil.Process(os.getpid()).memory_info().rss
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    return get_peak_rss_bytes()
+
+
+def get_peak_rss_bytes() -> int:
+    """
+    :return: peak resident set size of this process in bytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
@@ -0,0 +1,28 @@
+"""
+Helper for stateful keras metrics (metric layers), keras is not imported
+"""
+
+
+def link_metrics(metrics: list):
+    """
+    Metric layers created one by one (e.g. from their configs when a model is loaded) lose what they shared when
+    they were created together, e.g. one tensor computed once per batch. Their class can implement link(metrics) to
+    share it again, it is called once per class with all its instances.
+    """
+    by_class = {}
+    for metric in metrics:
+        by_class.setdefault(type(metric), []).append(metric)
+    for metric_class, instances in by_class.items():
+        if hasattr(metric_class, "link"):
+            metric_class.link(instances)
+
+
+def copy_metrics(metrics: list) -> list:
+    """
+    :param metrics: metrics of a compiled model (model.metrics)
+    :return: new instances of the stateful metrics (with their own counts, linked as the originals), the other
+             metrics unchanged
+    """
+    copies = [m.__class__.from_config(m.get_config()) if getattr(m, "stateful", False) else m for m in metrics]
+    link_metrics([m for m in copies if getattr(m, "stateful", False)])
+    return copies
@@ -0,0 +1,165 @@
+"""
+Low overhead wall time profiler for the different phases of a training step (data fetching, processing, training, ...)
+"""
+import threading
+import time
+import numpy as np
+from dlpipe.utils.logger import DLPipeLogger
+
+
+class RingBuffer:
+    """ Fixed size float buffer which overwrites the oldest values once it is full """
+    def __init__(self, capacity: int = 4096):
+        self._data = np.zeros(capacity, dtype=np.float64)
+        self._capacity = capacity
+        self._index = 0
+        self.count = 0  # total number of values ever appended
+
+    def append(self, value: float):
+        self._data[self._index] = value
+        self._index = (self._index + 1) % self._capacity
+        self.count += 1
+
+    def last(self, n: int = None) -> np.ndarray:
+        """
+        :param n: number of most recent values, None returns all values still in the buffer
+        :return: array with the most recent values (oldest first)
+        """
+        size = min(self.count, self._capacity)
+        n = size if n is None else min(n, size)
+        if n == 0:
+            return np.zeros(0)
+        start = (self._index - n) % self._capacity
+        if start + n <= self._capacity:
+            return self._data[start:start + n].copy()
+        return np.concatenate((self._data[start:], self._data[:self._index]))
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _PhaseTimer:
+    """ one timer per measured block, thus nested or concurrent blocks of the same phase do not share a start time """
+    __slots__ = ("_buffer", "_lock", "_start")
+
+    def __init__(self, buffer: RingBuffer, lock: threading.Lock):
+        self._buffer = buffer
+        self._lock = lock
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        elapsed = time.perf_counter() - self._start
+        with self._lock:
+            self._buffer.append(elapsed)
+        return False
+
+
+class StepProfiler:
+    """
+    Records the wall time per phase and batch in ring buffers, e.g.:
+
+    >> profiler = StepProfiler()
+    >> with profiler.phase("fetch"):
+    >>     data = fetch()
+
+    When disabled, phase() returns a shared no-op context manager, thus the overhead is one method call. Phases can be
+    measured from several threads (e.g. prefetching readers, background validation), the values of all threads are
+    recorded in the same buffer.
+    """
+    def __init__(self, enabled: bool = True, capacity: int = 4096, percentiles: tuple = (50, 90, 99),
+                 persist: bool = False):
+        """
+        :param enabled: if False nothing is recorded
+        :param capacity: number of values kept per phase
+        :param percentiles: percentiles that are reported per epoch
+        :param persist: if True the epoch summaries are appended to Result.timings and thus saved with the experiment
+        """
+        self.enabled = enabled
+        self.persist = persist
+        self._capacity = capacity
+        self._percentiles = percentiles
+        self._buffers = {}
+        self._lock = threading.Lock()
+        self._epoch_counts = {}
+        self._epoch_start_time = time.perf_counter()
+
+    def phase(self, name: str):
+        """
+        :param name: name of the phase e.g. "fetch"
+        :return: context manager measuring the wall time of its block
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        buffer = self._buffers.get(name)
+        if buffer is None:
+            with self._lock:
+                buffer = self._buffers.setdefault(name, RingBuffer(self._capacity))
+        return _PhaseTimer(buffer, self._lock)
+
+    def epoch_start(self):
+        """ mark the start of an epoch, summaries only contain values recorded after this call """
+        with self._lock:
+            self._epoch_counts = {name: buffer.count for name, buffer in self._buffers.items()}
+        self._epoch_start_time = time.perf_counter()
+
+    def epoch_summary(self, nb_samples: int) -> dict:
+        """
+        :param nb_samples: number of trained samples in this epoch
+        :return: dict with samples_per_sec, epoch_time and for each phase the count, mean, total and percentiles in ms.
+                 If a phase has more values than the capacity, the statistics are computed from the latest values
+                 ("sampled" is then less than "count") and total_ms is estimated as mean * count
+        """
+        epoch_time = time.perf_counter() - self._epoch_start_time
+        summary = {
+            "epoch_time": epoch_time,
+            "samples_per_sec": nb_samples / epoch_time if epoch_time > 0 else 0.0,
+            "phases": {}
+        }
+        with self._lock:
+            epoch_values = {}
+            for name, buffer in self._buffers.items():
+                nb_values = buffer.count - self._epoch_counts.get(name, 0)
+                epoch_values[name] = (nb_values, buffer.last(nb_values))
+        for name, (nb_values, values) in epoch_values.items():
+            values = values * 1000.0
+            if len(values) == 0:
+                continue
+            mean = float(np.mean(values))
+            phase_summary = {
+                "count": nb_values,
+                "sampled": len(values),
+                "mean_ms": mean,
+                "total_ms": float(np.sum(values)) if len(values) == nb_values else mean * nb_values
+            }
+            for q, value in zip(self._percentiles, np.percentile(values, self._percentiles)):
+                phase_summary["p" + str(q) + "_ms"] = float(value)
+            summary["phases"][name] = phase_summary
+        return summary
+
+    def log_summary(self, epoch: int, summary: dict):
+        display = "Timing => \tEpoch: {0}\t{1:.1f} samples/sec\t".format(epoch, summary["samples_per_sec"])
+        for name, phase_summary in summary["phases"].items():
+            display += "{0}: ".format(name)
+            display += "/".join(["{0:.2f}".format(phase_summary["p" + str(q) + "_ms"]) for q in self._percentiles])
+            display += "ms \t"
+        DLPipeLogger.logger.info(display)
+
+
+_DISABLED_PROFILER = StepProfiler(enabled=False)
+
+
+def disabled_profiler() -> StepProfiler:
+    """ :return: shared disabled profiler instance, used as default to avoid None checks """
+    return _DISABLED_PROFILER
@@ -0,0 +1,25 @@
+"""
+Helper to configure the TensorFlow backend of keras, tensorflow is only imported when calling the functions
+"""
+import os
+
+
+def limit_threads(intra_op: int, inter_op: int = 1):
+    """
+    Limit the number of threads TensorFlow uses in this process, call this before the model is created
+    :param intra_op: number of threads used within one operation (e.g. a matrix multiplication)
+    :param inter_op: number of operations that are executed in parallel
+    """
+    os.environ["OMP_NUM_THREADS"] = str(intra_op)
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(intra_op)
+    os.environ["TF_NUM_INTEROP_THREADS"] = str(inter_op)
+
+    import tensorflow as tf
+    if hasattr(tf, "ConfigProto"):
+        # TensorFlow 1.x: keras uses the session that is set on the backend
+        from keras import backend as K
+        config = tf.ConfigProto(intra_op_parallelism_threads=intra_op, inter_op_parallelism_threads=inter_op)
+        K.set_session(tf.Session(config=config))
+    else:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op)